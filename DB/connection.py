@@ -3,15 +3,16 @@
 from pymongo import MongoClient
 
 class MongoDBManager:
-    def __init__(self, uri, db_name):
+    def __init__(self, uri, db_name, **client_kwargs):
         self.uri = uri
         self.db_name = db_name
+        self.client_kwargs = client_kwargs  # e.g. serverSelectionTimeoutMS for remote farms
         self.client = None
         self.db = None
 
     def connect(self):
         try:
-            self.client = MongoClient(self.uri)
+            self.client = MongoClient(self.uri, **self.client_kwargs)
             self.db = self.client[self.db_name]
             print(f"✅ Connected to MongoDB at {self.uri}, database: {self.db_name}")
         except Exception as e:
@@ -24,15 +25,20 @@ class MongoDBManager:
             return self.db.list_collection_names()
         return []
 
-    def get_documents(self, collection_name, query=None, limit=None):
+    def get_documents(self, collection_name, query=None, limit=None, projection=None):
         if self.db is not None:
             collection = self.db[collection_name]
-            cursor = collection.find(query or {})
+            cursor = collection.find(query or {}, projection)
             if limit is not None:
                 cursor = cursor.limit(int(limit))  # 💡 only apply if limit is set
             return list(cursor)
         return []
 
+    def count_documents(self, collection_name, query=None):
+        if self.db is not None:
+            return self.db[collection_name].count_documents(query or {})
+        return 0
+
     def get_aggregated_documents(self, collection_name, pipeline):
         return list(self.db[collection_name].aggregate(pipeline))
 
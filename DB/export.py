@@ -0,0 +1,183 @@
+# export.py
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from DB.flow_codec import decode_document
+
+from config_py import EXPORT_BATCH_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = ["csv", "parquet"]
+
+
+def parquet_available():
+    return pa is not None
+
+
+def iter_batches(documents, batch_size=EXPORT_BATCH_SIZE):
+    """Groups an iterable of documents (e.g. a cursor) into lists of ``batch_size``."""
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _to_cell(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, np.ndarray):
+        return json.dumps(value.tolist())
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def batch_to_frame(batch, columns=None):
+    """Flattens one batch of documents; nested arrays/documents are kept as JSON strings."""
+    # Binary-encoded flow curves are exported as plain number lists
+    df = pd.json_normalize([decode_document(doc) for doc in batch])
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(_to_cell)
+    return df
+
+
+def cell_kind(value):
+    """Export type of one flattened cell; None for missing values."""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, (int, np.integer)):
+        return "int"
+    if isinstance(value, (float, np.floating)):
+        return "float"
+    if isinstance(value, (datetime, np.datetime64)):
+        return "date"
+    return "string"
+
+
+def merge_kinds(kinds):
+    """One stable type per column: ints widen to floats, any other mix (or no values at all) is text."""
+    kinds = set(kinds) - {None}
+    if kinds == {"int", "float"}:
+        return "float"
+    return kinds.pop() if len(kinds) == 1 else "string"
+
+
+# Trailing column holding, as a JSON object, the fields of a row that are not in the scanned columns or
+# whose value does not fit the column's type
+EXTRA_COLUMN = "_extra"
+
+# Cell kinds each column type accepts as is
+ACCEPTED_KINDS = {"int": {"int"}, "float": {"int", "float"}, "bool": {"bool"}, "date": {"date"}}
+
+
+def scan_columns(batch):
+    """Columns of a sample batch, in first-seen order, with their stable type."""
+    df = batch_to_frame(batch)
+    return {col: merge_kinds(cell_kind(v) for v in df[col].dropna().unique()) for col in df.columns}
+
+
+def conform_frame(df, columns):
+    """
+    Reindexes a batch to the scanned ``columns``, casts every column to its stable type and moves
+    unknown fields and values of another type to ``EXTRA_COLUMN``, so nothing is dropped.
+    """
+    extras = [{} for _ in range(len(df))]
+    for col in df.columns:
+        if col in columns:
+            continue
+        for row, value in enumerate(df[col]):
+            if cell_kind(value) is not None:
+                extras[row][col] = value
+
+    df = df.reindex(columns=list(columns))
+    for col, kind in columns.items():
+        values = df[col]
+        if kind in ACCEPTED_KINDS:
+            kinds = values.map(cell_kind)
+            misfit = kinds.notna() & ~kinds.isin(ACCEPTED_KINDS[kind])
+            for row in np.flatnonzero(misfit.to_numpy()):
+                extras[row][col] = values.iat[row]
+            values = values.where(~misfit)
+        if kind == "string":
+            df[col] = values.map(lambda v: v if cell_kind(v) in (None, "string") else str(v)).astype(object)
+            df[col] = df[col].where(df[col].notna(), None)
+        elif kind == "int":
+            df[col] = pd.to_numeric(values, errors="coerce").astype("Int64")
+        elif kind == "float":
+            df[col] = pd.to_numeric(values, errors="coerce").astype("float64")
+        elif kind == "bool":
+            df[col] = values.astype("boolean")
+        elif kind == "date":
+            df[col] = pd.to_datetime(values, errors="coerce")
+    df[EXTRA_COLUMN] = [json.dumps(extra, default=str) if extra else None for extra in extras]
+    return df
+
+
+def arrow_schema(columns):
+    types = {"int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "date": pa.timestamp("ns"),
+             "string": pa.string()}
+    return pa.schema([pa.field(col, types[kind]) for col, kind in columns.items()]
+                     + [pa.field(EXTRA_COLUMN, pa.string())])
+
+
+def iter_conformed(documents, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields ``(columns, frame)`` per batch in a single pass: the columns and their types come from the
+    first batch, later batches are conformed to them (see ``conform_frame``).
+    """
+    columns = None
+    for batch in iter_batches(documents, batch_size):
+        if columns is None:
+            columns = scan_columns(batch)
+        yield columns, conform_frame(batch_to_frame(batch), columns)
+
+
+def iter_csv(documents, batch_size=EXPORT_BATCH_SIZE):
+    """Yields CSV text one batch at a time, so an export never holds more than ``batch_size`` documents."""
+    header = True
+    for _, df in iter_conformed(documents, batch_size):
+        yield df.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=[EXTRA_COLUMN]).to_csv(index=False)
+
+
+def write_parquet(documents, path, batch_size=EXPORT_BATCH_SIZE):
+    """Writes documents to a Parquet file one row group per batch. Returns the number of rows written."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    rows = 0
+    writer = None
+    try:
+        for columns, df in iter_conformed(documents, batch_size):
+            if writer is None:
+                schema = arrow_schema(columns)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            rows += len(df)
+        if writer is None:
+            pq.write_table(pa.table({EXTRA_COLUMN: pa.array([], pa.string())}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
@@ -0,0 +1,55 @@
+# flow_codec.py
+import struct
+
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+# Per-sample curves of Milking_Data_Collection documents
+FLOW_FIELDS = ["flow_rate_data", "milk_quantity_data"]
+
+# Header: magic, format version, sample count; payload: little-endian float32 samples
+MAGIC = b"FLOW"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")
+SAMPLE_DTYPE = np.dtype("<f4")
+
+
+def is_encoded(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:len(MAGIC)]) == MAGIC
+
+
+def encode_series(values):
+    """Packs a curve into versioned float32 BSON binary (half the size of an array of doubles)."""
+    samples = np.asarray(values, dtype=SAMPLE_DTYPE)
+    return Binary(HEADER.pack(MAGIC, VERSION, len(samples)) + samples.tobytes(), USER_DEFINED_SUBTYPE)
+
+
+def decode_series(value):
+    """
+    Curve as a float NumPy array, whichever way it is stored.
+
+    Binary values are read zero-copy with ``frombuffer`` (read-only float32 views); legacy BSON arrays
+    become float64 arrays; missing values become an empty array.
+    """
+    if value is None:
+        return np.empty(0)
+    if is_encoded(value):
+        magic, version, count = HEADER.unpack_from(value)
+        if version != VERSION:
+            raise ValueError(f"Unsupported flow codec version {version}")
+        return np.frombuffer(value, dtype=SAMPLE_DTYPE, count=count, offset=HEADER.size)
+    return np.asarray(value, dtype=np.float64)
+
+
+def decode_document(doc, fields=FLOW_FIELDS):
+    """Replaces the stored curves of ``doc`` with arrays, in place; returns ``doc``."""
+    for field in fields:
+        if field in doc:
+            doc[field] = decode_series(doc[field])
+    return doc
+
+
+def encoded_update(doc, fields=FLOW_FIELDS):
+    """``$set`` document re-encoding the legacy array curves of ``doc``; empty when nothing to convert."""
+    return {field: encode_series(doc[field]) for field in fields
+            if isinstance(doc.get(field), list)}
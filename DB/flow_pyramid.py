@@ -0,0 +1,253 @@
+# flow_pyramid.py
+# Precomputed min/max/mean reductions of milking curves, so zoomed-out flow plots never load every sample.
+# Build for a date range from the repository root: python -m DB.flow_pyramid [--days N] [--force]
+import argparse
+import hashlib
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, ReplaceOne
+
+from DB.connection import MongoDBManager
+from DB.export import iter_batches
+from DB.flow_codec import FLOW_FIELDS, HEADER, SAMPLE_DTYPE, decode_series, encode_series, is_encoded
+from config_py import farm_connection_str, COWS_DB, FLOW_PYRAMID_FACTORS, FLOW_PLOT_POINT_BUDGET
+
+MILKING_COLLECTION = "Milking_Data_Collection"
+PYRAMID_COLLECTION = "Milking_Flow_Pyramids"
+META_FIELDS = ["task_id", "cow_id", "teat_id", "start", "end"]
+# Bump when the reductions or the level layout change: pyramids of an older version are rebuilt on load
+PYRAMID_VERSION = 1
+
+
+def source_checksum(doc, fields=FLOW_FIELDS):
+    """Digest of the curves as stored; rewriting or re-encoding a milking document changes it."""
+    digest = hashlib.blake2b(digest_size=16)
+    for field in fields:
+        value = doc.get(field)
+        if is_encoded(value):
+            digest.update(bytes(value))
+        elif value is not None:
+            digest.update(np.asarray(value, dtype=np.float64).tobytes())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+def reduce_level(samples, factor):
+    """Min, max and mean of consecutive ``factor``-sample buckets (the last bucket may be partial)."""
+    samples = np.asarray(samples, dtype=np.float64)
+    n_buckets = -(-len(samples) // factor)
+    padded = np.full(n_buckets * factor, np.nan)
+    padded[:len(samples)] = samples
+    buckets = padded.reshape(n_buckets, factor)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN buckets stay NaN
+        return np.nanmin(buckets, axis=1), np.nanmax(buckets, axis=1), np.nanmean(buckets, axis=1)
+
+
+def pyramid_documents(doc, factors=FLOW_PYRAMID_FACTORS):
+    """One pyramid document per factor for a milking document; level 1 is the source itself."""
+    curves = {field: decode_series(doc.get(field)) for field in FLOW_FIELDS}
+    checksum = source_checksum(doc)
+    pyramids = []
+    for factor in factors:
+        pyramid = {field: doc.get(field) for field in META_FIELDS}
+        pyramid.update({"source_id": doc["_id"], "factor": factor, "version": PYRAMID_VERSION,
+                        "source_checksum": checksum,
+                        "n_samples": {field: len(curve) for field, curve in curves.items()}})
+        for field, curve in curves.items():
+            low, high, mean = reduce_level(curve, factor)
+            pyramid[field] = {"min": encode_series(low), "max": encode_series(high), "mean": encode_series(mean)}
+        pyramids.append(pyramid)
+    return pyramids
+
+
+def ensure_pyramid_indexes(mongo_handler):
+    coll = mongo_handler.db[PYRAMID_COLLECTION]
+    coll.create_index([("source_id", ASCENDING), ("factor", ASCENDING)], unique=True)
+    coll.create_index([("task_id", ASCENDING), ("factor", ASCENDING)])
+
+
+def store_pyramids(mongo_handler, docs, factors=FLOW_PYRAMID_FACTORS):
+    """Upserts the pyramids of ``docs``; rebuilding a document replaces its levels."""
+    updates = [ReplaceOne({"source_id": p["source_id"], "factor": p["factor"]}, p, upsert=True)
+               for doc in docs for p in pyramid_documents(doc, factors)]
+    if updates:
+        mongo_handler.db[PYRAMID_COLLECTION].bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def stale_sources(mongo_handler, docs, factors=FLOW_PYRAMID_FACTORS):
+    """The ``docs`` whose pyramids are missing, of an older version or built from different curves."""
+    stored = {
+        p["source_id"]: (p.get("version"), p.get("source_checksum"))
+        for p in mongo_handler.db[PYRAMID_COLLECTION].find(
+            {"source_id": {"$in": [doc["_id"] for doc in docs]}, "factor": max(factors)},
+            {"source_id": 1, "version": 1, "source_checksum": 1})
+    }
+    return [doc for doc in docs if stored.get(doc["_id"]) != (PYRAMID_VERSION, source_checksum(doc))]
+
+
+def build_pyramids(mongo_handler, query, batch_size=200, factors=FLOW_PYRAMID_FACTORS, force=False):
+    """
+    Batch job: builds the pyramids of every milking document matching ``query``.
+
+    Up-to-date pyramids (same version and source checksum) are kept unless ``force``; re-running the job
+    after a migration or rewrite of the milking documents rebuilds exactly the changed ones.
+    """
+    ensure_pyramid_indexes(mongo_handler)
+    cursor = mongo_handler.db[MILKING_COLLECTION].find(query, batch_size=batch_size)
+    built = checked = 0
+    for batch in iter_batches(cursor, batch_size):
+        stale = batch if force else stale_sources(mongo_handler, batch, factors)
+        store_pyramids(mongo_handler, stale, factors)
+        built += len(stale)
+        checked += len(batch)
+        print(f"🔄 Flow pyramids built for {built} of {checked} milking documents")
+    print(f"✅ Flow pyramids done: {built} rebuilt, {checked - built} up to date")
+    return built
+
+
+def source_markers(mongo_handler, query):
+    """
+    ``{source_id: (end, flow samples)}`` of the milking documents matching ``query``, read without the
+    curves: ``$size`` of array curves, ``$binarySize`` of encoded ones.
+    """
+    curve = f"${FLOW_FIELDS[0]}"
+    pipeline = [
+        {"$match": query},
+        {"$project": {"end": 1, "n_samples": {"$switch": {
+            "branches": [
+                {"case": {"$isArray": curve}, "then": {"$size": curve}},
+                {"case": {"$eq": [{"$type": curve}, "binData"]},
+                 "then": {"$divide": [{"$subtract": [{"$binarySize": curve}, HEADER.size]}, SAMPLE_DTYPE.itemsize]}},
+            ],
+            "default": 0
+        }}}}
+    ]
+    return {doc["_id"]: (doc.get("end"), int(doc["n_samples"]))
+            for doc in mongo_handler.db[MILKING_COLLECTION].aggregate(pipeline)}
+
+
+def choose_factor(visible_samples, budget=FLOW_PLOT_POINT_BUDGET, factors=FLOW_PYRAMID_FACTORS):
+    """Finest level (1 = full resolution) that keeps ``visible_samples`` within ``budget`` points."""
+    for factor in [1] + sorted(factors):
+        if visible_samples / factor <= budget:
+            return factor
+    return max(factors)
+
+
+def sample_range(meta, field, task_start, x_range):
+    """Inclusive index range of one teat curve inside an X window (seconds since the task start)."""
+    n = meta["n_samples"][field]
+    if not x_range or n < 2:
+        return 0, n - 1
+    start = pd.to_datetime(meta["start"])
+    offset = (start - task_start).total_seconds()
+    step = (pd.to_datetime(meta["end"]) - start).total_seconds() / (n - 1)
+    if step <= 0:
+        return 0, n - 1
+    low = int(np.floor((x_range[0] - offset) / step))
+    high = int(np.ceil((x_range[1] - offset) / step))
+    return min(max(low, 0), n - 1), max(min(high, n - 1), 0)
+
+
+def load_flow_levels(mongo_handler, task_id, teats=None, x_range=None, margin_sec=0,
+                     budget=FLOW_PLOT_POINT_BUDGET):
+    """
+    Curves of a task at the resolution matching the X window (seconds since the task start).
+
+    Picks the finest level keeping the visible flow samples of every teat within ``budget`` and returns
+    only the part inside the window (plus ``margin_sec`` on each side for smoothing), as
+    milking-document-shaped dicts for ``UTILS.flow_timeline.build_flow_timeline``.
+    Full resolution is fetched per teat with ``$slice``, so zooming in never loads whole sessions.
+    Pyramids are (re)built on the fly for the task's milking documents that have none (e.g. a teat that
+    arrived later), whose pyramids are of an older ``PYRAMID_VERSION``, or whose sample count or end no
+    longer match the source (a session still being written or re-ingested).
+    Returns ``(level_docs, factor)``.
+    """
+    coll = mongo_handler.db[PYRAMID_COLLECTION]
+    source_query = {"task_id": task_id}
+    if teats:
+        source_query["teat_id"] = {"$in": teats}
+    query = {**source_query, "factor": max(FLOW_PYRAMID_FACTORS)}
+    meta_projection = {field: 1 for field in META_FIELDS + ["source_id", "n_samples", "version"]}
+    metas = {meta["source_id"]: meta for meta in coll.find(query, meta_projection)}
+
+    def is_current(source_id, marker):
+        meta = metas.get(source_id)
+        return (meta is not None and meta.get("version") == PYRAMID_VERSION
+                and meta["n_samples"][FLOW_FIELDS[0]] == marker[1]
+                and meta.get("end") == marker[0])
+
+    stale = [source_id for source_id, marker in source_markers(mongo_handler, source_query).items()
+             if not is_current(source_id, marker)]
+    if stale:
+        store_pyramids(mongo_handler, list(mongo_handler.db[MILKING_COLLECTION].find({"_id": {"$in": stale}})))
+        metas = {meta["source_id"]: meta for meta in coll.find(query, meta_projection)}
+    metas = list(metas.values())
+    if not metas:
+        return [], 1
+
+    task_start = min(pd.to_datetime(meta["start"]) for meta in metas)
+    if x_range:
+        x_range = [x_range[0] - margin_sec, x_range[1] + margin_sec]
+    ranges = {(meta["source_id"], field): sample_range(meta, field, task_start, x_range)
+              for meta in metas for field in FLOW_FIELDS}
+    visible = max(high - low + 1 for (_, field), (low, high) in ranges.items() if field == FLOW_FIELDS[0])
+    factor = choose_factor(visible, budget)
+
+    if factor > 1:
+        query["factor"] = factor
+        pyramids = {p["source_id"]: p for p in coll.find(query)}
+    levels = []
+    for meta in metas:
+        level = {field: meta.get(field) for field in META_FIELDS}
+        level.update({"factor": factor, "n_samples": meta["n_samples"], "first_sample": {}, "bands": {}})
+        if factor == 1:
+            # $slice trims legacy arrays server-side; binary curves come back whole and are viewed zero-copy
+            projection = {field: {"$slice": [low, max(high - low + 1, 1)]}
+                          for (source_id, field), (low, high) in ranges.items() if source_id == meta["source_id"]}
+            source = mongo_handler.db[MILKING_COLLECTION].find_one({"_id": meta["source_id"]}, projection) or {}
+        else:
+            source = pyramids.get(meta["source_id"])
+            if source is None:
+                continue
+
+        for field in FLOW_FIELDS:
+            low, high = ranges[meta["source_id"], field]
+            if factor == 1:
+                value = source.get(field)
+                curve = decode_series(value)
+                level[field] = curve[low:high + 1] if is_encoded(value) else curve
+                level["first_sample"][field] = low
+            else:
+                first, last = low // factor, high // factor + 1
+                stats = source.get(field) or {}
+                level[field] = decode_series(stats.get("mean"))[first:last]
+                level["bands"][field] = (decode_series(stats.get("min"))[first:last],
+                                         decode_series(stats.get("max"))[first:last])
+                level["first_sample"][field] = first * factor
+        levels.append(level)
+    return levels, factor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build min/max/mean flow pyramids for milking documents")
+    parser.add_argument("--days", type=int, default=None, help="Only sessions started in the last N days")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--force", action="store_true", help="Rebuild pyramids that are already up to date")
+    args = parser.parse_args()
+
+    query = {}
+    if args.days:
+        query["start"] = {"$gte": datetime.now() - timedelta(days=args.days)}
+    mongo_handler = MongoDBManager(farm_connection_str, COWS_DB)
+    mongo_handler.connect()
+    build_pyramids(mongo_handler, query, args.batch_size, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# migrate_flow_storage.py
+# Converts flow_rate_data / milk_quantity_data arrays of doubles to the float32 binary codec.
+# Run from the repository root: python -m DB.migrate_flow_storage [--batch-size N] [--limit N] [--dry-run]
+import argparse
+import time
+
+from pymongo import UpdateOne
+
+from DB.connection import MongoDBManager
+from DB.export import iter_batches
+from DB.flow_codec import FLOW_FIELDS, encoded_update
+from DB.flow_pyramid import META_FIELDS, PYRAMID_COLLECTION, store_pyramids
+from config_py import farm_connection_str, COWS_DB
+
+MILKING_COLLECTION = "Milking_Data_Collection"
+
+
+def legacy_documents_query(fields=FLOW_FIELDS):
+    """Documents still holding at least one curve as a BSON array."""
+    return {"$or": [{field: {"$type": "array"}} for field in fields]}
+
+
+def rebuild_pyramids(mongo_handler, docs):
+    """Rebuilds the existing pyramids of ``docs`` from their re-encoded curves."""
+    with_pyramids = set(mongo_handler.db[PYRAMID_COLLECTION].distinct(
+        "source_id", {"source_id": {"$in": [doc["_id"] for doc in docs]}}))
+    store_pyramids(mongo_handler, [{**doc, **encoded_update(doc)} for doc in docs if doc["_id"] in with_pyramids])
+
+
+def migrate_flow_storage(mongo_handler, batch_size=500, limit=None, dry_run=False):
+    """
+    Re-encodes legacy curves in batches of ``batch_size`` documents with one bulk write per batch.
+
+    Safe to interrupt and re-run: converted documents no longer match the legacy query.
+    Converted documents that already have flow pyramids get them rebuilt from the new curves.
+    Returns the number of documents converted (or that would be, with ``dry_run``).
+    """
+    coll = mongo_handler.db[MILKING_COLLECTION]
+    projection = {field: 1 for field in FLOW_FIELDS + META_FIELDS}
+    cursor = coll.find(legacy_documents_query(), projection=projection, batch_size=batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    converted = 0
+    started = time.perf_counter()
+    for batch in iter_batches(cursor, batch_size):
+        updates = [UpdateOne({"_id": doc["_id"]}, {"$set": encoded_update(doc)}) for doc in batch]
+        if not dry_run:
+            coll.bulk_write(updates, ordered=False)
+            rebuild_pyramids(mongo_handler, batch)
+        converted += len(updates)
+        print(f"🔄 {converted} documents {'checked' if dry_run else 'converted'} "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    print(f"✅ Flow storage migration done: {converted} documents")
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert milking curves to float32 binary storage")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    mongo_handler = MongoDBManager(farm_connection_str, COWS_DB)
+    mongo_handler.connect()
+    migrate_flow_storage(mongo_handler, args.batch_size, args.limit, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# milking_anomalies.py
+# Nightly anomaly detection over milking sessions: curve features are extracted by the KPI job
+# (process pool, watermark) and new sessions are scored against per-cow/teat rolling baselines.
+# Run from the repository root: python -m DB.milking_anomalies [--processes N]
+import argparse
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from DB.connection import MongoDBManager
+from DB.milking_kpis import KPI_COLLECTION, get_watermark, set_watermark, update_milking_kpis, pending_query
+from UTILS.flow_features import KPI_FIELDS, ANOMALY_FEATURES
+from config_py import farm_connection_str, COWS_DB
+
+ANOMALY_COLLECTION = "Milking_Anomalies"
+JOB_NAME = "milking_anomalies"
+
+# Baseline: the previous BASELINE_SESSIONS sessions of the same cow and teat
+BASELINE_SESSIONS = 20
+BASELINE_MIN_SESSIONS = 5
+BASELINE_LOOKBACK_DAYS = 30
+# Robust z-score (median / IQR) beyond which a feature is abnormal for that cow
+ANOMALY_Z = 3.5
+
+# reason: (feature, direction, absolute threshold or None); a session is flagged when the feature is
+# beyond ANOMALY_Z baseline deviations in the given direction and, if set, beyond the threshold too
+# (the threshold alone when the cow has no baseline yet)
+ANOMALY_RULES = {
+    "sudden_flow_drop": ("max_drop_ratio", 1, 0.5),
+    "kick_off": ("end_flow_ratio", 1, 0.5),
+    "slow_letdown": ("letdown_sec", 1, None),
+    "low_peak_flow": ("peak_flow", -1, None),
+    "low_yield": ("total_yield", -1, None),
+}
+
+META_FIELDS = ["source_id", "task_id", "cow_id", "teat_id", "start"]
+
+
+def rolling_baselines(history, features, window=BASELINE_SESSIONS, min_sessions=BASELINE_MIN_SESSIONS):
+    """
+    Per cow/teat rolling median and IQR-based spread of each feature over the previous ``window``
+    sessions (the session itself excluded). ``history`` must be sorted by cow, teat and start.
+    """
+    grouped = history.groupby(["cow_id", "teat_id"], sort=False)[features]
+    previous = grouped.shift(1)
+    previous[["cow_id", "teat_id"]] = history[["cow_id", "teat_id"]]
+    rolling = previous.groupby(["cow_id", "teat_id"], sort=False)[features].rolling(window, min_periods=min_sessions)
+    median = rolling.median().reset_index(level=[0, 1], drop=True)
+    spread = ((rolling.quantile(0.75) - rolling.quantile(0.25)) / 1.349).reset_index(level=[0, 1], drop=True)
+    return median.reindex(history.index), spread.reindex(history.index)
+
+
+def plain_value(value):
+    """numpy/pandas scalars as the plain Python values BSON can encode."""
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def score_sessions(history, new_ids):
+    """Flags the sessions of ``history`` whose ``source_id`` is in ``new_ids``; returns anomaly documents."""
+    features = sorted({feature for feature, _, _ in ANOMALY_RULES.values()})
+    history = history.sort_values(["cow_id", "teat_id", "start"]).reset_index(drop=True)
+    history[features] = history[features].apply(pd.to_numeric, errors="coerce")
+    median, spread = rolling_baselines(history, features)
+
+    # Spread floor: 5% of the baseline level, so very regular cows are not flagged for tiny changes
+    floor = np.maximum(median.abs() * 0.05, 1e-9)
+    z = (history[features] - median) / np.maximum(spread.fillna(0), floor)
+
+    is_new = history["source_id"].isin(new_ids).to_numpy()
+    reasons = {}
+    for reason, (feature, direction, threshold) in ANOMALY_RULES.items():
+        hit = (z[feature] * direction > ANOMALY_Z).to_numpy()
+        if threshold is not None:
+            beyond = (history[feature] * direction > threshold * direction).to_numpy()
+            hit = (hit | z[feature].isna().to_numpy()) & beyond
+        reasons[reason] = hit & is_new
+
+    flagged = np.flatnonzero(np.any(list(reasons.values()), axis=0))
+    anomalies = []
+    for i in flagged:
+        row = history.iloc[i]
+        anomaly = {field: plain_value(row[field]) for field in META_FIELDS}
+        anomaly["start"] = pd.Timestamp(row["start"]).to_pydatetime()
+        anomaly["reasons"] = [reason for reason, hit in reasons.items() if hit[i]]
+        anomaly["score"] = float(np.nanmax(np.abs(z.iloc[i].to_numpy(dtype=np.float64)), initial=0))
+        anomaly["features"] = {f: None if pd.isna(row[f]) else float(row[f]) for f in features}
+        anomaly["baseline"] = {f: None if pd.isna(median.at[i, f]) else float(median.at[i, f]) for f in features}
+        anomalies.append(anomaly)
+    return anomalies
+
+
+def ensure_anomaly_indexes(mongo_handler):
+    coll = mongo_handler.db[ANOMALY_COLLECTION]
+    coll.create_index([("source_id", ASCENDING)], unique=True)
+    coll.create_index([("start", DESCENDING)])
+    coll.create_index([("cow_id", ASCENDING), ("start", DESCENDING)])
+
+
+def detect_anomalies(mongo_handler, processes=None, batch_size=500):
+    """
+    Brings the KPI collection up to date (feature extraction across ``processes`` cores), then scores the
+    sessions added since the last run, plus the recent ones whose KPIs may have been recomputed, and upserts
+    flagged ones into ``Milking_Anomalies``. A rescored session that is no longer abnormal loses its flag.
+    """
+    update_milking_kpis(mongo_handler, processes, batch_size)
+    ensure_anomaly_indexes(mongo_handler)
+
+    kpis = mongo_handler.db[KPI_COLLECTION]
+    projection = {field: 1 for field in META_FIELDS + KPI_FIELDS + ANOMALY_FEATURES}
+    projection["_id"] = 0
+    last_id = get_watermark(mongo_handler, JOB_NAME)
+    new = pd.DataFrame(list(kpis.find(pending_query(last_id, "source_id"), projection)))
+    if new.empty:
+        print("✅ No new milking sessions to score")
+        return 0
+
+    # Baseline history: recent sessions of the cows that have new sessions
+    since = pd.to_datetime(new["start"]).min() - timedelta(days=BASELINE_LOOKBACK_DAYS)
+    history = pd.DataFrame(list(kpis.find(
+        {"cow_id": {"$in": new["cow_id"].dropna().unique().tolist()}, "start": {"$gte": since.to_pydatetime()}},
+        projection)))
+    history = pd.concat([history, new]).drop_duplicates(subset="source_id", keep="last")
+
+    anomalies = score_sessions(history, set(new["source_id"]))
+    flagged = {a["source_id"] for a in anomalies}
+    cleared = [plain_value(s) for s in new["source_id"] if s not in flagged]
+    if cleared:
+        mongo_handler.db[ANOMALY_COLLECTION].delete_many({"source_id": {"$in": cleared}})
+    if anomalies:
+        mongo_handler.db[ANOMALY_COLLECTION].bulk_write(
+            [ReplaceOne({"source_id": a["source_id"]}, a, upsert=True) for a in anomalies], ordered=False)
+    newest = plain_value(new["source_id"].max())
+    if last_id is None or newest > last_id:
+        set_watermark(mongo_handler, JOB_NAME, newest)
+    print(f"✅ Anomaly detection: {len(anomalies)} of {len(new)} new or recent sessions flagged")
+    return len(anomalies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag abnormal milking sessions added since the last run")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    mongo_handler = MongoDBManager(farm_connection_str, COWS_DB)
+    mongo_handler.connect()
+    detect_anomalies(mongo_handler, args.processes, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
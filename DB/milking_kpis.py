@@ -0,0 +1,143 @@
+# milking_kpis.py
+# Incremental per-session KPI job: milking documents added since the last run, plus the recent ones
+# (REPROCESS_WINDOW) that may have been completed or inserted out of order since, are processed.
+# Run from the repository root (e.g. nightly): python -m DB.milking_kpis [--processes N] [--batch-size N]
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pymongo import ASCENDING, ReplaceOne
+
+from DB.connection import MongoDBManager
+from DB.export import iter_batches
+from DB.flow_codec import decode_document
+from UTILS.flow_features import session_features, KPI_FIELDS, ANOMALY_FEATURES
+from config_py import farm_connection_str, COWS_DB
+
+MILKING_COLLECTION = "Milking_Data_Collection"
+KPI_COLLECTION = "Milking_KPIs"
+WATERMARK_COLLECTION = "Job_Watermarks"
+META_FIELDS = ["task_id", "cow_id", "teat_id", "start", "end"]
+# Sessions started this recently are recomputed on every run even below the _id watermark: curves completed
+# after a run, or documents inserted late with lower ObjectIds, are picked up within this window
+REPROCESS_WINDOW = timedelta(days=2)
+
+
+def kpi_documents(docs):
+    """KPI documents for a batch of milking documents (runs in the worker processes)."""
+    docs = [decode_document(doc) for doc in docs]
+    features = session_features(docs)
+    kpis = []
+    for doc, row in zip(docs, features.to_dict("records")):
+        kpi = {field: doc.get(field) for field in META_FIELDS}
+        kpi["source_id"] = doc["_id"]
+        # NaN (no samples) is stored as null
+        kpi.update({field: None if pd.isna(row[field]) else float(row[field])
+                    for field in KPI_FIELDS + ANOMALY_FEATURES})
+        kpis.append(kpi)
+    return kpis
+
+
+def get_watermark(mongo_handler, job_name):
+    state = mongo_handler.db[WATERMARK_COLLECTION].find_one({"_id": job_name})
+    return state["last_id"] if state else None
+
+
+def set_watermark(mongo_handler, job_name, last_id):
+    mongo_handler.db[WATERMARK_COLLECTION].update_one(
+        {"_id": job_name}, {"$set": {"last_id": last_id, "updated": time.time()}}, upsert=True)
+
+
+def ensure_kpi_indexes(mongo_handler):
+    coll = mongo_handler.db[KPI_COLLECTION]
+    coll.create_index([("source_id", ASCENDING)], unique=True)
+    coll.create_index([("cow_id", ASCENDING), ("start", ASCENDING)])
+    coll.create_index([("start", ASCENDING)])
+
+
+def ensure_milking_indexes(mongo_handler):
+    # Per-task lookups of the milking tab (recent task table, flow comparison) and flow pyramid loads
+    mongo_handler.db[MILKING_COLLECTION].create_index([("task_id", ASCENDING), ("start", ASCENDING)])
+    # Trailing reprocessing window of the incremental jobs
+    mongo_handler.db[MILKING_COLLECTION].create_index([("start", ASCENDING)])
+
+
+def pending_query(last_id, id_field="_id"):
+    """Documents above the ``last_id`` watermark or started within ``REPROCESS_WINDOW`` (everything without one)."""
+    if last_id is None:
+        return {}
+    return {"$or": [{id_field: {"$gt": last_id}}, {"start": {"$gte": datetime.now() - REPROCESS_WINDOW}}]}
+
+
+def iter_new_documents(mongo_handler, last_id, batch_size, projection=None):
+    """Milking documents pending for a job (``pending_query``), in ``_id`` order, in batches."""
+    cursor = mongo_handler.db[MILKING_COLLECTION].find(pending_query(last_id), projection).sort("_id", ASCENDING)
+    return iter_batches(cursor.batch_size(batch_size), batch_size)
+
+
+def run_incremental(mongo_handler, job_name, compute, store, processes=None, batch_size=500, projection=None):
+    """
+    Streams new milking documents through ``compute`` (a picklable batch function) on a process pool.
+
+    Batches are stored and the watermark advanced strictly in order, so an interrupted run resumes
+    after the last stored batch; reprocessed recent documents below the watermark never move it back.
+    At most two batches per process are in flight.
+    """
+    processes = processes or os.cpu_count() or 1
+    watermark = get_watermark(mongo_handler, job_name)
+    processed = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = []
+
+        def finish_oldest():
+            nonlocal processed, watermark
+            batch_last_id, batch_size_done, future = pending.pop(0)
+            store(mongo_handler, future.result())
+            if watermark is None or batch_last_id > watermark:
+                watermark = batch_last_id
+                set_watermark(mongo_handler, job_name, watermark)
+            processed += batch_size_done
+            print(f"🔄 {job_name}: {processed} sessions ({time.perf_counter() - started:.1f}s)")
+
+        for batch in iter_new_documents(mongo_handler, watermark, batch_size, projection):
+            pending.append((batch[-1]["_id"], len(batch), pool.submit(compute, batch)))
+            if len(pending) >= 2 * processes:
+                finish_oldest()
+        while pending:
+            finish_oldest()
+
+    print(f"✅ {job_name} done: {processed} new or recent sessions")
+    return processed
+
+
+def store_kpis(mongo_handler, kpis):
+    if kpis:
+        mongo_handler.db[KPI_COLLECTION].bulk_write(
+            [ReplaceOne({"source_id": kpi["source_id"]}, kpi, upsert=True) for kpi in kpis], ordered=False)
+
+
+def update_milking_kpis(mongo_handler, processes=None, batch_size=500):
+    ensure_milking_indexes(mongo_handler)
+    ensure_kpi_indexes(mongo_handler)
+    projection = {field: 1 for field in META_FIELDS + ["milk_quantity", "flow_rate_data", "milk_quantity_data"]}
+    return run_incremental(mongo_handler, "milking_kpis", kpi_documents, store_kpis, processes, batch_size,
+                           projection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute KPIs for milking sessions added since the last run")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    mongo_handler = MongoDBManager(farm_connection_str, COWS_DB)
+    mongo_handler.connect()
+    update_milking_kpis(mongo_handler, args.processes, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
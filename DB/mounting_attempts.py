@@ -0,0 +1,91 @@
+# mounting_attempts.py
+# Attempt-level mounting table: Mounting_data is flattened to one row per numbered attempt in Mongo
+# ($objectToArray + $unwind), and the rows are typed into one columnar frame shared by the analyses.
+import pandas as pd
+
+from DB.mounting_pipelines import ATTEMPTS_EXPR
+from DB.pipeline_builder import sample_stage
+from DB.typed_ingest import typed_frame
+
+ATTEMPT_COLUMNS = ["session", "farm", "cow_id", "teat_id", "start", "end", "day", "duration_sec",
+                   "attempt", "status", "error_code"]
+SESSION_COLUMNS = ["session", "farm", "cow_id", "teat_id", "start", "end", "day", "duration_sec"]
+
+
+def attempt_pipeline(query, sample_size=None):
+    """
+    One row per numbered attempt of every matching mounting document (sessions without attempts keep a
+    single row with a null attempt). Error attempts carry their integer code in ``error_code``, the
+    others their status text in ``status``.
+    """
+    first_value = {"$cond": [{"$isArray": "$_attempt.v"}, {"$arrayElemAt": ["$_attempt.v", 0]}, None]}
+    return [
+        {"$match": query},
+        *sample_stage(sample_size),
+        {"$project": {"cow_id": 1, "teat_id": 1, "start": 1, "end": 1, "_attempt": ATTEMPTS_EXPR}},
+        {"$unwind": {"path": "$_attempt", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "_id": 0,
+            "session": {"$toString": "$_id"},
+            "cow_id": 1, "teat_id": 1, "start": 1, "end": 1,
+            "attempt": {"$toLong": "$_attempt.k"},
+            "_first": first_value
+        }},
+        {"$project": {
+            "session": 1, "cow_id": 1, "teat_id": 1, "start": 1, "end": 1, "attempt": 1,
+            "error_code": {"$cond": [{"$in": [{"$type": "$_first"}, ["int", "long"]]}, "$_first", None]},
+            "status": {"$cond": [{"$eq": [{"$type": "$_first"}, "string"]}, "$_first", None]}
+        }}
+    ]
+
+
+def attempt_table(rows):
+    """Columnar attempt frame (``ATTEMPT_COLUMNS``) from ``attempt_pipeline`` rows, typed by DB/typed_ingest.py."""
+    df = pd.DataFrame(rows, columns=[c for c in ATTEMPT_COLUMNS if c not in ("day", "duration_sec")])
+    df["attempt"] = pd.to_numeric(df["attempt"], errors="coerce").astype("Int64")
+    # Codes are categorical labels, not quantities
+    df["error_code"] = pd.to_numeric(df["error_code"], errors="coerce").astype("Int64")
+    df = typed_frame(df, "Mounting_Data_Collection")
+    df["day"] = df["start"].dt.normalize()
+    return df[ATTEMPT_COLUMNS]
+
+
+def session_table(attempts):
+    """One row per mounting session of an attempt table."""
+    return attempts.drop_duplicates("session")[SESSION_COLUMNS].reset_index(drop=True)
+
+
+def error_attempts(attempts):
+    """The attempts that ended with an error code."""
+    return attempts[attempts["error_code"].notna()]
+
+
+# Error heatmap facets: analysis type -> facet field
+ERROR_HEATMAP_FACETS = {
+    "errors_over_time": "teat_id",
+    "errors_over_time_by_cow": "cow_id",
+}
+
+
+def error_heatmap_pipeline(query, facet_field, sample_size=None):
+    """Error attempt counts per (day, error code, ``facet_field``) in one aggregation."""
+    return [
+        {"$match": query},
+        *sample_stage(sample_size),
+        {"$project": {facet_field: 1, "start": 1, "_attempt": ATTEMPTS_EXPR}},
+        {"$unwind": "$_attempt"},
+        {"$project": {
+            facet_field: 1, "start": 1,
+            "code": {"$cond": [{"$isArray": "$_attempt.v"}, {"$arrayElemAt": ["$_attempt.v", 0]}, None]}
+        }},
+        {"$match": {"code": {"$type": ["int", "long"]}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$start"}},
+                "code": "$code",
+                "facet": f"${facet_field}"
+            },
+            "count": {"$sum": 1}
+        }},
+        {"$project": {"day": "$_id.day", "code": "$_id.code", "facet": "$_id.facet", "count": 1, "_id": 0}}
+    ]
@@ -0,0 +1,80 @@
+# mounting_pipelines.py
+# Server-side mounting outcomes: success and retry count are derived from the numbered attempt keys of
+# Mounting_data inside the aggregation, so only grouped results leave Mongo.
+from DB.pipeline_builder import sample_stage
+
+SUCCESS_STATUS = "Mounted_successfully"
+
+# Numbered attempts of Mounting_data as [{k, v}] (documents without a Mounting_data object have none)
+ATTEMPTS_EXPR = {
+    "$filter": {
+        "input": {"$objectToArray": {
+            "$cond": [{"$eq": [{"$type": "$Mounting_data"}, "object"]}, "$Mounting_data", {}]
+        }},
+        "as": "attempt",
+        "cond": {"$regexMatch": {"input": "$$attempt.k", "regex": "^[0-9]+$"}}
+    }
+}
+
+
+def outcome_stages():
+    """
+    Stages adding ``success`` (1 when the highest-numbered attempt starts with ``Mounted_successfully``)
+    and ``retries`` (the highest attempt number, 1 without attempts) to every mounting document.
+    """
+    return [
+        {"$project": {
+            "cow_id": 1, "teat_id": 1, "start": 1,
+            "_attempts": ATTEMPTS_EXPR
+        }},
+        {"$addFields": {
+            "_last_key": {"$max": {"$map": {"input": "$_attempts", "as": "a", "in": {"$toLong": "$$a.k"}}}}
+        }},
+        {"$project": {
+            "cow_id": 1, "teat_id": 1, "start": 1,
+            "retries": {"$ifNull": ["$_last_key", 1]},
+            "success": {"$let": {
+                "vars": {"last": {"$arrayElemAt": [{"$filter": {
+                    "input": "$_attempts", "as": "a",
+                    "cond": {"$eq": [{"$toLong": "$$a.k"}, "$_last_key"]}
+                }}, 0]}},
+                "in": {"$cond": [
+                    {"$and": [
+                        {"$eq": [{"$type": "$$last.v"}, "array"]},
+                        {"$eq": [{"$arrayElemAt": ["$$last.v", 0]}, SUCCESS_STATUS]}
+                    ]}, 1, 0
+                ]}
+            }}
+        }}
+    ]
+
+
+# Grouped outputs per analysis: group key fields and accumulators
+OUTCOME_GROUPS = {
+    "success": (["cow_id", "teat_id"], {
+        "success_rate": {"$avg": "$success"}, "trial_count": {"$sum": 1}}),
+    "success_by_farm": (["teat_id"], {
+        "success_rate": {"$avg": "$success"}, "trial_count": {"$sum": 1}}),
+    "retries": (["cow_id", "teat_id"], {
+        "mounting_retry": {"$sum": "$retries"}, "trial_count": {"$sum": "$success"}}),
+    "success_over_time": (["date", "cow_id", "teat_id"], {
+        "success_rate": {"$avg": "$success"}, "trial_count": {"$sum": 1}}),
+    "retries_over_time": (["date", "cow_id", "teat_id"], {
+        "total_retries": {"$sum": "$retries"}, "total_successes": {"$sum": "$success"}}),
+}
+
+
+def mounting_outcome_pipeline(query, analysis_type, sample_size=None):
+    """Grouped success/retry rows for one of ``OUTCOME_GROUPS``; ``date`` is the start day (YYYY-MM-DD)."""
+    keys, accumulators = OUTCOME_GROUPS[analysis_type]
+    group_id = {key: f"${key}" for key in keys}
+    if "date" in group_id:
+        group_id["date"] = {"$dateToString": {"format": "%Y-%m-%d", "date": "$start"}}
+    return [
+        {"$match": query},
+        *sample_stage(sample_size),
+        *outcome_stages(),
+        {"$group": {"_id": group_id, **accumulators}},
+        {"$project": {**{key: f"$_id.{key}" for key in keys}, **{name: 1 for name in accumulators}, "_id": 0}},
+        {"$sort": {key: 1 for key in keys}}
+    ]
@@ -0,0 +1,102 @@
+# multi_farm.py
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pymongo
+
+from DB.connection import MongoDBManager
+from config_py import FARM_QUERY_TIMEOUT_SEC
+
+
+class MultiFarmManager:
+    """
+    Holds a named set of farm connections and fans queries out to them concurrently.
+
+    Every returned document is tagged with a ``farm`` field. A farm that fails or does not
+    answer within ``timeout_sec`` is reported in the returned ``errors`` dict instead of
+    failing the whole query, so the caller can still render the farms that did answer.
+    """
+
+    def __init__(self, connections, db_name, timeout_sec=FARM_QUERY_TIMEOUT_SEC):
+        self.timeout_sec = timeout_sec
+        # Unreachable farms fail server selection quickly instead of blocking a worker for 30s
+        self.farms = {
+            name: MongoDBManager(uri, db_name, serverSelectionTimeoutMS=int(timeout_sec * 1000))
+            for name, uri in connections.items()
+        }
+        # Extra workers so a hung farm cannot starve queries to the others
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.farms)),
+                                            thread_name_prefix="farm-query")
+
+    def connect(self):
+        for manager in self.farms.values():
+            manager.connect()
+
+    @property
+    def farm_names(self):
+        return list(self.farms)
+
+    @property
+    def primary(self):
+        """Connection of the first configured farm (the single-farm default)."""
+        return next(iter(self.farms.values()))
+
+    def default_farms(self):
+        return self.farm_names[:1]
+
+    def fan_out(self, fn, farms=None):
+        """
+        Runs ``fn(manager)`` for every selected farm in parallel.
+
+        Returns:
+            (dict, dict): results by farm name, and error messages by farm name.
+        """
+        selected = [f for f in (farms or self.default_farms()) if f in self.farms]
+        futures = {}
+        errors = {}
+        for name in selected:
+            manager = self.farms[name]
+            if manager.db is None:
+                errors[name] = "not connected"
+                continue
+            futures[self._executor.submit(self._run_bounded, fn, manager)] = name
+
+        done, not_done = wait(futures, timeout=self.timeout_sec)
+        results = {}
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+        for future in not_done:
+            future.cancel()
+            errors[futures[future]] = f"timed out after {self.timeout_sec}s"
+
+        for name, error in errors.items():
+            print(f"❌ Farm {name} unavailable: {error}")
+        return results, errors
+
+    def _run_bounded(self, fn, manager):
+        # cancel() cannot stop a query that is already running: bound it on the driver and the server
+        # instead (pymongo sends the remaining time as maxTimeMS and uses it as the socket timeout)
+        with pymongo.timeout(self.timeout_sec):
+            return fn(manager)
+
+    def find_documents(self, collection_name, query=None, projection=None, farms=None):
+        results, errors = self.fan_out(
+            lambda manager: list(manager.db[collection_name].find(query or {}, projection)), farms)
+        return self._merge(results), errors
+
+    def aggregate(self, collection_name, pipeline, farms=None):
+        results, errors = self.fan_out(
+            lambda manager: manager.get_aggregated_documents(collection_name, pipeline), farms)
+        return self._merge(results), errors
+
+    def _merge(self, results):
+        # Keep the configured farm order so merged frames are deterministic
+        merged = []
+        for name in self.farm_names:
+            for doc in results.get(name, []):
+                doc["farm"] = name
+                merged.append(doc)
+        return merged
@@ -0,0 +1,205 @@
+# pipeline_builder.py
+import pandas as pd
+
+AGG_OPERATORS = {
+    "SUM": "$sum",
+    "AVG": "$avg",
+    "MAX": "$max",
+    "MIN": "$min",
+}
+
+# Percentile aggregation modes; computed with $percentile (MongoDB 7.0+)
+PERCENTILES = {
+    "P50": 0.5,
+    "P90": 0.9,
+    "P99": 0.99
+}
+
+TIME_GRANULARITIES = ["minute", "hour", "day", "week"]
+
+
+def field_alias(field):
+    # $group/$project output names may not contain dots, nested paths are aliased and renamed back
+    return field.replace(".", "__")
+
+
+def build_match_query(filters, date_field=None, start_date=None, end_date=None):
+    """Builds a $match query from the Farm Data filter list and the optional date range."""
+    query = {}
+    for f in filters or []:
+        field = f['field']
+        val = f['value']
+        typ = f.get('type', 'string')
+        if typ == 'number':
+            try:
+                val = float(val)
+            except ValueError:
+                continue
+        elif typ == 'boolean':
+            val = str(val).lower() == 'true'
+        query[str(field)] = val
+
+    if date_field and start_date and end_date:
+        query[date_field] = {
+            "$gte": pd.to_datetime(start_date),
+            "$lte": pd.to_datetime(end_date)
+        }
+    return query
+
+
+def x_group_expr(x_col, granularity=None):
+    """Group key for the X axis: the raw field, or the field truncated to a time bucket with $dateTrunc."""
+    if not granularity:
+        return f"${x_col}"
+    trunc = {"date": f"${x_col}", "unit": granularity}
+    if granularity == "week":
+        trunc["startOfWeek"] = "monday"
+    return {"$dateTrunc": trunc}
+
+
+def sample_stage(sample_size=None):
+    """A uniform ``$sample`` right after ``$match`` for approximate previews; empty for exact runs."""
+    return [{"$sample": {"size": int(sample_size)}}] if sample_size else []
+
+
+def frequency_pipeline(query, x_col, granularity=None, sample_size=None):
+    """Counts documents per X value (or per time bucket of X)."""
+    return [
+        {"$match": query},
+        *sample_stage(sample_size),
+        {"$group": {
+            "_id": x_group_expr(x_col, granularity),
+            "Frequency": {"$sum": 1}
+        }},
+        {"$project": {
+            field_alias(x_col): "$_id",
+            "Frequency": 1,
+            "_id": 0
+        }},
+        {"$sort": {field_alias(x_col): 1}}
+    ]
+
+
+def accumulator(agg_func, y_col):
+    """$group accumulator for a Y Aggregation option."""
+    if agg_func == "COUNT":
+        # "$count" is not a $group accumulator; count documents where Y is present
+        return {"$sum": {"$cond": [{"$eq": [{"$ifNull": [f"${y_col}", None]}, None]}, 0, 1]}}
+    if agg_func in PERCENTILES:
+        return {"$percentile": {"input": f"${y_col}", "p": [PERCENTILES[agg_func]], "method": "approximate"}}
+    return {AGG_OPERATORS[agg_func]: f"${y_col}"}
+
+
+def aggregate_pipeline(query, x_col, y_col, agg_func, group_column=None, granularity=None, sample_size=None,
+                       with_stats=False):
+    """
+    Aggregates Y per X value (or time bucket) and optional group-by field, flattened to one row per group.
+
+    ``with_stats`` adds ``_n`` (values per group) and ``_sd`` (sample std) for preview confidence intervals.
+    """
+    group_id = {field_alias(x_col): x_group_expr(x_col, granularity)}
+    if group_column:
+        group_id[field_alias(group_column)] = f"${group_column}"
+
+    # Project output to flat format ($percentile returns a one-element array)
+    y_output = {"$arrayElemAt": [f"${field_alias(y_col)}", 0]} if agg_func in PERCENTILES else 1
+    project_fields = {field_alias(y_col): y_output}
+    for key in group_id:
+        project_fields[key] = f"$_id.{key}"
+    project_fields["_id"] = 0
+
+    group_stage = {
+        "_id": group_id,
+        field_alias(y_col): accumulator(agg_func, y_col)
+    }
+    if with_stats:
+        group_stage["_n"] = accumulator("COUNT", y_col)
+        group_stage["_sd"] = {"$stdDevSamp": f"${y_col}"}
+        project_fields.update({"_n": 1, "_sd": 1})
+
+    return [
+        {"$match": query},
+        *sample_stage(sample_size),
+        {"$group": group_stage},
+        {"$project": project_fields},
+        {"$sort": {field_alias(x_col): 1}}
+    ]
+
+
+def unalias_columns(df, fields):
+    return df.rename(columns={field_alias(f): f for f in fields if f})
+
+
+def with_x_range(query, x_col, x_min=None, x_max=None):
+    """Restricts ``query`` to a zoomed X window without clobbering an existing filter on the same field."""
+    bounds = {}
+    if x_min is not None:
+        bounds["$gte"] = x_min
+    if x_max is not None:
+        bounds["$lte"] = x_max
+    if not bounds:
+        return query
+    return {"$and": [query, {x_col: bounds}]} if query else {x_col: bounds}
+
+
+def minmax_bucket_pipeline(query, x_col, y_col, n_buckets):
+    """
+    Server-side min/max decimation: ``$bucketAuto`` splits the filtered points into equal-count X buckets
+    and keeps the lowest and highest Y point of each (``$min``/``$max`` over {y, x} documents compare by Y first).
+    """
+    point = {"y": f"${y_col}", "x": f"${x_col}"}
+    return [
+        {"$match": {"$and": [query, {x_col: {"$ne": None}}, {y_col: {"$ne": None}}]}},
+        {"$bucketAuto": {
+            "groupBy": f"${x_col}",
+            "buckets": int(n_buckets),
+            "output": {"low": {"$min": point}, "high": {"$max": point}}
+        }},
+        {"$project": {"_id": 0, "low": 1, "high": 1}}
+    ]
+
+
+def value_range_pipeline(query, y_col):
+    """Min/max of a numeric field, used to lay out equal-width histogram bins."""
+    return [
+        # Strings sort above numbers in BSON order: one stray string would become the $max
+        {"$match": {"$and": [query, {y_col: {"$type": "number"}}]}},
+        {"$group": {"_id": None, "min": {"$min": f"${y_col}"}, "max": {"$max": f"${y_col}"}}}
+    ]
+
+
+def histogram_pipeline(query, y_col, boundaries):
+    """Counts documents per equal-width bin of Y with $bucket; values outside the bins are dropped."""
+    return [
+        {"$match": query},
+        {"$bucket": {
+            "groupBy": f"${y_col}",
+            "boundaries": list(boundaries),
+            "default": "outside",
+            "output": {"count": {"$sum": 1}}
+        }},
+        {"$match": {"_id": {"$ne": "outside"}}},
+        {"$project": {"_id": 0, "bin_start": "$_id", "count": 1}}
+    ]
+
+
+def grouped_histogram_pipeline(query, y_col, group_column, y_min, bin_width, bins, group_expr=None):
+    """
+    Histogram of Y per group value: the bin index is computed in the $group key.
+    ``group_expr`` replaces ``$group_column`` as the group key (e.g. a ``$dateTrunc`` of a date field).
+    """
+    bin_index = {"$min": [bins - 1, {"$floor": {"$divide": [{"$subtract": [f"${y_col}", y_min]}, bin_width]}}]}
+    return [
+        {"$match": {"$and": [query, {y_col: {"$type": "number"}}]}},
+        {"$group": {
+            "_id": {"group": group_expr or f"${group_column}", "bin": bin_index},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            field_alias(group_column): "$_id.group",
+            "bin_start": {"$add": [y_min, {"$multiply": ["$_id.bin", bin_width]}]},
+            "count": 1
+        }},
+        {"$sort": {"bin_start": 1}}
+    ]
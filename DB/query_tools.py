@@ -1,5 +1,87 @@
+import numpy as np
 import pandas as pd
 
+# Output rows per chunk when exploding very large frames
+EXPLODE_CHUNK_ROWS = 1_000_000
+
+
+def _as_array(value):
+    # None/NaN explode to nothing, scalars to a single element
+    if value is None:
+        return np.empty(0)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return np.asarray(value)
+    if pd.isna(value):
+        return np.empty(0)
+    return np.asarray([value])
+
+
+def _explode_rows(df, array_fields, index_field, keep_fields, rows, arrays, lengths):
+    """Exploded frame for the source rows ``rows`` (positions into ``df``)."""
+    counts = lengths[rows]
+    repeated = np.repeat(rows, counts)
+    out = df[keep_fields].take(repeated)
+    for field in array_fields:
+        parts = [arrays[field][row] for row in rows if lengths[row]]
+        out[field] = np.concatenate(parts) if parts else np.empty(0)
+
+    # Position within each array: running count minus the start offset of its source row
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    out[index_field] = np.arange(len(repeated)) - offsets
+    return out.dropna(subset=array_fields, how="all")
+
+
+def iter_explode_array_fields(df: pd.DataFrame, array_fields, index_field: str = "array_index", keep_fields=None,
+                              chunk_rows: int = EXPLODE_CHUNK_ROWS):
+    """
+    Explodes several equal-length array columns together, yielding frames of about ``chunk_rows`` rows.
+
+    Each source row's arrays become consecutive rows carrying the ``keep_fields`` values, the source
+    index label and the position within the arrays in ``index_field``. Rows where every array value is
+    NaN are dropped. Raises ``ValueError`` for missing columns or arrays of different lengths in a row.
+    """
+    if isinstance(array_fields, str):
+        array_fields = [array_fields]
+    keep_fields = list(keep_fields or [])
+    missing = [field for field in array_fields if field not in df.columns]
+    if missing:
+        raise ValueError(f"Field(s) {missing} not found in DataFrame")
+
+    arrays = {field: [_as_array(value) for value in df[field].to_numpy()] for field in array_fields}
+    lengths = np.fromiter((len(a) for a in arrays[array_fields[0]]), dtype=np.int64, count=len(df))
+    for field in array_fields[1:]:
+        other = np.fromiter((len(a) for a in arrays[field]), dtype=np.int64, count=len(df))
+        if not np.array_equal(lengths, other):
+            bad = df.index[np.flatnonzero(lengths != other)[0]]
+            raise ValueError(f"Arrays of {array_fields[0]} and {field} differ in length at row {bad}")
+
+    # Chunk boundaries in source rows, so each chunk explodes to about chunk_rows rows
+    ends = np.cumsum(lengths)
+    start = 0
+    while start < len(df):
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + chunk_rows, side="right")), start + 1)
+        yield _explode_rows(df, array_fields, index_field, keep_fields, np.arange(start, stop), arrays, lengths)
+        start = stop
+
+
+def explode_array_fields(df: pd.DataFrame, array_fields, index_field: str = "array_index", keep_fields=None):
+    """
+    Explodes several equal-length array columns (e.g. flow_rate_data and milk_quantity_data) in one pass.
+
+    Returns ``keep_fields + array_fields + [index_field]``; see ``iter_explode_array_fields`` to stream
+    very large frames chunk by chunk.
+    """
+    if isinstance(array_fields, str):
+        array_fields = [array_fields]
+    keep_fields = list(keep_fields or [])
+    chunks = list(iter_explode_array_fields(df, array_fields, index_field, keep_fields))
+    if not chunks:
+        return pd.DataFrame(columns=keep_fields + array_fields + [index_field])
+    out = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+    return out[keep_fields + array_fields + [index_field]]
+
+
 def explode_array_field(df: pd.DataFrame, array_field: str, index_field: str = "array_index", keep_fields=None):
     """
     Explodes a DataFrame where one column contains arrays (e.g., flow_rate_data), keeping other identifiers.
@@ -13,22 +95,4 @@ def explode_array_field(df: pd.DataFrame, array_field: str, index_field: str = "
     Returns:
         pd.DataFrame: Exploded DataFrame.
     """
-    if keep_fields is None:
-        keep_fields = []
-
-    df = df.copy()
-    # Ensure the array field exists
-    if array_field not in df.columns:
-        raise ValueError(f"Field {array_field} not found in DataFrame")
-
-    # Create a temporary index to preserve row order
-    df['_temp_index'] = df.index
-    df_exploded = df.explode(array_field)
-    df_exploded[index_field] = df_exploded.groupby('_temp_index').cumcount()
-
-    # Only keep necessary columns
-    columns_to_keep = keep_fields + [array_field, index_field]
-    df_exploded = df_exploded[columns_to_keep]
-
-    df_exploded = df_exploded.dropna(subset=[array_field])  # Clean if needed
-    return df_exploded
+    return explode_array_fields(df, [array_field], index_field, keep_fields)
@@ -0,0 +1,200 @@
+# schema_catalog.py
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from config_py import SCHEMA_SAMPLE_SIZE, SCHEMA_MAX_ARRAY_ITEMS, SCHEMA_MAX_CARDINALITY, \
+    SCHEMA_REFRESH_INTERVAL_SEC
+
+
+def value_type(value):
+    """Maps a decoded BSON value to the type name used by the catalog."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, datetime):
+        return "date"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # BSON Binary (a bytes subclass), e.g. flow curves stored with DB/flow_codec.py
+        return "binary"
+    return type(value).__name__
+
+
+class SchemaCatalog:
+    """
+    Per-collection catalog of dotted field paths built from a ``$sample`` of documents.
+
+    Nested documents and arrays of documents are walked into dotted paths
+    (e.g. ``Mounting_data.1``), so the filter UI sees fields the first document lacks.
+    For every path the catalog keeps the observed types, how many sampled documents
+    contain it, whether it lives inside an array and its distinct-value count
+    (capped at ``SCHEMA_MAX_CARDINALITY``).
+
+    Catalogs are cached; ``get`` serves a stale catalog immediately and refreshes it in
+    the background, and ``start`` keeps every known collection refreshed periodically.
+    """
+
+    def __init__(self, mongo_handler, sample_size=SCHEMA_SAMPLE_SIZE,
+                 refresh_interval_sec=SCHEMA_REFRESH_INTERVAL_SEC):
+        self.mongo_handler = mongo_handler
+        self.sample_size = sample_size
+        self.refresh_interval_sec = refresh_interval_sec
+        self._catalogs = {}  # collection -> (built_at, catalog)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def get(self, collection_name):
+        with self._lock:
+            cached = self._catalogs.get(collection_name)
+        if cached is None:
+            return self.refresh(collection_name)
+        built_at, catalog = cached
+        if time.monotonic() - built_at > self.refresh_interval_sec:
+            self.refresh_async(collection_name)
+        return catalog
+
+    def refresh(self, collection_name):
+        docs = self.mongo_handler.get_aggregated_documents(
+            collection_name, [{"$sample": {"size": self.sample_size}}])
+        catalog = self.build_catalog(docs)
+        with self._lock:
+            self._catalogs[collection_name] = (time.monotonic(), catalog)
+        print(f"✅ Schema catalog for {collection_name}: {len(catalog)} fields from {len(docs)} sampled documents")
+        return catalog
+
+    def refresh_async(self, collection_name):
+        with self._lock:
+            if collection_name in self._refreshing:
+                return
+            self._refreshing.add(collection_name)
+
+        def run():
+            try:
+                self.refresh(collection_name)
+            except Exception as e:
+                print(f"❌ Schema catalog refresh failed for {collection_name}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(collection_name)
+
+        threading.Thread(target=run, name=f"schema-{collection_name}", daemon=True).start()
+
+    def start(self, collection_names):
+        """Builds catalogs for ``collection_names`` in the background and keeps them refreshed."""
+        def run():
+            while not self._stop_event.is_set():
+                for name in collection_names:
+                    try:
+                        self.refresh(name)
+                    except Exception as e:
+                        print(f"❌ Schema catalog refresh failed for {name}: {e}")
+                self._stop_event.wait(self.refresh_interval_sec)
+
+        threading.Thread(target=run, name="schema-catalog", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @staticmethod
+    def build_catalog(docs):
+        """
+        Walks the sampled documents into ``{path: info}``.
+
+        ``info`` holds ``types`` (type name -> occurrences), ``type`` (most common non-null type),
+        ``item_type`` and ``max_length`` for arrays of scalars, ``count`` (documents containing
+        the path), ``in_array``, ``cardinality`` and ``cardinality_capped``.
+        """
+        stats = {}
+
+        def record(path, value, doc_index, in_array):
+            info = stats.setdefault(path, {"types": {}, "docs": set(), "values": set(), "in_array": False,
+                                           "max_length": 0})
+            type_name = value_type(value)
+            if type_name == "array":
+                info["max_length"] = max(info["max_length"], len(value))
+            info["types"][type_name] = info["types"].get(type_name, 0) + 1
+            info["docs"].add(doc_index)
+            info["in_array"] |= in_array
+            if type_name not in ("object", "array", "binary") and len(info["values"]) <= SCHEMA_MAX_CARDINALITY:
+                try:
+                    info["values"].add(value)
+                except TypeError:
+                    pass  # unhashable BSON value, type is still recorded
+
+        def walk(value, path, doc_index, in_array):
+            if isinstance(value, dict):
+                for key, child in value.items():
+                    child_path = f"{path}.{key}" if path else str(key)
+                    record(child_path, child, doc_index, in_array)
+                    walk(child, child_path, doc_index, in_array)
+            elif isinstance(value, list):
+                # Long numeric arrays (flow curves) only need a few items to type them
+                for item in value[:SCHEMA_MAX_ARRAY_ITEMS]:
+                    if isinstance(item, dict):
+                        walk(item, path, doc_index, True)
+                    elif not isinstance(item, list):
+                        record(f"{path}[]", item, doc_index, True)
+
+        for i, doc in enumerate(docs):
+            walk(doc, "", i, False)
+
+        def dominant_type(types):
+            non_null = {t: n for t, n in types.items() if t != "null"} or types
+            return max(non_null, key=non_null.get)
+
+        catalog = {}
+        for path, info in sorted(stats.items()):
+            items = stats.get(f"{path}[]")
+            catalog[path] = {
+                "types": info["types"],
+                "type": dominant_type(info["types"]),
+                "item_type": dominant_type(items["types"]) if items else None,
+                "max_length": info["max_length"],
+                "count": len(info["docs"]),
+                "in_array": info["in_array"],
+                "cardinality": min(len(info["values"]), SCHEMA_MAX_CARDINALITY),
+                "cardinality_capped": len(info["values"]) > SCHEMA_MAX_CARDINALITY,
+            }
+        return catalog
+
+    @staticmethod
+    def filterable_fields(catalog):
+        """
+        Leaf paths that can be filtered, plotted or grouped on: scalars and short arrays of
+        scalars such as ``Mounting_data.1``, but not containers or long curves like ``flow_rate_data``
+        (stored as arrays or as binary).
+        """
+        def is_leaf(path, info):
+            if path.endswith("[]") or info["type"] in ("object", "binary"):
+                return False
+            if info["type"] == "array":
+                return info["item_type"] is not None and info["max_length"] <= SCHEMA_MAX_ARRAY_ITEMS
+            return True
+
+        return [path for path, info in catalog.items() if is_leaf(path, info)]
+
+    @staticmethod
+    def scalar_type(info):
+        """Type a filter value on this path should be parsed as (element type for arrays)."""
+        return info["item_type"] if info["type"] == "array" else info["type"]
+
+    @staticmethod
+    def date_fields(catalog):
+        fields = SchemaCatalog.filterable_fields(catalog)
+        return [path for path in fields
+                if catalog[path]["type"] == "date"
+                or any(k in path.lower() for k in ["date", "time", "start", "end"])]
@@ -0,0 +1,72 @@
+# typed_ingest.py
+# Fetched documents -> typed DataFrames: every collection declares its datetime and categorical columns,
+# which are converted column-wise in bulk instead of per document.
+import pandas as pd
+
+# datetime: parsed in one pd.to_datetime call per column
+# category: string-labelled categoricals (plot/group keys such as cow_id), converted once per distinct value
+# duration: (start column, end column) -> duration_sec
+SCHEMAS = {
+    "Mounting_Data_Collection": {
+        "datetime": ["start", "end"],
+        "category": ["cow_id", "teat_id", "farm", "status", "error_code"],
+        "duration": ("start", "end"),
+    },
+    "Milking_Data_Collection": {
+        "datetime": ["start", "end"],
+        "category": ["cow_id", "teat_id", "farm"],
+        "numeric": ["milk_quantity", "flow_rate"],
+        "duration": ("start", "end"),
+    },
+    "Tasks_collection": {
+        "datetime": ["start_time", "end_time"],
+        "category": ["worker", "process", "state", "error"],
+        "duration": ("start_time", "end_time"),
+    },
+    # Rows of Tasks_collection's task_steps, one per step
+    "Task_Steps": {
+        "datetime": ["start", "end"],
+        "category": ["task_state", "step_name", "step_status"],
+        "duration": ("start", "end"),
+    },
+}
+
+
+def to_datetime_column(values):
+    """One bulk datetime conversion; extended-JSON ``{"$date": ...}`` values are unwrapped first."""
+    if values.dtype == object and values.map(lambda v: isinstance(v, dict)).any():
+        values = values.map(lambda v: v["$date"] if isinstance(v, dict) else v)
+    return pd.to_datetime(values, errors="coerce")
+
+
+def to_category_column(values):
+    """Categorical with string labels; missing values stay missing."""
+    # Labels are stringified before categorizing, so 1 and "1" share one category instead of colliding
+    return values.astype("string").astype("category")
+
+
+def typed_frame(docs, collection):
+    """
+    DataFrame of ``docs`` (a list of documents or a frame) typed per ``SCHEMAS[collection]``.
+
+    ``_id`` becomes a string, declared columns that are missing are skipped, and ``duration_sec`` is
+    added when the schema declares a duration.
+    """
+    schema = SCHEMAS[collection]
+    df = docs if isinstance(docs, pd.DataFrame) else pd.DataFrame(docs)
+    if "_id" in df:
+        df["_id"] = df["_id"].astype(str)
+    for column in schema.get("datetime", []):
+        if column in df:
+            df[column] = to_datetime_column(df[column])
+    for column in schema.get("numeric", []):
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in schema.get("category", []):
+        if column in df:
+            df[column] = to_category_column(df[column])
+    if "duration" in schema:
+        start, end = schema["duration"]
+        if start in df and end in df:
+            df["duration_sec"] = (df[end] - df[start]).dt.total_seconds()
+    return df
@@ -2,13 +2,26 @@
 from dash import dash_table, html, dash  # Import Dash HTML and DataTable components
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State, MATCH, ALL, ctx
+from dash.exceptions import PreventUpdate
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 from collections import defaultdict
 from GUI.graphing import GraphingManager
+from GUI.gui_elements import create_export_controls
+from GUI.export_routes import export_link
 from DB.connection import MongoDBManager
-from config_py import farm_connection_str, COWS_DB
+from pymongo.errors import OperationFailure
+from DB.pipeline_builder import TIME_GRANULARITIES, PERCENTILES, build_match_query, frequency_pipeline, \
+    aggregate_pipeline, unalias_columns, with_x_range, minmax_bucket_pipeline, value_range_pipeline, \
+    histogram_pipeline, grouped_histogram_pipeline, sample_stage
+from UTILS.downsample import DOWNSAMPLE_METHODS, decimate_frame
+from UTILS.distribution import histogram_frame, percentile_frame, truncate_times
+from UTILS.estimation import mean_half_width, scaled_count
+from UTILS.background_jobs import background_jobs
+from config_py import farm_connection_str, COWS_DB, DOWNSAMPLE_POINT_BUDGET, HISTOGRAM_BINS, PREVIEW_SAMPLE_SIZE, \
+    PREVIEW_POLL_INTERVAL_MS
 graph_mgr = GraphingManager()
 
 # Layout function for the Mounting Data tab
@@ -39,6 +52,9 @@ def global_layout(mongo_handler , app):
         dcc.Loading(html.Div(id="filter-ui"), type="default"),
         html.Hr(),
         dcc.Store(id="filters-store", data=[]),
+        dcc.Store(id="global-plot-spec"),
+        dcc.Store(id="global-refine-job"),
+        dcc.Interval(id="global-refine-interval", interval=PREVIEW_POLL_INTERVAL_MS, disabled=True),
         dcc.Loading(
             id="loading-plot",
             type="circle",
@@ -51,7 +67,247 @@ def global_layout(mongo_handler , app):
 
     return layout
 
-def global_callbacks(app , mongo_handler):
+def fetch_raw_points(mongo_handler, collection, query, x_col, y_col, group_column=None, method="minmax",
+                     budget=DOWNSAMPLE_POINT_BUDGET):
+    """
+    Fetches a representative set of at most ~``budget`` raw points over the full filtered set.
+
+    Small results are returned as-is. Large ungrouped min/max requests are decimated inside Mongo
+    with ``$bucketAuto``; LTTB and grouped requests fetch only the projected X/Y/group columns
+    and are decimated with NumPy. Returns ``(df, total_points)``.
+    """
+    total = mongo_handler.count_documents(collection, query)
+
+    if total > budget and method == "minmax" and not group_column:
+        pipeline = minmax_bucket_pipeline(query, x_col, y_col, budget // 2)
+        docs = mongo_handler.get_aggregated_documents(collection, pipeline)
+        points = [point for doc in docs for point in (doc["low"], doc["high"])]
+        df = pd.DataFrame(points, columns=["x", "y"]).rename(columns={"x": x_col, "y": y_col})
+        return df.drop_duplicates().sort_values(x_col), total
+
+    fields = [x_col, y_col] + ([group_column] if group_column else [])
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    docs = mongo_handler.get_documents(collection, query=query, projection=projection)
+    # Flatten nested documents so dotted catalog paths become columns
+    df = pd.json_normalize(docs)
+    if df.empty or x_col not in df.columns or y_col not in df.columns:
+        return df, total
+    if len(df) > budget:
+        df = decimate_frame(df, x_col, y_col, budget, method=method, group_column=group_column)
+    return df, total
+
+
+def fetch_projected_frame(mongo_handler, collection, query, fields, sample_size=None):
+    """Matching documents projected to ``fields``; ``sample_size`` draws a ``$sample`` of that many instead."""
+    projection = {field: 1 for field in fields if field}
+    projection["_id"] = 0
+    if sample_size:
+        pipeline = [{"$match": query}, *sample_stage(sample_size), {"$project": projection}]
+        return pd.json_normalize(mongo_handler.get_aggregated_documents(collection, pipeline))
+    return pd.json_normalize(mongo_handler.get_documents(collection, query=query, projection=projection))
+
+
+def fetch_histogram(mongo_handler, collection, query, y_col, group_column=None, bins=HISTOGRAM_BINS):
+    """
+    Equal-width histogram of Y (optionally per group) computed in Mongo: one $group for the value range,
+    then $bucket (or a binned $group when grouping). Falls back to NumPy over the projected Y column
+    when the backend rejects the pipeline.
+    """
+    try:
+        stats = mongo_handler.get_aggregated_documents(collection, value_range_pipeline(query, y_col))
+        if not stats or not all(isinstance(stats[0][k], (int, float)) for k in ("min", "max")):
+            return pd.DataFrame()
+        y_min, y_max = float(stats[0]["min"]), float(stats[0]["max"])
+        bin_width = (y_max - y_min) / bins or 1.0
+
+        if group_column:
+            pipeline = grouped_histogram_pipeline(query, y_col, group_column, y_min, bin_width, bins)
+            return unalias_columns(pd.DataFrame(mongo_handler.get_aggregated_documents(collection, pipeline)),
+                                   [group_column])
+
+        # $bucket boundaries are [lower, upper); nudge the last one so the maximum lands in the top bin
+        boundaries = [y_min + i * bin_width for i in range(bins)] + [np.nextafter(y_min + bins * bin_width, np.inf)]
+        return pd.DataFrame(mongo_handler.get_aggregated_documents(collection, histogram_pipeline(query, y_col,
+                                                                                                  boundaries)))
+    except OperationFailure as e:
+        print(f"⚠️ Histogram pipeline not supported ({e}), computing with NumPy")
+        df = fetch_projected_frame(mongo_handler, collection, query, [y_col, group_column])
+        if df.empty or y_col not in df.columns:
+            return pd.DataFrame()
+        return histogram_frame(df, y_col, bins, group_column)
+
+
+def fetch_aggregated(mongo_handler, collection, query, x_col, y_col, agg_func, group_column=None, granularity=None,
+                     sample_size=None):
+    """Aggregated Y per X (time bucket) and group; percentiles fall back to NumPy when $percentile is missing."""
+    pipeline = aggregate_pipeline(query, x_col, y_col, agg_func, group_column, granularity, sample_size,
+                                  with_stats=sample_size is not None and agg_func == "AVG")
+    try:
+        docs = mongo_handler.get_aggregated_documents(collection, pipeline)
+        return unalias_columns(pd.DataFrame(docs), [x_col, y_col, group_column])
+    except OperationFailure as e:
+        if agg_func not in PERCENTILES:
+            raise
+        print(f"⚠️ $percentile not supported ({e}), computing with NumPy")
+        # Same sample as the $percentile pipeline would have used, so a preview stays a preview
+        df = fetch_projected_frame(mongo_handler, collection, query, [x_col, y_col, group_column], sample_size)
+        if df.empty or x_col not in df.columns or y_col not in df.columns:
+            return pd.DataFrame()
+        if granularity:
+            df[x_col] = truncate_times(df[x_col], granularity)
+        return percentile_frame(df, x_col, y_col, PERCENTILES[agg_func], group_column)
+
+
+def render_global_plot(mongo_handler, params, sample_size=None):
+    """Like ``build_global_plot``, but a query the server rejects is shown as an alert instead of raising."""
+    try:
+        return build_global_plot(mongo_handler, params, sample_size)
+    except OperationFailure as e:
+        print(f"❌ Plot query failed: {e}")
+        return dbc.Alert(f"The query could not be run: {e}", color="danger"), None, False
+
+
+def build_global_plot(mongo_handler, params, sample_size=None):
+    """
+    Runs the Farm Data plot described by ``params`` (the plot controls' values).
+
+    With ``sample_size`` the Frequency and aggregation modes run over a ``$sample`` of that many documents,
+    scaled to the full set where needed and drawn with 95% confidence intervals.
+    Returns ``(component, plot_spec, sampled)``; ``sampled`` tells whether an exact run is still needed.
+    """
+    collection, x_col, y_col = params["collection"], params["x_col"], params["y_col"]
+    graph_type, agg_func, group_column = params["graph_type"], params["agg_func"], params["group_column"]
+    categorical_x = params["categorical_x"]
+
+    query = build_match_query(params["filters"], params["date_field"], params["start_date"], params["end_date"])
+    granularity = None if params["granularity"] in (None, "None") else params["granularity"]
+    if granularity and agg_func == "None" and y_col != "Frequency":
+        # Time buckets always aggregate in Mongo; averaging is the natural default for a time series
+        agg_func = "AVG"
+
+    sampled = False
+    if sample_size and (y_col == "Frequency" or agg_func not in ("None", "HISTOGRAM")):
+        total = mongo_handler.count_documents(collection, query)
+        sampled = total > sample_size
+    sample_n = sample_size if sampled else None
+
+    df = pd.DataFrame()
+    title = f"{y_col} by {x_col}"
+    plot_spec = None
+    error_column = None
+
+    if y_col == "Frequency":
+        pipeline = frequency_pipeline(query, x_col, granularity, sample_n)
+        docs = mongo_handler.get_aggregated_documents(collection, pipeline)
+        df = unalias_columns(pd.DataFrame(docs), [x_col])
+        if sampled and not df.empty:
+            df["Frequency"], df["_ci"] = scaled_count(df["Frequency"], sample_n, total)
+            error_column = "_ci"
+
+    elif agg_func == "HISTOGRAM":
+        # Distribution of Y itself: X is replaced by the bins and always drawn as bars
+        df = fetch_histogram(mongo_handler, collection, query, y_col, group_column)
+        if df.empty:
+            return html.Div("No numeric data found for the histogram."), None, False
+        fig = graph_mgr.create_bar_chart(df, "bin_start", "count", f"Distribution of {y_col}",
+                                         group_column=group_column)
+        fig.update_layout(xaxis_title=y_col, yaxis_title="Count", bargap=0.05)
+        return dcc.Graph(id="global-graph", figure=fig), None, False
+
+    elif agg_func != "None":
+        df = fetch_aggregated(mongo_handler, collection, query, x_col, y_col, agg_func, group_column, granularity,
+                              sample_size=sample_n)
+        if sampled and not df.empty:
+            error_column = apply_preview_estimates(df, y_col, agg_func, sample_n, total)
+
+    elif graph_type in ("Line", "Scatter"):
+        method = params["downsample_method"] if params["downsample_method"] in DOWNSAMPLE_METHODS else "minmax"
+        df, total = fetch_raw_points(mongo_handler, collection, query, x_col, y_col, group_column, method)
+        if not df.empty:
+            title = downsampled_title(y_col, x_col, len(df), total)
+            # Enough to re-run the same query for a zoomed X window (see redecimate_on_zoom)
+            plot_spec = {
+                "collection": collection, "filters": params["filters"], "date_field": params["date_field"],
+                "start_date": params["start_date"], "end_date": params["end_date"], "x_col": x_col, "y_col": y_col,
+                "group_column": group_column, "method": method, "graph_type": graph_type,
+                "x_is_date": pd.api.types.is_datetime64_any_dtype(df[x_col]) if x_col in df.columns else False,
+                "categorical_x": categorical_x
+            }
+
+    else:
+        docs = mongo_handler.get_documents(collection, query=query, limit=10000)
+        # Flatten nested documents so dotted catalog paths become columns
+        df = pd.json_normalize(docs)
+
+    if df.empty:
+        return html.Div("No data found."), None, False
+
+    if granularity:
+        measure = y_col if y_col == "Frequency" else f"{agg_func} of {y_col}"
+        title = f"{measure} per {granularity} of {x_col}"
+    if sampled:
+        # Only COUNT/AVG/Frequency previews carry error bars; the other aggregates are plain sample estimates
+        interval = " (95% CI)" if error_column else ""
+        title += f" — preview from {sample_n:,} of {total:,} documents{interval}, refining…"
+
+    fig = build_figure(df, graph_type, x_col, y_col, title, categorical_x, group_column, error_column)
+    if fig is None:
+        return html.Div("Unknown graph type."), None, False
+
+    return dcc.Graph(id="global-graph", figure=fig), plot_spec, sampled
+
+
+def apply_preview_estimates(df, y_col, agg_func, sample_n, total):
+    """
+    Turns aggregates over a sample into estimates for the full set, in place.
+    Returns the error column name, or None when the aggregate has no simple interval (MIN/MAX/percentiles).
+    """
+    if agg_func == "AVG":
+        df["_ci"] = mean_half_width(df.pop("_sd"), df.pop("_n"))
+        return "_ci"
+    if agg_func == "COUNT":
+        df[y_col], df["_ci"] = scaled_count(df[y_col], sample_n, total)
+        return "_ci"
+    if agg_func == "SUM":
+        df[y_col] = df[y_col] * (total / sample_n)
+    return None
+
+
+def build_figure(df, graph_type, x_col, y_col, title, categorical_x=False, group_column=None, error_column=None):
+    if graph_type == "Bar":
+        return graph_mgr.create_bar_chart(df, x_col, y_col, title, categorical_x=categorical_x,
+                                          group_column=group_column, error_column=error_column)
+    elif graph_type == "Line":
+        return graph_mgr.create_line_chart(df, x_col, y_col, title, categorical_x=categorical_x,
+                                           group_column=group_column, error_column=error_column)
+    elif graph_type == "Scatter":
+        return graph_mgr.create_scatter_plot(df, x_col, y_col, title, categorical_x=categorical_x,
+                                             group_column=group_column, error_column=error_column)
+    elif graph_type == "Pie":
+        return graph_mgr.create_pie_chart(df, x_col, y_col, title)
+    return None
+
+
+def downsampled_title(y_col, x_col, shown, total):
+    title = f"{y_col} by {x_col}"
+    if shown < total:
+        title += f" ({shown:,} of {total:,} points)"
+    return title
+
+
+def parse_axis_bound(value, is_date):
+    return pd.to_datetime(value) if is_date else float(value)
+
+
+def field_options(catalog, fields):
+    def type_label(info):
+        return f"array<{info['item_type']}>" if info["type"] == "array" else info["type"]
+
+    return [{"label": f"{f} ({type_label(catalog[f])})", "value": f} for f in fields]
+
+
+def global_callbacks(app , mongo_handler, schema_catalog):
     @app.callback(
         Output("filter-ui", "children"),
         Input("load-button", "n_clicks"),
@@ -62,14 +318,13 @@ def global_callbacks(app , mongo_handler):
             return html.Div("No collection selected.")
 
         print("Loading collection metadata...")
-        docs = mongo_handler.get_documents(collection_name, limit=5)
-        if not docs:
+        catalog = schema_catalog.get(collection_name)
+        if not catalog:
             return html.Div("No data found in this collection.")
 
-        df = pd.DataFrame(docs)
-        df.drop(columns=[col for col in df.columns if isinstance(df[col].iloc[0], dict)], inplace=True, errors='ignore')
-        columns = df.columns.tolist()
-        date_fields = [col for col in columns if any(k in col.lower() for k in ["date", "time", "start", "end"])]
+        columns = schema_catalog.filterable_fields(catalog)
+        date_fields = schema_catalog.date_fields(catalog)
+        column_options = field_options(catalog, columns)
 
         return html.Div([
             html.H5("Filters & Options", className="text-secondary mb-3"),
@@ -77,7 +332,7 @@ def global_callbacks(app , mongo_handler):
             dbc.Row([
                 dbc.Col([
                     dbc.Label("Add Filter Field"),
-                    dcc.Dropdown(id="new-filter-field", options=[{"label": c, "value": c} for c in columns],
+                    dcc.Dropdown(id="new-filter-field", options=column_options,
                                  placeholder="Select field")
                 ], width=2),
                 dbc.Col([
@@ -109,26 +364,26 @@ def global_callbacks(app , mongo_handler):
             dbc.Row([
                 dbc.Col([
                     dbc.Label("X Axis"),
-                    dcc.Dropdown(id="x-axis", options=[{"label": c, "value": c} for c in columns])
+                    dcc.Dropdown(id="x-axis", options=column_options)
                 ], width=2),
                 dbc.Col([
                     dbc.Checklist(
                         id="categorical-x",
                         options=[{"label": "Treat X axis as categorical", "value": "categorical"}],
-                        value=["categorical"],
+                        value=[],
                         inline=True
                     )
                 ], width=2),
                 dbc.Col([
                     dbc.Label("Y Axis"),
-                    dcc.Dropdown(id="y-axis", options=[{"label": c, "value": c} for c in columns] + [
+                    dcc.Dropdown(id="y-axis", options=column_options + [
                         {"label": "Frequency", "value": "Frequency"}])
                 ], width=2),
                 dbc.Col([
                     dbc.Label("Group By"),
                     dcc.Dropdown(
                         id="group-column",
-                        options=[{"label": c, "value": c} for c in df.columns],
+                        options=column_options,
                         placeholder="Optional grouping field"
                     )
                 ], width=2),
@@ -147,10 +402,34 @@ def global_callbacks(app , mongo_handler):
                     dbc.Label("Y Aggregation"),
                     dcc.Dropdown(id="agg-func", value="None",
                                  options=[{"label": x, "value": x} for x in
-                                          ["None", "SUM", "AVG", "MAX", "MIN", "COUNT"]])
+                                          ["None", "SUM", "AVG", "MAX", "MIN", "COUNT"] +
+                                          list(PERCENTILES) + ["HISTOGRAM"]])
                 ], width=2)
             ], className="mb-3"),
 
+            dbc.Row([
+                dbc.Col([
+                    dbc.Label("Time Granularity"),
+                    # Filled with the time buckets once a date X field is chosen
+                    dcc.Dropdown(id="time-granularity", value="None",
+                                 options=[{"label": "None", "value": "None"}])
+                ], width=2),
+                dbc.Col([
+                    dbc.Label("Downsampling (raw Line/Scatter)"),
+                    dcc.Dropdown(id="downsample-method", value="minmax", clearable=False,
+                                 options=[{"label": "Min/Max per bucket", "value": "minmax"},
+                                          {"label": "LTTB", "value": "lttb"}])
+                ], width=2),
+                dbc.Col([
+                    dbc.Checklist(
+                        id="preview-mode",
+                        options=[{"label": "Fast preview from a sample, then refine", "value": "preview"}],
+                        value=[],
+                        className="mt-4"
+                    )
+                ], width=3),
+            ], className="mb-3"),
+
             dbc.Row([
                 dbc.Col([
                     dbc.Label("Date Field"),
@@ -167,9 +446,70 @@ def global_callbacks(app , mongo_handler):
                 dbc.Col([
                     dbc.Button("Plot", id="plot-button", color="success", className="mt-4")
                 ], width=2)
-            ])
+            ], className="mb-3"),
+            create_export_controls("global")
         ], className="p-3 border rounded bg-light")
 
+    @app.callback(
+        Output("global-export-link", "children"),
+        Input("global-export-button", "n_clicks"),
+        State("collection-dropdown", "value"),
+        State("filters-store", "data"),
+        State("date-field", "value"),
+        State("start-date", "date"),
+        State("end-date", "date"),
+        State("global-export-format", "value"),
+        prevent_initial_call=True
+    )
+    def export_filtered_data(n_clicks, collection, current_filters, date_field, start_date, end_date, fmt):
+        if not collection:
+            return html.Div("No collection selected.")
+        query = build_match_query(current_filters, date_field, start_date, end_date)
+        return export_link([(None, mongo_handler)], collection, query, fmt, collection)
+
+    @app.callback(
+        Output("new-filter-type", "value"),
+        Input("new-filter-field", "value"),
+        State("collection-dropdown", "value"),
+        prevent_initial_call=True
+    )
+    def suggest_filter_type(field, collection_name):
+        if not field or not collection_name:
+            raise PreventUpdate
+        info = schema_catalog.get(collection_name).get(field)
+        field_type = schema_catalog.scalar_type(info) if info else None
+        return {"number": "number", "boolean": "boolean"}.get(field_type, "string")
+
+    @app.callback(
+        Output("categorical-x", "value"),
+        Input("x-axis", "value"),
+        State("collection-dropdown", "value"),
+        prevent_initial_call=True
+    )
+    def suggest_categorical_x(x_col, collection_name):
+        # Numeric and date X stay continuous so zooming can re-query the visible range
+        if not x_col or not collection_name:
+            raise PreventUpdate
+        info = schema_catalog.get(collection_name).get(x_col)
+        field_type = schema_catalog.scalar_type(info) if info else None
+        return [] if field_type in ("number", "date") else ["categorical"]
+
+    @app.callback(
+        Output("time-granularity", "options"),
+        Output("time-granularity", "value"),
+        Input("x-axis", "value"),
+        State("collection-dropdown", "value"),
+        prevent_initial_call=True
+    )
+    def limit_granularity_to_dates(x_col, collection_name):
+        # $dateTrunc only accepts dates, so time buckets are offered for date X fields only
+        options = [{"label": "None", "value": "None"}]
+        if x_col and collection_name:
+            info = schema_catalog.get(collection_name).get(x_col)
+            if info and schema_catalog.scalar_type(info) == "date":
+                options += [{"label": g.title(), "value": g} for g in TIME_GRANULARITIES]
+        return options, "None"
+
     @app.callback(
         Output("filters-store", "data"),
         Output("dynamic-filters", "children"),
@@ -195,6 +535,9 @@ def global_callbacks(app , mongo_handler):
 
     @app.callback(
         Output("plot-container", "children"),
+        Output("global-plot-spec", "data"),
+        Output("global-refine-job", "data"),
+        Output("global-refine-interval", "disabled"),
         Input("plot-button", "n_clicks"),
         State("collection-dropdown", "value"),
         State("x-axis", "value"),
@@ -207,105 +550,89 @@ def global_callbacks(app , mongo_handler):
         State("filters-store", "data"),
         State("categorical-x", "value"),
         State("group-column", "value"),
+        State("time-granularity", "value"),
+        State("downsample-method", "value"),
+        State("preview-mode", "value"),
+        State("global-refine-job", "data"),
     )
     def generate_graph(n_clicks, collection, x_col, y_col, graph_type, agg_func, date_field, start_date, end_date,
-                       current_filters, categorical_flag, group_column):
+                       current_filters, categorical_flag, group_column, granularity, downsample_method, preview_flag,
+                       previous_job):
         if not n_clicks or not collection or not x_col or not y_col:
-            raise dash.exceptions.PreventUpdate
-
-        query = {}
-        for f in current_filters:
-            field = f['field']
-            val = f['value']
-            typ = f.get('type', 'string')
-            if typ == 'number':
-                try:
-                    val = float(val)
-                except ValueError:
-                    continue
-            elif typ == 'boolean':
-                val = str(val).lower() == 'true'
-            query[str(field)] = val
-
-        # Date filter
-        if date_field and start_date and end_date:
-            query[date_field] = {
-                "$gte": pd.to_datetime(start_date),
-                "$lte": pd.to_datetime(end_date)
-            }
-
-        agg_map = {
-            "SUM": "$sum",
-            "AVG": "$avg",
-            "MAX": "$max",
-            "MIN": "$min",
-            "COUNT": "$count"
+            raise PreventUpdate
+        if previous_job:
+            # A new plot supersedes a refinement that has not been swapped in yet
+            background_jobs.discard(previous_job)
+
+        params = {
+            "collection": collection, "x_col": x_col, "y_col": y_col, "graph_type": graph_type,
+            "agg_func": agg_func, "date_field": date_field, "start_date": start_date, "end_date": end_date,
+            "filters": current_filters, "categorical_x": 'categorical' in (categorical_flag or []),
+            "group_column": group_column, "granularity": granularity, "downsample_method": downsample_method
         }
 
-        pipeline = [{"$match": query}]
-        df = pd.DataFrame()
-
-        if y_col == "Frequency":
-            pipeline.extend([
-                {"$group": {
-                    "_id": f"${x_col}",
-                    "Frequency": {"$sum": 1}
-                }},
-                {"$project": {
-                    x_col: "$_id",
-                    "Frequency": 1,
-                    "_id": 0
-                }}
-            ])
-            docs = mongo_handler.get_aggregated_documents(collection, pipeline)
-            df = pd.DataFrame(docs)
-            y_col = "Frequency"
-
-        elif agg_func != "None" and y_col != "Frequency":
-            group_id = {x_col: f"${x_col}"}
-            if group_column:
-                group_id[group_column] = f"${group_column}"
+        if 'preview' in (preview_flag or []):
+            component, plot_spec, sampled = render_global_plot(mongo_handler, params, PREVIEW_SAMPLE_SIZE)
+            if sampled:
+                # Show the sampled answer now; swap_in_exact_result replaces it when the exact run finishes
+                job = background_jobs.submit(render_global_plot, mongo_handler, params)
+                return component, plot_spec, job, False
 
-            pipeline.append({
-                "$group": {
-                    "_id": group_id,
-                    y_col: {agg_map[agg_func]: f"${y_col}"}
-                }
-            })
+        component, plot_spec, _ = render_global_plot(mongo_handler, params)
+        return component, plot_spec, None, True
 
-            # Project output to flat format
-            project_fields = {y_col: 1}
-            for key in group_id:
-                project_fields[key] = f"$_id.{key}"
-            project_fields["_id"] = 0
-
-            pipeline.append({"$project": project_fields})
-
-            docs = mongo_handler.get_aggregated_documents(collection, pipeline)
-            df = pd.DataFrame(docs)
+    @app.callback(
+        Output("plot-container", "children", allow_duplicate=True),
+        Output("global-plot-spec", "data", allow_duplicate=True),
+        Output("global-refine-interval", "disabled", allow_duplicate=True),
+        Input("global-refine-interval", "n_intervals"),
+        State("global-refine-job", "data"),
+        prevent_initial_call=True
+    )
+    def swap_in_exact_result(n_intervals, job):
+        if not job:
+            return dash.no_update, dash.no_update, True
+        done, result = background_jobs.poll(job)
+        if not done:
+            raise PreventUpdate
+        if result is None:
+            return dash.no_update, dash.no_update, True
+        component, plot_spec, _ = result
+        return component, plot_spec, True
 
+    @app.callback(
+        Output("global-graph", "figure"),
+        Input("global-graph", "relayoutData"),
+        State("global-plot-spec", "data"),
+        prevent_initial_call=True
+    )
+    def redecimate_on_zoom(relayout_data, spec):
+        # Only raw, numerically/time-ordered plots can map a zoom window back to a query
+        if not relayout_data or not spec or spec["categorical_x"]:
+            raise PreventUpdate
+
+        if "xaxis.range[0]" in relayout_data:
+            x_range = [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+        elif "xaxis.range" in relayout_data:
+            x_range = relayout_data["xaxis.range"]
+        elif relayout_data.get("xaxis.autorange"):
+            x_range = None
         else:
-            docs = mongo_handler.get_documents(collection, query=query, limit=10000)
-            df = pd.DataFrame(docs)
+            raise PreventUpdate
 
+        x_col, y_col = spec["x_col"], spec["y_col"]
+        query = build_match_query(spec["filters"], spec["date_field"], spec["start_date"], spec["end_date"])
+        if x_range:
+            x_min, x_max = (parse_axis_bound(v, spec["x_is_date"]) for v in x_range)
+            query = with_x_range(query, x_col, x_min, x_max)
+
+        df, total = fetch_raw_points(mongo_handler, spec["collection"], query, x_col, y_col,
+                                     spec["group_column"], spec["method"])
         if df.empty:
-            return html.Div("No data found.")
-
-        categorical_x = 'categorical' in (categorical_flag or [])
-        title = f"{y_col} by {x_col}"
-
-        if graph_type == "Bar":
-            fig = graph_mgr.create_bar_chart(df, x_col, y_col, title, categorical_x=categorical_x,
-                                             group_column=group_column)
-        elif graph_type == "Line":
-            fig = graph_mgr.create_line_chart(df, x_col, y_col, title, categorical_x=categorical_x,
-                                              group_column=group_column)
-        elif graph_type == "Scatter":
-            fig = graph_mgr.create_scatter_plot(df, x_col, y_col, title, categorical_x=categorical_x,
-                                                group_column=group_column)
-        elif graph_type == "Pie":
-            fig = graph_mgr.create_pie_chart(df, x_col, y_col, title)
-        else:
-            return html.Div("Unknown graph type.")
+            raise PreventUpdate
 
-        return dcc.Graph(figure=fig)
+        fig = build_figure(df, spec["graph_type"], x_col, y_col, downsampled_title(y_col, x_col, len(df), total),
+                           group_column=spec["group_column"])
+        if x_range:
+            fig.update_xaxes(range=x_range)
+        return fig
@@ -1,22 +1,62 @@
 # milking_tab.py
-from dash import html, dcc, Input, Output, State, callback, dash_table, dash
+from dash import html, dcc, Input, Output, State, callback, dash_table, dash, ctx
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import warnings
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 from bson import ObjectId
+from GUI.gui_elements import default_date_range, create_export_controls, create_refresh_button
+from GUI.export_routes import export_link
+from GUI.graphing import GraphingManager
+from UTILS.cache import figure_cache, result_cache
+from UTILS.smoothing import SMOOTHING_KERNELS
+from DB.pipeline_builder import value_range_pipeline, histogram_pipeline, grouped_histogram_pipeline, \
+    aggregate_pipeline, x_group_expr, unalias_columns
+from config_py import HISTOGRAM_BINS, FLOW_SMOOTHING_WINDOW_SEC, FLOW_COMPARISON_GRID_POINTS, \
+    FLOW_COMPARISON_MAX_SESSIONS, FLOW_RESAMPLE_HZ
+from DB.flow_pyramid import load_flow_levels
+from DB.flow_codec import decode_document
+from DB.typed_ingest import typed_frame
+from DB.milking_kpis import KPI_COLLECTION
+from DB.milking_anomalies import ANOMALY_COLLECTION
+from UTILS.flow_timeline import build_flow_timeline, teat_curves, flow_bands, session_curves_on_grid
 
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
+graph_mgr = GraphingManager()
 
 # Available analysis types
 MILKING_ANALYSIS_OPTIONS = [
     {'label': 'Flow Rate Over Time', 'value': 'flow_over_time'},
     {'label': 'Milk Quantity Distribution', 'value': 'quantity_distribution'},
+    {'label': 'Flow Curve Comparison Across Sessions', 'value': 'flow_comparison'},
+    {'label': 'Milking KPI Trends', 'value': 'kpi_trends'},
+    {'label': 'Flagged Milking Anomalies', 'value': 'anomalies'},
 
 ]
+
+# Per-session KPIs maintained by DB/milking_kpis.py
+KPI_OPTIONS = [
+    {"label": "Peak flow", "value": "peak_flow"},
+    {"label": "Time to peak (sec)", "value": "time_to_peak_sec"},
+    {"label": "Plateau duration (sec)", "value": "plateau_sec"},
+    {"label": "Total yield", "value": "total_yield"},
+    {"label": "Session duration (sec)", "value": "duration_sec"},
+]
+
+# Group-by choices of the milk quantity distribution and KPI trends; "date" buckets the session start per day
+QUANTITY_GROUP_OPTIONS = [
+    {"label": "No grouping", "value": "none"},
+    {"label": "Cow", "value": "cow_id"},
+    {"label": "Teat", "value": "teat_id"},
+    {"label": "Day", "value": "date"},
+]
 def milking_layout(mongo_handler):
+    default_start, default_end = default_date_range()
     return dbc.Container([
         html.H4("Milking Data Analysis", className="my-3"),
         dbc.Row([
@@ -38,19 +78,46 @@ def milking_layout(mongo_handler):
             ], width=2),
             dbc.Col([
                 dbc.Label("Start Date"),
-                dcc.DatePickerSingle(id="milking-filter-start-date", date=(datetime.now() - timedelta(days=7)).date())
+                dcc.DatePickerSingle(id="milking-filter-start-date", date=default_start)
             ], width=2),
             dbc.Col([
                 dbc.Label("End Date"),
-                dcc.DatePickerSingle(id="milking-filter-end-date", date=(datetime.now()+ timedelta(days=1)).date())
+                dcc.DatePickerSingle(id="milking-filter-end-date", date=default_end)
             ], width=2)
         ], className="mb-3"),
         dbc.Row([
             dbc.Col([
-                dbc.Label("Rolling Average Window Size"),
-                dcc.Input(id="rolling-window", type="number", min=1, value=120, className="form-control")
+                dbc.Label("Smoothing"),
+                dcc.Dropdown(
+                    id="smoothing-kernel",
+                    options=[{"label": label, "value": kernel} for kernel, label in SMOOTHING_KERNELS.items()],
+                    value="sma",
+                    clearable=False
+                )
+            ], width=3),
+            dbc.Col([
+                dbc.Label("Smoothing Window (sec)"),
+                dcc.Input(id="rolling-window", type="number", min=0, value=FLOW_SMOOTHING_WINDOW_SEC,
+                          className="form-control")
+            ], width=2),
+            dbc.Col([
+                dbc.Label("Group By"),
+                dcc.Dropdown(id="milking-quantity-group", options=QUANTITY_GROUP_OPTIONS, value="none",
+                             clearable=False),
+                dbc.Checklist(id="milking-quantity-trend",
+                              options=[{"label": "Per-day trend lines", "value": "trend"}], value=[])
+            ], width=3),
+            dbc.Col([
+                dbc.Label("KPI"),
+                dcc.Dropdown(id="milking-kpi", options=KPI_OPTIONS, value="peak_flow", clearable=False)
+            ], width=2),
+            dbc.Col([
+                dbc.Label("Sessions to Compare"),
+                dcc.Input(id="milking-session-count", type="number", min=1, max=FLOW_COMPARISON_MAX_SESSIONS,
+                          value=20, className="form-control")
             ], width=2),
         ], className="mb-3"),
+        create_export_controls("milking"),
 
         dbc.Row([
             dbc.Col([
@@ -62,7 +129,8 @@ def milking_layout(mongo_handler):
         ], className="mb-3"),
         dbc.Row([
             dbc.Col([
-                dbc.Button("Plot", id="milking-plot-button", color="primary", className="me-2")
+                dbc.Button("Plot", id="milking-plot-button", color="primary", className="me-2"),
+                create_refresh_button("milking")
             ])
         ], className="mb-3"),
         dcc.Dropdown(
@@ -72,157 +140,532 @@ def milking_layout(mongo_handler):
             value=[1, 2, 3, 4],  # ✅ Default selection
             placeholder="Select Teats (default: all)"
         ),
+        dcc.Store(id="milking-flow-spec"),
         dcc.Loading(html.Div(id="milking-plot-container"), type="circle")
     ], fluid=True)
 
+
+def cached_milking_task_table(mongo_handler, cow_id, teat_id, start_date, end_date, refresh=False, ttl=None):
+    key = figure_cache.make_key("milking_task_table", cow_id, teat_id, start_date, end_date)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: build_milking_task_table(mongo_handler, cow_id, teat_id, start_date, end_date),
+        refresh=refresh, ttl=ttl
+    )
+
+
+def build_milking_query(cow_id, teat_id, start_date, end_date):
+    query = {}
+    if cow_id is not None:
+        query["cow_id"] = cow_id
+    if teat_id is not None:
+        query["teat_id"] = teat_id
+    if start_date and end_date:
+        query["start"] = {"$gte": pd.to_datetime(start_date), "$lte": pd.to_datetime(end_date)}
+    return query
+
+
+# Scalar columns shown in the task table; the flow/quantity arrays never leave Mongo here
+TASK_TABLE_FIELDS = ["task_id", "cow_id", "teat_id", "milk_quantity", "flow_rate", "start", "end"]
+
+
+def recent_tasks_pipeline(query, limit=10, fields=TASK_TABLE_FIELDS):
+    """
+    Rows (scalar fields only) of the ``limit`` most recently started task_ids matching ``query``, newest first.
+
+    Grouping and limiting happen server-side; only the selected tasks' rows are looked up and returned,
+    through the ``task_id`` index created by DB/milking_kpis.py (``ensure_milking_indexes``).
+    """
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    return [
+        {"$match": query},
+        {"$project": {"task_id": 1, "start": 1, "_id": 0}},
+        {"$group": {"_id": "$task_id", "last_start": {"$max": "$start"}}},
+        {"$sort": {"last_start": -1}},
+        {"$limit": limit},
+        # localField/foreignField (rather than $expr) so each task is an index seek on task_id
+        {"$lookup": {
+            "from": "Milking_Data_Collection",
+            "localField": "_id",
+            "foreignField": "task_id",
+            "pipeline": [
+                {"$match": query},
+                {"$project": projection}
+            ],
+            "as": "rows"
+        }},
+        {"$unwind": "$rows"},
+        {"$replaceRoot": {"newRoot": "$rows"}},
+        {"$sort": {"start": -1}}
+    ]
+
+
+def build_milking_task_table(mongo_handler, cow_id, teat_id, start_date, end_date):
+    query = build_milking_query(cow_id, teat_id, start_date, end_date)
+
+    docs = mongo_handler.get_aggregated_documents("Milking_Data_Collection", recent_tasks_pipeline(query))
+
+    if not docs:
+        return html.Div("No data found for the selected filters."), []
+
+    df_last = typed_frame(docs, "Milking_Data_Collection")
+    last_task_ids = df_last["task_id"].drop_duplicates()
+
+    table = dash_table.DataTable(
+        id="milking-task-table",
+        columns=[
+            {"name": "Task ID", "id": "task_id"},
+            {"name": "Cow ID", "id": "cow_id"},
+            {"name": "Milk Quantity", "id": "milk_quantity"},
+            {"name": "AVG Flow Rate", "id": "flow_rate"},
+            {"name": "Teat ID", "id": "teat_id"},
+            {"name": "Start", "id": "start"},
+            {"name": "End", "id": "end"},
+        ],
+        data=df_last.to_dict("records"),
+        page_size=10
+    )
+
+    dropdown_options = [{"label": str(task_id), "value": task_id} for task_id in last_task_ids]
+
+    return table, dropdown_options
+
+
 def register_callbacks(app, mongo_handler):
     @app.callback(
         Output("milking-task-id-table", "children"),
         Output("milking-task-id-dropdown", "options"),
         Input("milking-analysis-type", "value"),
+        Input("milking-refresh-button", "n_clicks"),
         State("milking-filter-cow-id", "value"),
         State("milking-filter-teat-id", "value"),
         State("milking-filter-start-date", "date"),
         State("milking-filter-end-date", "date")
     )
-    def update_task_table(analysis_type, cow_id, teat_id, start_date, end_date):
+    def update_task_table(analysis_type, refresh_clicks, cow_id, teat_id, start_date, end_date):
+        refresh = ctx.triggered_id == "milking-refresh-button"
+        if analysis_type == 'anomalies':
+            return cached_anomaly_table(mongo_handler, cow_id, teat_id, start_date, end_date, refresh=refresh)
         if analysis_type != 'flow_over_time':
             return html.Div(), []
 
-        query = {}
-        if cow_id is not None:
-            query["cow_id"] = cow_id
-        if teat_id is not None:
-            query["teat_id"] = teat_id
-        if start_date and end_date:
-            query["start"] = {"$gte": pd.to_datetime(start_date), "$lte": pd.to_datetime(end_date)}
-
-        coll = mongo_handler.db["Milking_Data_Collection"]
-        docs = list(coll.find(query))
-
-        if not docs:
-            return html.Div("No data found for the selected filters."), []
-
-        for doc in docs:
-            doc["_id"] = str(doc["_id"])
-            doc["start"] = pd.to_datetime(doc["start"])
-            doc["end"] = pd.to_datetime(doc["end"])
-
-        df = pd.DataFrame(docs)
-        print(df)
-        df_sorted = df.sort_values("start", ascending=False)
-        last_task_ids = df_sorted["task_id"].drop_duplicates().head(10)
-        df_last = df[df["task_id"].isin(last_task_ids)].copy()
-        df_last = df_last.drop(columns=["flow_rate_data", "milk_quantity_data"], errors="ignore")
-        df_last = df_last.sort_values("start", ascending=False)
-
-        table = dash_table.DataTable(
-            id="milking-task-table",
-            columns=[
-                {"name": "Task ID", "id": "task_id"},
-                {"name": "Cow ID", "id": "cow_id"},
-                {"name": "Milk Quantity", "id": "milk_quantity"},
-                {"name": "AVG Flow Rate", "id": "flow_rate"},
-                {"name": "Teat ID", "id": "teat_id"},
-                {"name": "Start", "id": "start"},
-                {"name": "End", "id": "end"},
-            ],
-            data=df_last.to_dict("records"),
-            page_size=10
-        )
-
-        dropdown_options = [{"label": str(task_id), "value": task_id} for task_id in last_task_ids]
+        return cached_milking_task_table(mongo_handler, cow_id, teat_id, start_date, end_date, refresh=refresh)
 
-        return table, dropdown_options
+    @app.callback(
+        Output("milking-export-link", "children"),
+        Input("milking-export-button", "n_clicks"),
+        State("milking-filter-cow-id", "value"),
+        State("milking-filter-teat-id", "value"),
+        State("milking-filter-start-date", "date"),
+        State("milking-filter-end-date", "date"),
+        State("milking-export-format", "value"),
+        prevent_initial_call=True
+    )
+    def export_milking_data(n_clicks, cow_id, teat_id, start_date, end_date, fmt):
+        query = build_milking_query(cow_id, teat_id, start_date, end_date)
+        return export_link([(None, mongo_handler)], "Milking_Data_Collection", query, fmt, "milking_data")
 
     @app.callback(
         Output("milking-plot-container", "children"),
+        Output("milking-flow-spec", "data"),
         Input("milking-plot-button", "n_clicks"),
         State("milking-task-id-dropdown", "value"),
         State("rolling-window", "value"),
+        State("smoothing-kernel", "value"),
         Input("teat-selector", "value"),  # Add this input
+        State("milking-analysis-type", "value"),
+        State("milking-filter-cow-id", "value"),
+        State("milking-filter-teat-id", "value"),
+        State("milking-filter-start-date", "date"),
+        State("milking-filter-end-date", "date"),
+        State("milking-session-count", "value"),
+        State("milking-quantity-group", "value"),
+        State("milking-quantity-trend", "value"),
+        State("milking-kpi", "value"),
+        Input("milking-refresh-button", "n_clicks"),
         #
     # prevent_initial_call=True
     )
-    def plot_flow_for_task(n_clicks ,task_id , rolling_window , selected_teats):
-        import plotly.express as px
-        from plotly.subplots import make_subplots
-        import plotly.graph_objects as go
+    def plot_flow_for_task(n_clicks ,task_id , window_sec , kernel, selected_teats, analysis_type, cow_id, teat_id,
+                           start_date, end_date, session_count, quantity_group, quantity_trend, kpi, refresh_clicks):
+        refresh = ctx.triggered_id == "milking-refresh-button"
+        if analysis_type == "kpi_trends":
+            if not (n_clicks or refresh_clicks):
+                return html.Div("Choose the filters above and click Plot."), None
+            return cached_kpi_trend(mongo_handler, cow_id, teat_id, start_date, end_date, kpi, quantity_group,
+                                    refresh=refresh), None
+
+        if analysis_type == "quantity_distribution":
+            if not (n_clicks or refresh_clicks):
+                return html.Div("Choose the filters above and click Plot."), None
+            return cached_quantity_distribution(mongo_handler, cow_id, teat_id, start_date, end_date,
+                                                quantity_group, 'trend' in (quantity_trend or []),
+                                                refresh=refresh), None
+
+        if analysis_type == "flow_comparison":
+            if not (n_clicks or refresh_clicks):
+                return html.Div("Choose the sessions with the filters above and click Plot."), None
+            return build_flow_comparison(mongo_handler, cow_id, teat_id, start_date, end_date, selected_teats,
+                                         session_count, kernel, window_sec), None
+
         if not task_id:
-            return html.Div("Please select a Task ID to plot.")
-
-        coll = mongo_handler.db["Milking_Data_Collection"]
-        docs = list(coll.find({"task_id": task_id}))
-        if selected_teats:
-            docs = [doc for doc in docs if doc["teat_id"] in selected_teats]
-        from plotly.colors import DEFAULT_PLOTLY_COLORS
-
-        teat_colors = {
-            1: DEFAULT_PLOTLY_COLORS[0],
-            2: DEFAULT_PLOTLY_COLORS[1],
-            3: DEFAULT_PLOTLY_COLORS[2],
-            4: DEFAULT_PLOTLY_COLORS[3],
-        }
-
-        fig = go.Figure()
-        all_starts = [
-            pd.to_datetime(doc["start"]["$date"] if isinstance(doc["start"], dict) else doc["start"])
-            for doc in docs
-        ]
-        global_start = min(all_starts)
-
-        for doc in docs:
-            teat = doc["teat_id"]
-            flow_data = pd.Series(doc.get("flow_rate_data", []))
-            milk_data = pd.Series(doc.get("milk_quantity_data", []))
-            if flow_data.empty:
-                continue
-
-            start = pd.to_datetime(doc["start"]["$date"] if isinstance(doc["start"], dict) else doc["start"])
-            end = pd.to_datetime(doc["end"]["$date"] if isinstance(doc["end"], dict) else doc["end"])
-            duration_sec = (end - start).total_seconds()
-
-            # Align time to global start
-            x_values = [
-                (start - global_start).total_seconds() + i * duration_sec / (len(flow_data) - 1)
-                for i in range(len(flow_data))
-            ]
-
-            smoothed_flow = flow_data.rolling(window=rolling_window or 12, min_periods=1).mean()
-            smoothed_milk = milk_data.rolling(window=rolling_window or 12,
-                                              min_periods=1).mean() if not milk_data.empty else None
-
-            # FLOW trace (solid line)
-            fig.add_trace(go.Scatter(
-                x=x_values,
-                y=smoothed_flow,
+            return html.Div("Please select a Task ID to plot."), None
+
+        spec = {"task_id": task_id, "teats": selected_teats, "kernel": kernel, "window_sec": window_sec}
+        fig = build_flow_figure(mongo_handler, **spec)
+        if fig is None:
+            return html.Div("No flow data found for this task."), None
+        return dcc.Graph(id="milking-flow-graph", figure=fig), spec
+
+    @app.callback(
+        Output("milking-plot-container", "children", allow_duplicate=True),
+        Output("milking-flow-spec", "data", allow_duplicate=True),
+        Output("milking-task-id-dropdown", "value"),
+        Input("milking-anomaly-table", "active_cell"),
+        State("milking-anomaly-table", "derived_viewport_data"),
+        State("rolling-window", "value"),
+        State("smoothing-kernel", "value"),
+        State("teat-selector", "value"),
+        prevent_initial_call=True
+    )
+    def jump_to_anomaly(active_cell, rows, window_sec, kernel, selected_teats):
+        # Clicking a flagged session opens its flow curves
+        if not active_cell or not rows or active_cell["row"] >= len(rows):
+            raise PreventUpdate
+        task_id = rows[active_cell["row"]]["task_id"]
+        spec = {"task_id": task_id, "teats": selected_teats, "kernel": kernel, "window_sec": window_sec}
+        fig = build_flow_figure(mongo_handler, **spec)
+        if fig is None:
+            return html.Div("No flow data found for this task."), None, task_id
+        return dcc.Graph(id="milking-flow-graph", figure=fig), spec, task_id
+
+    @app.callback(
+        Output("milking-flow-graph", "figure"),
+        Input("milking-flow-graph", "relayoutData"),
+        State("milking-flow-spec", "data"),
+        prevent_initial_call=True
+    )
+    def reload_flow_on_zoom(relayout_data, spec):
+        if not relayout_data or not spec:
+            raise PreventUpdate
+
+        if "xaxis.range[0]" in relayout_data:
+            x_range = [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+        elif "xaxis.range" in relayout_data:
+            x_range = relayout_data["xaxis.range"]
+        elif relayout_data.get("xaxis.autorange"):
+            x_range = None
+        else:
+            raise PreventUpdate
+
+        fig = build_flow_figure(mongo_handler, x_range=[float(v) for v in x_range] if x_range else None, **spec)
+        if fig is None:
+            raise PreventUpdate
+        if x_range:
+            fig.update_xaxes(range=x_range)
+        return fig
+
+
+def cached_anomaly_table(mongo_handler, cow_id, teat_id, start_date, end_date, refresh=False):
+    key = figure_cache.make_key("milking_anomaly_table", cow_id, teat_id, start_date, end_date)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: build_anomaly_table(mongo_handler, cow_id, teat_id, start_date, end_date),
+        refresh=refresh
+    )
+
+
+def build_anomaly_table(mongo_handler, cow_id, teat_id, start_date, end_date, limit=500):
+    """Sessions flagged by DB/milking_anomalies.py for the filters, most recent first."""
+    query = build_milking_query(cow_id, teat_id, start_date, end_date)
+    docs = list(mongo_handler.db[ANOMALY_COLLECTION]
+                .find(query, {"_id": 0, "task_id": 1, "cow_id": 1, "teat_id": 1, "start": 1, "reasons": 1,
+                              "score": 1})
+                .sort("start", -1)
+                .limit(limit))
+    if not docs:
+        return html.Div("No flagged milkings for the selected filters (run python -m DB.milking_anomalies)."), []
+
+    df = pd.DataFrame(docs)
+    df["start"] = pd.to_datetime(df["start"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+    df["reasons"] = df["reasons"].apply(lambda reasons: ", ".join(r.replace("_", " ") for r in reasons or []))
+    df["score"] = pd.to_numeric(df["score"], errors="coerce").round(1)
+
+    table = dash_table.DataTable(
+        id="milking-anomaly-table",
+        columns=[
+            {"name": "Start", "id": "start"},
+            {"name": "Cow ID", "id": "cow_id"},
+            {"name": "Teat ID", "id": "teat_id"},
+            {"name": "Reasons", "id": "reasons"},
+            {"name": "Score", "id": "score"},
+            {"name": "Task ID", "id": "task_id"},
+        ],
+        data=df.to_dict("records"),
+        page_size=10,
+        sort_action="native",
+        style_cell={"cursor": "pointer"}
+    )
+    dropdown_options = [{"label": str(task_id), "value": task_id} for task_id in df["task_id"].drop_duplicates()]
+    return table, dropdown_options
+
+
+def cached_kpi_trend(mongo_handler, cow_id, teat_id, start_date, end_date, kpi, group_by, refresh=False):
+    key = figure_cache.make_key("milking_kpi_trend", cow_id, teat_id, start_date, end_date, kpi, group_by)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: build_kpi_trend(mongo_handler, cow_id, teat_id, start_date, end_date, kpi, group_by),
+        refresh=refresh
+    )
+
+
+def build_kpi_trend(mongo_handler, cow_id, teat_id, start_date, end_date, kpi="peak_flow", group_by=None):
+    """Daily mean of one session KPI (per cow or teat), read from the precomputed KPI collection only."""
+    query = build_milking_query(cow_id, teat_id, start_date, end_date)
+    group_by = group_by if group_by in ("cow_id", "teat_id") else None
+    pipeline = aggregate_pipeline(query, "start", kpi, "AVG", group_by, granularity="day")
+    df = unalias_columns(pd.DataFrame(mongo_handler.get_aggregated_documents(KPI_COLLECTION, pipeline)),
+                         ["start", kpi, group_by])
+    if df.empty:
+        return html.Div("No KPIs found for the selected filters (run python -m DB.milking_kpis to update them).")
+
+    label = {o["value"]: o["label"] for o in KPI_OPTIONS}.get(kpi, kpi)
+    fig = graph_mgr.create_line_chart(df, "start", kpi, f"Daily Mean {label}", group_column=group_by)
+    fig.update_layout(xaxis_title="Day", yaxis_title=label)
+    return dcc.Graph(figure=fig)
+
+
+def cached_quantity_distribution(mongo_handler, cow_id, teat_id, start_date, end_date, group_by, with_trend,
+                                 refresh=False):
+    key = figure_cache.make_key("milk_quantity", cow_id, teat_id, start_date, end_date, group_by, with_trend)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: build_quantity_distribution(mongo_handler, cow_id, teat_id, start_date, end_date, group_by,
+                                            with_trend),
+        refresh=refresh
+    )
+
+
+def fetch_quantity_histogram(mongo_handler, query, group_by=None, bins=HISTOGRAM_BINS):
+    """
+    Equal-width histogram of ``milk_quantity`` computed in Mongo: $bucket over the whole selection, or a
+    binned $group per cow/teat/day. Only scalar fields are read, never the flow arrays.
+    """
+    coll = "Milking_Data_Collection"
+    query = {"$and": [query, {"milk_quantity": {"$type": "number"}}]}
+    stats = mongo_handler.get_aggregated_documents(coll, value_range_pipeline(query, "milk_quantity"))
+    if not stats:
+        return pd.DataFrame(), 0
+    y_min, y_max = float(stats[0]["min"]), float(stats[0]["max"])
+    bin_width = (y_max - y_min) / bins or 1.0
+
+    if group_by:
+        group_expr = x_group_expr("start", "day") if group_by == "date" else None
+        pipeline = grouped_histogram_pipeline(query, "milk_quantity", group_by, y_min, bin_width, bins, group_expr)
+    else:
+        # $bucket boundaries are [lower, upper); nudge the last one so the maximum lands in the top bin
+        boundaries = [y_min + i * bin_width for i in range(bins)] + [np.nextafter(y_min + bins * bin_width, np.inf)]
+        pipeline = histogram_pipeline(query, "milk_quantity", boundaries)
+    return pd.DataFrame(mongo_handler.get_aggregated_documents(coll, pipeline)), bin_width
+
+
+def build_quantity_distribution(mongo_handler, cow_id, teat_id, start_date, end_date, group_by="none",
+                                with_trend=False):
+    query = build_milking_query(cow_id, teat_id, start_date, end_date)
+    group_by = None if group_by in (None, "none") else group_by
+
+    df, bin_width = fetch_quantity_histogram(mongo_handler, query, group_by)
+    if df.empty:
+        return html.Div("No milk quantity data found for the selected filters.")
+    if group_by == "date":
+        df["date"] = pd.to_datetime(df["date"]).dt.date.astype(str)
+
+    fig = graph_mgr.create_bar_chart(df, "bin_start", "count", "Milk Quantity Distribution",
+                                     group_column=group_by)
+    fig.update_traces(offset=0, width=bin_width)
+    fig.update_layout(barmode="stack", bargap=0, xaxis_title="Milk Quantity", yaxis_title="Sessions",
+                      legend_title={o["value"]: o["label"] for o in QUANTITY_GROUP_OPTIONS}.get(group_by))
+    graphs = [dcc.Graph(figure=fig)]
+
+    if with_trend:
+        # Daily mean milk quantity, per cow/teat when grouped by one (the day is already the X axis)
+        trend_group = group_by if group_by in ("cow_id", "teat_id") else None
+        pipeline = aggregate_pipeline(query, "start", "milk_quantity", "AVG", trend_group, granularity="day")
+        trend = unalias_columns(
+            pd.DataFrame(mongo_handler.get_aggregated_documents("Milking_Data_Collection", pipeline)),
+            ["start", "milk_quantity", trend_group])
+        if not trend.empty:
+            trend_fig = graph_mgr.create_line_chart(trend, "start", "milk_quantity", "Daily Mean Milk Quantity",
+                                                    group_column=trend_group)
+            trend_fig.update_layout(xaxis_title="Day", yaxis_title="Mean Milk Quantity")
+            graphs.append(dcc.Graph(figure=trend_fig))
+
+    return html.Div(graphs)
+
+
+def build_flow_comparison(mongo_handler, cow_id, teat_id, start_date, end_date, teats, session_count,
+                          kernel="sma", window_sec=None):
+    """
+    Median and percentile bands of the flow curves of the last ``session_count`` milkings matching the
+    filters (e.g. one cow's recent sessions, or every cow on one day), one band set per teat.
+
+    All curves arrive in one aggregation, are smoothed together and resampled onto a shared grid of
+    seconds since each session's start.
+    """
+    import plotly.graph_objects as go
+    from plotly.colors import DEFAULT_PLOTLY_COLORS
+
+    query = build_milking_query(cow_id, teat_id, start_date, end_date)
+    if teats and teat_id is None:
+        query["teat_id"] = {"$in": teats}
+    session_count = min(int(session_count or 20), FLOW_COMPARISON_MAX_SESSIONS)
+    pipeline = recent_tasks_pipeline(query, session_count, TASK_TABLE_FIELDS + ["flow_rate_data"])
+    docs = [decode_document(doc) for doc in
+            mongo_handler.get_aggregated_documents("Milking_Data_Collection", pipeline)]
+    if not docs:
+        return html.Div("No milking sessions found for the selected filters.")
+
+    fig = go.Figure()
+    n_sessions = len({doc["task_id"] for doc in docs})
+    for i, teat in enumerate(sorted({doc["teat_id"] for doc in docs})):
+        grid, curves = session_curves_on_grid([doc for doc in docs if doc["teat_id"] == teat],
+                                              FLOW_COMPARISON_GRID_POINTS, kernel or "sma", window_sec)
+        if grid is None:
+            continue
+        color = DEFAULT_PLOTLY_COLORS[i % len(DEFAULT_PLOTLY_COLORS)]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # grid points after every session ended
+            p10, p25, median, p75, p90 = np.nanpercentile(curves, [10, 25, 50, 75, 90], axis=0)
+        active = np.sum(~np.isnan(curves), axis=0)
+
+        for low, high, alpha in ((p10, p90, 0.12), (p25, p75, 0.25)):
+            fig.add_trace(go.Scatter(x=grid, y=high, mode="lines", line=dict(width=0), showlegend=False,
+                                     legendgroup=f"teat-{teat}", hoverinfo="skip"))
+            fig.add_trace(go.Scatter(x=grid, y=low, mode="lines", line=dict(width=0), fill="tonexty",
+                                     fillcolor=band_color(color, alpha), showlegend=False,
+                                     legendgroup=f"teat-{teat}", hoverinfo="skip"))
+        fig.add_trace(go.Scatter(
+            x=grid, y=median, mode="lines", name=f"Teat {teat} median ({len(curves)} sessions)",
+            legendgroup=f"teat-{teat}", line=dict(color=color, width=2), customdata=active,
+            hovertemplate=f"Teat {teat}<br>Time: %{{x:.1f}} sec<br>Median flow: %{{y:.3f}}"
+                          "<br>Sessions still milking: %{customdata}<extra></extra>"
+        ))
+
+    fig.update_layout(
+        title=f"Flow Rate Across {n_sessions} Sessions (median, 25–75% and 10–90% bands)",
+        xaxis_title="Time Since Session Start (seconds)",
+        yaxis_title="Flow Rate",
+        height=600,
+        hovermode="x unified",
+        template="plotly_white",
+        legend_title="Teat ID"
+    )
+    return dcc.Graph(figure=fig)
+
+
+def band_color(color, alpha=0.2):
+    return color.replace("rgb(", "rgba(").replace(")", f", {alpha})")
+
+
+def cached_flow_timeline(mongo_handler, task_id, teats, kernel, window_sec, x_range):
+    """Smoothed curves per (task, teats, kernel, window, zoom window); returns ``(timeline, factor)``."""
+    key = result_cache.make_key("flow_timeline", task_id, sorted(teats or []), kernel, window_sec, x_range)
+
+    def compute():
+        levels, factor = load_flow_levels(mongo_handler, task_id, teats, x_range, margin_sec=window_sec or 0)
+        return build_flow_timeline(levels, kernel, window_sec, FLOW_RESAMPLE_HZ), factor
+
+    return result_cache.get_or_compute(key, compute)
+
+
+def build_flow_figure(mongo_handler, task_id, teats=None, kernel="sma", window_sec=None, x_range=None):
+    """
+    Flow/milk curves of one task at the pyramid level matching the X window (whole session when None).
+
+    Reduced levels draw the bucket means with a min/max band so short spikes stay visible.
+    """
+    import plotly.graph_objects as go
+    from plotly.colors import DEFAULT_PLOTLY_COLORS
+
+    teat_colors = {
+        1: DEFAULT_PLOTLY_COLORS[0],
+        2: DEFAULT_PLOTLY_COLORS[1],
+        3: DEFAULT_PLOTLY_COLORS[2],
+        4: DEFAULT_PLOTLY_COLORS[3],
+    }
+
+    timeline, factor = cached_flow_timeline(mongo_handler, task_id, teats, kernel or "sma", window_sec, x_range)
+    if timeline is None:
+        return None
+    aligned = timeline["aligned"]
+    # Every trace of the figure counts towards the WebGL threshold
+    total_points = timeline["total_points"] + len(aligned["time"])
+
+    bands = list(flow_bands(timeline))
+
+    fig = go.Figure()
+    for i, (teat, flow_x, flow, milk_x, milk) in enumerate(teat_curves(timeline)):
+        if bands:
+            band_x, low, high = bands[i]
+            fig.add_trace(graph_mgr.scatter_trace(
+                band_x, high, total_points, mode="lines", line=dict(width=0), showlegend=False,
+                legendgroup=f"teat-{teat}", hoverinfo="skip"
+            ))
+            fig.add_trace(graph_mgr.scatter_trace(
+                band_x, low, total_points, mode="lines", line=dict(width=0), fill="tonexty",
+                fillcolor=band_color(teat_colors[teat]), showlegend=False, legendgroup=f"teat-{teat}",
+                hoverinfo="skip"
+            ))
+
+        # FLOW trace (solid line)
+        fig.add_trace(graph_mgr.scatter_trace(
+            flow_x,
+            flow,
+            total_points,
+            mode="lines+markers",
+            name=f"Teat {teat}",
+            legendgroup=f"teat-{teat}",
+            line=dict(color=teat_colors[teat], width=2, dash="solid"),
+            marker=dict(size=4),
+            hovertemplate=f"Teat {teat}<br>Time: %{{x:.1f}} sec<br>Flow: %{{y:.3f}}"
+        ))
+
+        # MILK trace (dotted line with same color)
+        if len(milk):
+            fig.add_trace(graph_mgr.scatter_trace(
+                milk_x,
+                milk,
+                total_points,
                 mode="lines+markers",
-                name=f"Teat {teat}",
-                line=dict(color=teat_colors[teat], width=2, dash="solid"),
+                name=f"Teat {teat} - Milk",
+                line=dict(color=teat_colors[teat], width=2, dash="dot"),
                 marker=dict(size=4),
-                hovertemplate=f"Teat {teat}<br>Time: %{{x:.1f}} sec<br>Flow: %{{y:.3f}}"
+                hovertemplate=f"Teat {teat} - Milk<br>Time: %{{x:.1f}} sec<br>Milk: %{{y:.3f}}"
             ))
 
-            # MILK trace (dotted line with same color)
-            if smoothed_milk is not None:
-                fig.add_trace(go.Scatter(
-                    x=x_values,
-                    y=smoothed_milk,
-                    mode="lines+markers",
-                    name=f"Teat {teat} - Milk",
-                    line=dict(color=teat_colors[teat], width=2, dash="dot"),
-                    marker=dict(size=4),
-                    hovertemplate=f"Teat {teat} - Milk<br>Time: %{{x:.1f}} sec<br>Milk: %{{y:.3f}}"
-                ))
-
-        fig.update_layout(
-            title=f"Flow Rate Over Duration (sec) for Task {task_id} COW: {doc['cow_id']}",
-            xaxis_title="Milking Duration (seconds)",
-            yaxis_title="Flow Rate / Milk Quantity",
-            height=600,
-            hovermode="x unified",
-            template="plotly_white",
-            legend_title="Teat ID"
-        )
-
-        return dcc.Graph(figure=fig)
+    # Total udder flow: the teats summed on their common time base
+    if len(timeline["teat_id"]) > 1:
+        fig.add_trace(graph_mgr.scatter_trace(
+            aligned["time"],
+            aligned["total_flow"],
+            total_points,
+            mode="lines",
+            name="Total udder flow",
+            line=dict(color="black", width=2),
+            hovertemplate="Total<br>Time: %{x:.1f} sec<br>Flow: %{y:.3f}"
+        ))
+
+    resolution = "full resolution" if factor == 1 else f"1/{factor} resolution, min–max band"
+    fig.update_layout(
+        title=f"Flow Rate Over Duration (sec) for Task {task_id} COW: {timeline['cow_id']} ({resolution})",
+        xaxis_title="Milking Duration (seconds)",
+        yaxis_title="Flow Rate / Milk Quantity",
+        height=600,
+        hovermode="x unified",
+        template="plotly_white",
+        legend_title="Teat ID",
+        uirevision=f"flow-{task_id}"
+    )
+    graph_mgr.mark_render_mode(fig, total_points)
+    return fig
@@ -1,10 +1,21 @@
 # mounting_tab.py
+import dash
 from dash import html, dcc, Input, Output, State, callback
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 from bson import ObjectId
+from GUI.gui_elements import default_date_range, create_export_controls, create_refresh_button
+from GUI.export_routes import export_link
+from UTILS.cache import figure_cache, result_cache
+from UTILS.estimation import wilson_interval, mean_half_width, scaled_count
+from UTILS.background_jobs import background_jobs
+from DB.mounting_pipelines import OUTCOME_GROUPS, mounting_outcome_pipeline
+from DB.typed_ingest import to_category_column
+from DB.mounting_attempts import attempt_pipeline, attempt_table, session_table, error_attempts, \
+    ERROR_HEATMAP_FACETS, error_heatmap_pipeline
+from config_py import PREVIEW_SAMPLE_SIZE, PREVIEW_POLL_INTERVAL_MS
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
@@ -18,36 +29,18 @@ ANALYSIS_OPTIONS = [
     {"label": "Success over time", "value": "success_over_time"},
     {"label": "Retries over time", "value": "retries_over_time"},
     {"label": "Error distribution by cow and teat", "value": "errors"},
-    {"label": "Error distribution over time", "value": "errors_over_time"},
+    {"label": "Error distribution over time by teat", "value": "errors_over_time"},
+    {"label": "Error distribution over time by cow", "value": "errors_over_time_by_cow"},
+    {"label": "Mounting success by farm and teat", "value": "success_by_farm"},
 
 ]
 
+# Analyses whose previews draw 95% confidence intervals; the others show scaled count estimates only
+PREVIEW_CI_ANALYSES = {"duration", "success", "success_by_farm"}
 
-def is_success(mounting_data):
-    if not isinstance(mounting_data, dict):
-        return 0
 
-    numeric_keys = [int(k) for k in mounting_data.keys() if k.isdigit()]
-    if not numeric_keys:
-        return 0
-
-    last_key = str(max(numeric_keys))
-    if isinstance(mounting_data[last_key], list):
-        return 1 if mounting_data[last_key][0] == "Mounted_successfully" else 0
-    return 0
-
-
-def mounting_retry(mounting_data):
-    if not isinstance(mounting_data, dict):
-        return 1
-
-    numeric_keys = [int(k) for k in mounting_data.keys() if k.isdigit()]
-    if not numeric_keys:
-        return 1
-    print(max(numeric_keys))
-    return max(numeric_keys)
-
-def mounting_layout(mongo_handler):
+def mounting_layout(farm_manager):
+    default_start, default_end = default_date_range()
     return dbc.Container([
         html.H4("Mounting Data Analysis", className="my-3"),
         dbc.Row([
@@ -69,437 +62,565 @@ def mounting_layout(mongo_handler):
             ], width=2),
             dbc.Col([
                 dbc.Label("Start Date"),
-                dcc.DatePickerSingle(id="filter-start-date" ,date=(datetime.now() - timedelta(days=7)).date() )
+                dcc.DatePickerSingle(id="filter-start-date", date=default_start)
             ], width=2),
             dbc.Col([
                 dbc.Label("End Date"),
-                dcc.DatePickerSingle(id="filter-end-date", date=(datetime.now()+ timedelta(days=1)).date())
+                dcc.DatePickerSingle(id="filter-end-date", date=default_end)
             ], width=2)
         ], className="mb-3"),
         dbc.Row([
             dbc.Col([
-                dbc.Button("Plot", id="mounting-plot-button", color="primary", className="me-2")
+                dbc.Label("Farms"),
+                dcc.Dropdown(
+                    id="mounting-filter-farms",
+                    options=[{"label": f, "value": f} for f in farm_manager.farm_names],
+                    value=farm_manager.default_farms(),
+                    multi=True
+                )
+            ], width=4),
+            dbc.Col([
+                dbc.Checklist(
+                    id="mounting-preview-mode",
+                    options=[{"label": "Fast preview from a sample, then refine", "value": "preview"}],
+                    value=[],
+                    className="mt-4"
+                )
+            ], width=3),
+            dbc.Col([
+                dbc.Button("Plot", id="mounting-plot-button", color="primary", className="mt-4 me-2"),
+                html.Span(create_refresh_button("mounting"), className="mt-4 d-inline-block")
             ])
         ], className="mb-3"),
+        create_export_controls("mounting"),
+        dcc.Store(id="mounting-refine-job"),
+        dcc.Interval(id="mounting-refine-interval", interval=PREVIEW_POLL_INTERVAL_MS, disabled=True),
         dcc.Loading(html.Div(id="mounting-plot-container"), type="circle")
     ], fluid=True)
 
-def register_callbacks(app, mongo_handler):
+def register_callbacks(app, farm_manager):
 
     @app.callback(
         Output("mounting-plot-container", "children"),
+        Output("mounting-refine-job", "data"),
+        Output("mounting-refine-interval", "disabled"),
         Input("mounting-plot-button", "n_clicks"),
+        Input("mounting-refresh-button", "n_clicks"),
         State("mounting-analysis-type", "value"),
         State("filter-cow-id", "value"),
         State("filter-teat-id", "value"),
         State("filter-start-date", "date"),
-        State("filter-end-date", "date")
+        State("filter-end-date", "date"),
+        State("mounting-filter-farms", "value"),
+        State("mounting-preview-mode", "value"),
+        State("mounting-refine-job", "data")
     )
-    def analyze_mounting_data(n_clicks, analysis_type, cow_id, teat_id, start_date, end_date):
-        import plotly.express as px
-        from plotly.subplots import make_subplots
-        import plotly.graph_objects as go
-        if not n_clicks or not analysis_type:
-            return html.Div("Select analysis type and click Plot.")
-
-        # === Build MongoDB query ===
-        query = {}
-        if cow_id is not None:
-            query["cow_id"] = cow_id
-        if teat_id is not None:
-            query["teat_id"] = teat_id
-        if start_date and end_date:
-            query["start"] = {
-                "$gte": pd.to_datetime(start_date),
-                "$lte": pd.to_datetime(end_date)
-            }
-
-        # === Fetch Data ===
-        coll = mongo_handler.db["Mounting_Data_Collection"]
-        docs = list(coll.find(query))
-
-        if not docs:
-            return html.Div("No data found for the selected filters.")
-
-        # === Convert to DataFrame ===
-        for doc in docs:
-            doc["_id"] = str(doc["_id"])  # make _id serializable
-            doc["start"] = pd.to_datetime(doc["start"]["$date"]) if isinstance(doc["start"], dict) else pd.to_datetime(doc["start"])
-            doc["end"] = pd.to_datetime(doc["end"]["$date"]) if isinstance(doc["end"], dict) else pd.to_datetime(doc["end"])
-            doc["duration_sec"] = (doc["end"] - doc["start"]).total_seconds()
+    def analyze_mounting_data(n_clicks, refresh_clicks, analysis_type, cow_id, teat_id, start_date, end_date, farms,
+                              preview_flag, previous_job):
+        if not (n_clicks or refresh_clicks) or not analysis_type:
+            return html.Div("Select analysis type and click Plot."), None, True
+        if previous_job:
+            # A new plot supersedes a refinement that has not been swapped in yet
+            background_jobs.discard(previous_job)
+        farms = farms or farm_manager.default_farms()
+        args = (farm_manager, analysis_type, cow_id, teat_id, start_date, end_date, farms)
+        if dash.ctx.triggered_id == "mounting-refresh-button":
+            return cached_mounting_analysis(*args, refresh=True), None, True
+
+        if 'preview' in (preview_flag or []):
+            cached = figure_cache.get(mounting_cache_key(*args[1:]))
+            if cached is not None:
+                return cached, None, True
+            # Sampled answer now; swap_in_exact_mounting replaces it once the full analysis is cached
+            job = background_jobs.submit(cached_mounting_analysis, *args)
+            preview, _ = build_mounting_analysis(*args, sample_size=PREVIEW_SAMPLE_SIZE)
+            return preview, job, False
+
+        return cached_mounting_analysis(*args), None, True
 
+    @app.callback(
+        Output("mounting-plot-container", "children", allow_duplicate=True),
+        Output("mounting-refine-interval", "disabled", allow_duplicate=True),
+        Input("mounting-refine-interval", "n_intervals"),
+        State("mounting-refine-job", "data"),
+        prevent_initial_call=True
+    )
+    def swap_in_exact_mounting(n_intervals, job):
+        if not job:
+            return dash.no_update, True
+        done, result = background_jobs.poll(job)
+        if not done:
+            raise dash.exceptions.PreventUpdate
+        if result is None:
+            return dash.no_update, True
+        return result, True
+
+    @app.callback(
+        Output("mounting-export-link", "children"),
+        Input("mounting-export-button", "n_clicks"),
+        State("filter-cow-id", "value"),
+        State("filter-teat-id", "value"),
+        State("filter-start-date", "date"),
+        State("filter-end-date", "date"),
+        State("mounting-filter-farms", "value"),
+        State("mounting-export-format", "value"),
+        prevent_initial_call=True
+    )
+    def export_mounting_data(n_clicks, cow_id, teat_id, start_date, end_date, farms, fmt):
+        query = build_mounting_query(cow_id, teat_id, start_date, end_date)
+        sources = [(name, farm_manager.farms[name]) for name in (farms or farm_manager.default_farms())]
+        return export_link(sources, "Mounting_Data_Collection", query, fmt, "mounting_data")
+
+
+def add_wilson_errors(grouped):
+    """Adds ``ci_low``/``ci_high`` error-bar lengths (percent points) around ``success_percent``."""
+    low, high = wilson_interval(grouped["success_rate"] * grouped["trial_count"], grouped["trial_count"])
+    grouped["ci_low"] = (grouped["success_percent"] - low * 100).clip(lower=0)
+    grouped["ci_high"] = (high * 100 - grouped["success_percent"]).clip(lower=0)
+
+
+def preview_farm_totals(farm_manager, query, farms):
+    """Matching mounting documents per farm, the population each farm's ``$sample`` is drawn from."""
+    totals, _ = farm_manager.fan_out(
+        lambda manager: manager.db["Mounting_Data_Collection"].count_documents(query), farms)
+    return totals
+
+
+def scale_preview_counts(df, columns, farm_totals, sample_size):
+    """Turns per-farm ``$sample`` counts in ``columns`` into estimates for each farm's full set, in place."""
+    for column in columns:
+        df[column] = df[column].astype("float64")
+    for farm, total in farm_totals.items():
+        rows = df["farm"] == farm
+        for column in columns:
+            estimate, _ = scaled_count(df.loc[rows, column], min(sample_size, total), total)
+            df.loc[rows, column] = estimate.round()
+
+
+def build_mounting_query(cow_id, teat_id, start_date, end_date):
+    query = {}
+    if cow_id is not None:
+        query["cow_id"] = cow_id
+    if teat_id is not None:
+        query["teat_id"] = teat_id
+    if start_date and end_date:
+        query["start"] = {
+            "$gte": pd.to_datetime(start_date),
+            "$lte": pd.to_datetime(end_date)
+        }
+    return query
+
+
+def mounting_cache_key(analysis_type, cow_id, teat_id, start_date, end_date, farms):
+    return figure_cache.make_key("mounting", analysis_type, cow_id, teat_id, start_date, end_date, sorted(farms))
+
+
+def cached_mounting_analysis(farm_manager, analysis_type, cow_id, teat_id, start_date, end_date, farms,
+                             refresh=False, ttl=None):
+    """Full analysis from the figure cache; results with a farm unavailable are returned but not cached."""
+    farm_errors = {}
+
+    def compute():
+        content, errors = build_mounting_analysis(farm_manager, analysis_type, cow_id, teat_id, start_date,
+                                                  end_date, farms, refresh=refresh)
+        farm_errors.update(errors)
+        return content
+
+    return figure_cache.get_or_compute(
+        mounting_cache_key(analysis_type, cow_id, teat_id, start_date, end_date, farms),
+        compute, refresh=refresh, cacheable=lambda _: not farm_errors, ttl=ttl
+    )
+
+
+def fetch_attempt_table(farm_manager, query, farms, sample_size=None, refresh=False):
+    """
+    Attempt-level table (DB/mounting_attempts.py) for the query, shared by the non-outcome analyses.
+
+    Full tables are cached per query and farms, so switching analysis reuses one fetch; partial results
+    (a farm unavailable) and previews are not cached. ``refresh=True`` refetches a cached table.
+    """
+    key = result_cache.make_key("mounting_attempts", query, sorted(farms))
+    if not sample_size and not refresh:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached, {}
+
+    rows, farm_errors = farm_manager.aggregate("Mounting_Data_Collection", attempt_pipeline(query, sample_size),
+                                               farms=farms)
+    attempts = attempt_table(rows)
+    if not sample_size and not farm_errors:
+        result_cache.set(key, attempts)
+    return attempts, farm_errors
+
+
+def build_mounting_analysis(farm_manager, analysis_type, cow_id, teat_id, start_date, end_date, farms,
+                            sample_size=None, refresh=False):
+    """
+    Returns the analysis content and the errors of unavailable farms.
+
+    ``sample_size`` renders an approximate preview from a ``$sample`` of that many documents per farm.
+    """
+    query = build_mounting_query(cow_id, teat_id, start_date, end_date)
+
+    # === Fetch Data (fanned out to every selected farm) ===
+    if analysis_type in OUTCOME_GROUPS:
+        # Success/retries are derived and grouped in Mongo; only the grouped rows come back
+        pipeline = mounting_outcome_pipeline(query, analysis_type, sample_size)
+        docs, farm_errors = farm_manager.aggregate("Mounting_Data_Collection", pipeline, farms=farms)
+        df = pd.DataFrame(docs)
+    elif analysis_type in ERROR_HEATMAP_FACETS:
+        # Error counts per day, code and teat/cow in one aggregation
+        pipeline = error_heatmap_pipeline(query, ERROR_HEATMAP_FACETS[analysis_type], sample_size)
+        docs, farm_errors = farm_manager.aggregate("Mounting_Data_Collection", pipeline, farms=farms)
         df = pd.DataFrame(docs)
-        # print(df["duration_sec"])
-
-        if analysis_type == "duration":
-            # Group by cow and teat
-
-            df["cow_id"] = df["cow_id"].astype(str)
-            df["teat_id"] = df["teat_id"].astype(str)
-            df["duration_sec"] = df["duration_sec"].round(1)
-            df = df[df["duration_sec"] < 7200]  # filter out corrupted rows
-            df = df[df["duration_sec"] > 0]  # optional: remove zero/negative
-
-            grouped = df.groupby(["cow_id", "teat_id"])["duration_sec"].mean().reset_index()
-
-            print(grouped)
-            fig = px.bar(
-                grouped,
-                x="cow_id",
-                y="duration_sec",
-                color="teat_id",
-                barmode="group",  # show side-by-side bars
-                labels={"duration_sec": "Average Mounting Duration (sec)", "cow_id": "Cow ID", "teat_id": "Teat"},
-                title="Average Mounting Duration by Cow and Teat"
-            )
-
-            return dcc.Graph(figure=fig)
-        # Mounting Success
-        elif analysis_type == "success":
-            # Determine success per document
-
-
-            # Apply function to each row
-            df["success"] = df["Mounting_data"].apply(is_success)
-
-            df["cow_id"] = df["cow_id"].astype(str)
-            df["teat_id"] = df["teat_id"].astype(str)
-            # print(df[df["cow_id"] == "60"])
-            # print(df[df["teat_id"] == "2"])
-            # print(df[(df["cow_id"] == "60") & (df["teat_id"] == "2")])
-            grouped = df.groupby(["cow_id", "teat_id"]).agg(
-                success_rate=("success", "mean"),
-                trial_count=("success", "count")
-            ).reset_index()
-
-            grouped["success_percent"] = grouped["success_rate"] * 100
-            grouped["label"] = grouped["success_percent"].round(1).astype(str) + "% (" + grouped["trial_count"].astype(
-                str) + " trials)"
-            print(grouped)
-
-            fig = px.bar(
-                grouped,
-                x="cow_id",
-                y="success_percent",
-                color="teat_id",
-                barmode="group",
-                text=grouped["label"],
-                labels={
-                    "success_percent": "Mounting Success Rate (%)",
-                    "cow_id": "Cow ID",
-                    "teat_id": "Teat ID"
-                },
-                title="Mounting Success Rate by Cow and Teat"
-            )
-            fig.update_traces(textposition="auto")
-            fig.update_yaxes(range=[0, 100])
-
-            return dcc.Graph(figure=fig)
-
-        elif analysis_type == "retries":
-
-
-            # Apply function to each row
-            df["success"] = df["Mounting_data"].apply(is_success)
-            df["mounting_retry"] = df["Mounting_data"].apply(mounting_retry)
-
-            df["cow_id"] = df["cow_id"].astype(str)
-            df["teat_id"] = df["teat_id"].astype(str)
-            grouped = df.groupby(["cow_id", "teat_id"]).agg(
-                mounting_retry=("mounting_retry", "sum"),
-                trial_count=("success", "sum")
-            ).reset_index()
-
-            grouped["retry_to_success"] = grouped["mounting_retry"] / grouped["trial_count"]
-            grouped["label"] = grouped["retry_to_success"].round(1).astype(str) + " (" + grouped["mounting_retry"].astype(
-                str) + " Mounting trials)"
-            print(grouped)
-
-            fig = px.bar(
-                grouped,
-                x="cow_id",
-                y="retry_to_success",
-                color="teat_id",
-                barmode="group",
-                text=grouped["label"],
-                labels={
-                    "retry_to_success": "Mounting retry to Success AVG ",
-                    "cow_id": "Cow ID",
-                    "teat_id": "Teat ID"
-                },
-                title="Mounting Retry to Success  by Cow and Teat"
-            )
-            fig.update_traces(textposition="auto")
-            return dcc.Graph(figure=fig)
-        elif analysis_type == "success_over_time":
-            df["success"] = df["Mounting_data"].apply(is_success)
-            df["cow_id"] = df["cow_id"].astype(str)
-            df["teat_id"] = df["teat_id"].astype(str)
-            df["date"] = df["start"].dt.date.astype(str)
-
-            grouped = df.groupby(["date", "cow_id", "teat_id"]).agg(
-                success_rate=("success", "mean"),
-                trial_count=("success", "count")
-            ).reset_index()
-            grouped["annotation"] = grouped["trial_count"].astype(str) + " trials"
-
-            fig = px.line(
-                grouped,
-                x="date",
-                y="success_rate",
-                color="teat_id",
-                line_group="cow_id",
-                markers=True,
-                labels={
-                    "success_rate": "Success Rate",
-                    "date": "Date",
-                    "teat_id": "Teat ID"
-                },
-                title="Mounting Success Rate Over Time by Cow and Teat",
-                text="annotation"  # 👈 this adds text annotations
-            )
-
-            fig.update_yaxes(range=[0, 1])
-            fig.update_layout(
-                title={
-                    "text": "Mounting Success Rate Over Time by Cow and Teat",
-                    "x": 0.5,
-                    "xanchor": "center",
-                    "font": dict(size=20)
-                },
-                xaxis_title="Date",
-                yaxis_title="Success Rate",
-                legend_title="Teat, Cow",
-                legend=dict(
-                    orientation="h",
-                    yanchor="top",
-                    y=-0.3,
-                    xanchor="center",
-                    x=0.5
-                ),
-                hovermode="x unified",
-                template="simple_white",
-                margin=dict(l=40, r=20, t=60, b=60),
-            )
-            fig.update_traces(
-                mode="lines+markers",
-                marker=dict(size=6),
-                line=dict(width=2),
-            )
-            fig.update_traces(textposition="top center", textfont_size=12)
-
-            fig.update_xaxes(
-                tickformat="%b %d",  # Format as "May 01"
-                tickangle=45,
-                dtick="D1"  # Force daily ticks if many days
-            )
-
-            return dcc.Graph(figure=fig)
-
-        elif analysis_type == "retries_over_time":
-            df["success"] = df["Mounting_data"].apply(is_success)
-            df["mounting_retry"] = df["Mounting_data"].apply(mounting_retry)
-            df["cow_id"] = df["cow_id"].astype(str)
-            df["teat_id"] = df["teat_id"].astype(str)
-            df["date"] = df["start"].dt.date.astype(str)
-
-            grouped = df.groupby(["date", "cow_id", "teat_id"]).agg(
-                total_retries=("mounting_retry", "sum"),
-                total_successes=("success", "sum")
-            ).reset_index()
-
-            # Avoid division by zero
-            grouped = grouped[grouped["total_successes"] > 0]
-
-            # Calculate retries per success
-            grouped["retries_per_success"] = grouped["total_retries"] / grouped["total_successes"]
-
-            # Format annotation
-            # grouped["annotation"] = grouped["retries_per_success"].round(1).astype(str) + \
-            #                         "× (" + grouped["total_retries"].astype(str) + " retries)"
-
-            fig = px.line(
-                grouped,
-                x="date",
-                y="retries_per_success",
-                color="teat_id",
-                line_group="cow_id",
-                markers=True,
-                # text="annotation",
-                hover_data={
-                    "date": False,
-                    "cow_id": False,
-                    "teat_id": True,
-                    "total_retries": True,
-                    "total_successes": True,
-                    "retries_per_success": ':.2f'
-                },
-                labels={
-                    "retries_per_success": "Retries per Success",
-                    "date": "Date",
-                    "teat_id": "Teat ID"
-                },
-                title="📈 Daily Retries Needed per Successful Mounting (by Cow and Teat)"
-            )
-
-            fig.update_layout(
-                title_font_size=18,
-                title_x=0.5,
-                legend_title_text="Teat ID",
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="right",
-                    x=1
-                ),
-                xaxis=dict(
-                    tickangle=-45,
-                    tickformat="%b %d"
-                ),
-                yaxis=dict(
-                    title="Retries per Success",
-                    rangemode="tozero"
-                ),
-                plot_bgcolor="rgba(248, 248, 255, 1)",
-                paper_bgcolor="white",
-                hovermode="x unified"
-            )
-
-            fig.update_traces(
-                textposition="top center",
-                textfont_size=12,
-                line=dict(width=2),
-                marker=dict(size=8)
-            )
-
-            return dcc.Graph(figure=fig)
-        elif analysis_type == "errors":
-            from collections import defaultdict
-
-            # Create a list of all error occurrences
-            error_records = []
-
-            for _, row in df.iterrows():
-                cow = row["cow_id"]
-                teat = row["teat_id"]
-                mounting_data = row.get("Mounting_data", {})
-
-                if isinstance(mounting_data, dict):
-                    for attempt, entry in mounting_data.items():
-                        if isinstance(entry, list) and isinstance(entry[0], int):  # Error code
-                            error_code = entry[0]
-                            error_records.append({
-                                "cow_id": str(cow),
-                                "teat_id": str(teat),
-                                "error_code": str(error_code)
-                            })
-
-            # Convert to DataFrame
-            error_df = pd.DataFrame(error_records)
-
-            # Group by cow, teat, and error
-            grouped = error_df.groupby(["cow_id", "teat_id", "error_code"]).size().reset_index(name="count")
-
-            # Optional: Pivot for heatmap-style plot
-            pivot = grouped.pivot_table(index=["cow_id", "teat_id"], columns="error_code", values="count",
-                                        fill_value=0).reset_index()
-
-            # Or use bar chart
-            import plotly.express as px
-            grouped["label"] = grouped["error_code"].astype(str)
-            fig = px.bar(
-                grouped,
-                x="cow_id",
-                y="count",
-                color="label",
-                barmode="stack",
-                facet_col="teat_id",
-                labels={"count": "Error Count", "cow_id": "Cow ID", "label": "Error Code"},
-                title="🚨 Error Distribution by Cow and Teat"
-            )
-            return dcc.Graph(figure=fig)
-
-        elif analysis_type == "errors_over_time":
-            # Extract error entries with date
-            error_records = []
-
-            for _, row in df.iterrows():
-                cow = row["cow_id"]
-                teat = row["teat_id"]
-                start = row["start"].date()
-                mounting_data = row.get("Mounting_data", {})
-
-                if isinstance(mounting_data, dict):
-                    for key, entry in mounting_data.items():
-                        if isinstance(entry, list) and isinstance(entry[0], int):  # Error code
-                            error_code = entry[0]
-                            error_records.append({
-                                "cow_id": str(cow),
-                                "teat_id": str(teat),
-                                "date": start,
-                                "error_code": str(error_code)
-                            })
-
-            if not error_records:
-                return html.Div("No errors found for selected filters.")
-
-            error_df = pd.DataFrame(error_records)
-
-            # Group by date, cow, teat, and error
-            grouped = error_df.groupby(["date", "cow_id", "teat_id", "error_code"]).size().reset_index(name="count")
-            grouped["label"] = grouped["error_code"] + " (" + grouped["count"].astype(str) + ")"
-            grouped["teat_label"] = "Cow " + grouped["cow_id"].astype(str) + " - Teat " + grouped["teat_id"].astype(str)
-            grouped["text"] = grouped["label"]
-
-            teat_ids = sorted(grouped["teat_id"].unique())
-            fig = make_subplots(
-                rows=len(teat_ids),
-                cols=1,
-                shared_xaxes=True,
-                vertical_spacing=0.05,
-                subplot_titles=[f"Teat ID = {teat}" for teat in teat_ids]
-            )
-
-            # Add one subplot per teat ID
-            for i, teat in enumerate(teat_ids):
-                sub_df = grouped[grouped["teat_id"] == teat]
-                for error in sub_df["error_code"].unique():
-                    error_data = sub_df[sub_df["error_code"] == error]
-                    fig.add_trace(
-                        go.Scatter(
-                            x=error_data["date"],
-                            y=error_data["count"],
-                            mode="lines+markers",
-                            name=f"{error}",
-                            text=error_data["label"],
-                            hovertemplate=(
-                                    "Date: %{x|%Y-%m-%d}<br>" +
-                                    "Error: %{text}<br>" +
-                                    "Count: %{y}<extra></extra>"
-                            ),
-                            legendgroup=str(error),
-                            showlegend=(i == 0)
-                        ),
-                        row=i + 1,
-                        col=1
-                    )
-
-            # Layout tweaks
-            fig.update_layout(
-                hovermode="x unified",
-                height=400 * len(teat_ids),
-                title="Error Distribution Over Time by Cow and Teat",
-                xaxis_title="Date",
-                yaxis_title="Error Count",
-                margin=dict(t=100)
-            )
-
-            fig.update_yaxes(title_text="Error Count")
-            fig.update_xaxes(title_text="Date")
-            fig.for_each_xaxis(lambda ax: ax.update(showticklabels=True))
-
-            return dcc.Graph(figure=fig)
-
-        # Placeholder for other analysis types
-        return html.Div("This analysis is not implemented yet.")
+    else:
+        df, farm_errors = fetch_attempt_table(farm_manager, query, farms, sample_size, refresh)
+
+    if df.empty:
+        content = html.Div("No data found for the selected filters.")
+    else:
+        farm_totals = preview_farm_totals(farm_manager, query, farms) if sample_size else None
+        content = render_mounting_analysis(df, analysis_type, multi_farm=len(farms) > 1,
+                                           sample_size=sample_size, farm_totals=farm_totals)
+        if sample_size and isinstance(content, dcc.Graph):
+            title = content.figure.layout.title.text or ""
+            basis = "(95% CI)" if analysis_type in PREVIEW_CI_ANALYSES else "(estimated counts)"
+            content.figure.update_layout(
+                title_text=f"{title} — preview from up to {sample_size:,} documents per farm {basis}, refining…")
+
+    if farm_errors:
+        warnings = [dbc.Alert(f"Farm {name} unavailable: {error}", color="warning", className="py-1 mb-1")
+                    for name, error in farm_errors.items()]
+        return html.Div(warnings + [content]), farm_errors
+    return content, farm_errors
+
+
+def render_mounting_analysis(df, analysis_type, multi_farm=False, sample_size=None, farm_totals=None):
+    """
+    ``df`` holds the grouped rows of the outcome analyses (DB/mounting_pipelines.py), otherwise the
+    attempt table (DB/mounting_attempts.py).
+
+    For a preview, ``sample_size`` is the per-farm ``$sample`` size and ``farm_totals`` the matching
+    documents per farm; counts are scaled to full-set estimates and rates/means get 95% intervals.
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    preview = bool(sample_size)
+    # The attempt table may be shared through the cache; never modify it in place
+    df = df.copy()
+    if multi_farm and "cow_id" in df:
+        # Qualify cow ids with their farm so cows from different farms never share a bar/line
+        df["cow_id"] = to_category_column(df["farm"].astype(str) + ":" + df["cow_id"].astype(str))
+    # print(df["duration_sec"])
+
+    if analysis_type == "duration":
+        # Group by cow and teat
+        df = session_table(df)
+        df["duration_sec"] = df["duration_sec"].round(1)
+        df = df[df["duration_sec"] < 7200]  # filter out corrupted rows
+        df = df[df["duration_sec"] > 0]  # optional: remove zero/negative
+
+        grouped = df.groupby(["cow_id", "teat_id"], observed=True)["duration_sec"] \
+            .agg(["mean", "std", "count"]).reset_index()
+        grouped = grouped.rename(columns={"mean": "duration_sec"})
+        grouped["ci"] = mean_half_width(grouped["std"].fillna(0), grouped["count"])
+
+        fig = px.bar(
+            grouped,
+            x="cow_id",
+            y="duration_sec",
+            color="teat_id",
+            barmode="group",  # show side-by-side bars
+            error_y="ci" if preview else None,
+            labels={"duration_sec": "Average Mounting Duration (sec)", "cow_id": "Cow ID", "teat_id": "Teat"},
+            title="Average Mounting Duration by Cow and Teat"
+        )
+
+        return dcc.Graph(figure=fig)
+    # Mounting Success
+    elif analysis_type == "success":
+        grouped = df
+        grouped["cow_id"] = grouped["cow_id"].astype(str)
+        grouped["teat_id"] = grouped["teat_id"].astype(str)
+
+        grouped["success_percent"] = grouped["success_rate"] * 100
+        grouped["label"] = grouped["success_percent"].round(1).astype(str) + "% (" + grouped["trial_count"].astype(
+            str) + " trials)"
+        add_wilson_errors(grouped)
+
+        fig = px.bar(
+            grouped,
+            x="cow_id",
+            y="success_percent",
+            color="teat_id",
+            barmode="group",
+            text=grouped["label"],
+            error_y="ci_high" if preview else None,
+            error_y_minus="ci_low" if preview else None,
+            labels={
+                "success_percent": "Mounting Success Rate (%)",
+                "cow_id": "Cow ID",
+                "teat_id": "Teat ID"
+            },
+            title="Mounting Success Rate by Cow and Teat"
+        )
+        fig.update_traces(textposition="auto")
+        fig.update_yaxes(range=[0, 100])
+
+        return dcc.Graph(figure=fig)
+
+    elif analysis_type == "retries":
+        grouped = df
+        grouped["cow_id"] = grouped["cow_id"].astype(str)
+        grouped["teat_id"] = grouped["teat_id"].astype(str)
+
+        if preview:
+            scale_preview_counts(grouped, ["mounting_retry", "trial_count"], farm_totals, sample_size)
+        grouped["retry_to_success"] = grouped["mounting_retry"] / grouped["trial_count"]
+        grouped["label"] = grouped["retry_to_success"].round(1).astype(str) + " (" + grouped["mounting_retry"].astype(
+            int).astype(str) + " Mounting trials)"
+
+        fig = px.bar(
+            grouped,
+            x="cow_id",
+            y="retry_to_success",
+            color="teat_id",
+            barmode="group",
+            text=grouped["label"],
+            labels={
+                "retry_to_success": "Mounting retry to Success AVG ",
+                "cow_id": "Cow ID",
+                "teat_id": "Teat ID"
+            },
+            title="Mounting Retry to Success  by Cow and Teat"
+        )
+        fig.update_traces(textposition="auto")
+        return dcc.Graph(figure=fig)
+    elif analysis_type == "success_over_time":
+        grouped = df
+        grouped["cow_id"] = grouped["cow_id"].astype(str)
+        grouped["teat_id"] = grouped["teat_id"].astype(str)
+        grouped["annotation"] = grouped["trial_count"].astype(str) + " trials"
+
+        fig = px.line(
+            grouped,
+            x="date",
+            y="success_rate",
+            color="teat_id",
+            line_group="cow_id",
+            markers=True,
+            labels={
+                "success_rate": "Success Rate",
+                "date": "Date",
+                "teat_id": "Teat ID"
+            },
+            title="Mounting Success Rate Over Time by Cow and Teat",
+            text="annotation"  # 👈 this adds text annotations
+        )
+
+        fig.update_yaxes(range=[0, 1])
+        fig.update_layout(
+            title={
+                "text": "Mounting Success Rate Over Time by Cow and Teat",
+                "x": 0.5,
+                "xanchor": "center",
+                "font": dict(size=20)
+            },
+            xaxis_title="Date",
+            yaxis_title="Success Rate",
+            legend_title="Teat, Cow",
+            legend=dict(
+                orientation="h",
+                yanchor="top",
+                y=-0.3,
+                xanchor="center",
+                x=0.5
+            ),
+            hovermode="x unified",
+            template="simple_white",
+            margin=dict(l=40, r=20, t=60, b=60),
+        )
+        fig.update_traces(
+            mode="lines+markers",
+            marker=dict(size=6),
+            line=dict(width=2),
+        )
+        fig.update_traces(textposition="top center", textfont_size=12)
+
+        fig.update_xaxes(
+            tickformat="%b %d",  # Format as "May 01"
+            tickangle=45,
+            dtick="D1"  # Force daily ticks if many days
+        )
+
+        return dcc.Graph(figure=fig)
+
+    elif analysis_type == "retries_over_time":
+        grouped = df
+        grouped["cow_id"] = grouped["cow_id"].astype(str)
+        grouped["teat_id"] = grouped["teat_id"].astype(str)
+
+        if preview:
+            scale_preview_counts(grouped, ["total_retries", "total_successes"], farm_totals, sample_size)
+        # Avoid division by zero
+        grouped = grouped[grouped["total_successes"] > 0]
+
+        # Calculate retries per success
+        grouped["retries_per_success"] = grouped["total_retries"] / grouped["total_successes"]
+
+        # Format annotation
+        # grouped["annotation"] = grouped["retries_per_success"].round(1).astype(str) + \
+        #                         "× (" + grouped["total_retries"].astype(str) + " retries)"
+
+        fig = px.line(
+            grouped,
+            x="date",
+            y="retries_per_success",
+            color="teat_id",
+            line_group="cow_id",
+            markers=True,
+            # text="annotation",
+            hover_data={
+                "date": False,
+                "cow_id": False,
+                "teat_id": True,
+                "total_retries": True,
+                "total_successes": True,
+                "retries_per_success": ':.2f'
+            },
+            labels={
+                "retries_per_success": "Retries per Success",
+                "date": "Date",
+                "teat_id": "Teat ID"
+            },
+            title="📈 Daily Retries Needed per Successful Mounting (by Cow and Teat)"
+        )
+
+        fig.update_layout(
+            title_font_size=18,
+            title_x=0.5,
+            legend_title_text="Teat ID",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            xaxis=dict(
+                tickangle=-45,
+                tickformat="%b %d"
+            ),
+            yaxis=dict(
+                title="Retries per Success",
+                rangemode="tozero"
+            ),
+            plot_bgcolor="rgba(248, 248, 255, 1)",
+            paper_bgcolor="white",
+            hovermode="x unified"
+        )
+
+        fig.update_traces(
+            textposition="top center",
+            textfont_size=12,
+            line=dict(width=2),
+            marker=dict(size=8)
+        )
+
+        return dcc.Graph(figure=fig)
+    elif analysis_type == "success_by_farm":
+        grouped = df
+        grouped["teat_id"] = grouped["teat_id"].astype(str)
+        grouped["success_percent"] = grouped["success_rate"] * 100
+        grouped["label"] = grouped["success_percent"].round(1).astype(str) + "% (" + grouped["trial_count"].astype(
+            str) + " trials)"
+        add_wilson_errors(grouped)
+
+        fig = px.bar(
+            grouped,
+            x="farm",
+            y="success_percent",
+            color="teat_id",
+            barmode="group",
+            text=grouped["label"],
+            error_y="ci_high" if preview else None,
+            error_y_minus="ci_low" if preview else None,
+            labels={
+                "success_percent": "Mounting Success Rate (%)",
+                "farm": "Farm",
+                "teat_id": "Teat ID"
+            },
+            title="Mounting Success Rate by Farm and Teat"
+        )
+        fig.update_traces(textposition="auto")
+        fig.update_yaxes(range=[0, 100])
+        return dcc.Graph(figure=fig)
+
+    elif analysis_type == "errors":
+        error_df = error_attempts(df)
+        if error_df.empty:
+            return html.Div("No errors found for selected filters.")
+
+        # Group by cow, teat, and error (farm too, so previews scale each farm by its own sample)
+        grouped = error_df.groupby(["farm", "cow_id", "teat_id", "error_code"], observed=True).size() \
+            .reset_index(name="count")
+        if preview:
+            scale_preview_counts(grouped, ["count"], farm_totals, sample_size)
+
+        # Optional: Pivot for heatmap-style plot
+        pivot = grouped.pivot_table(index=["cow_id", "teat_id"], columns="error_code", values="count",
+                                    fill_value=0, observed=True).reset_index()
+
+        # Or use bar chart
+        import plotly.express as px
+        grouped["label"] = grouped["error_code"].astype(str)
+        fig = px.bar(
+            grouped,
+            x="cow_id",
+            y="count",
+            color="label",
+            barmode="stack",
+            facet_col="teat_id",
+            labels={"count": "Error Count", "cow_id": "Cow ID", "label": "Error Code"},
+            title="🚨 Error Distribution by Cow and Teat"
+        )
+        return dcc.Graph(figure=fig)
+
+    elif analysis_type in ERROR_HEATMAP_FACETS:
+        # One heatmap (day x error code, rows grouped per teat or cow): one trace whatever the number of codes
+        facet_field = ERROR_HEATMAP_FACETS[analysis_type]
+        facet_name = "Teat" if facet_field == "teat_id" else "Cow"
+        if multi_farm and facet_field == "cow_id":
+            df["facet"] = df["farm"].astype(str) + ":" + df["facet"].astype(str)
+        if preview:
+            scale_preview_counts(df, ["count"], farm_totals, sample_size)
+        # Farms of the same teat add up
+        counts = df.pivot_table(index=["facet", "code"], columns="day", values="count", aggfunc="sum",
+                                fill_value=0)
+        counts = counts.sort_index(axis=1)
+        y_labels = [f"{facet_name} {facet} · error {code}" for facet, code in counts.index]
+
+        fig = go.Figure(go.Heatmap(
+            x=pd.to_datetime(counts.columns),
+            y=y_labels,
+            z=counts.to_numpy(),
+            colorscale="Reds",
+            colorbar=dict(title="Errors"),
+            hovertemplate="Date: %{x|%Y-%m-%d}<br>%{y}<br>Count: %{z}<extra></extra>"
+        ))
+        fig.update_layout(
+            title=f"Error Distribution Over Time by {facet_name} and Error Code",
+            xaxis_title="Date",
+            yaxis_title=f"{facet_name} · Error Code",
+            height=600,
+            template="plotly_white",
+            margin=dict(t=100)
+        )
+        fig.update_yaxes(autorange="reversed", type="category")
+        fig.update_xaxes(tickformat="%b %d", tickangle=45)
+
+        return dcc.Graph(figure=fig)
+
+    # Placeholder for other analysis types
+    return html.Div("This analysis is not implemented yet.")
@@ -1,7 +1,11 @@
-from dash import html, dcc, Input, Output, State, dash_table
+from dash import html, dcc, Input, Output, State, dash_table, ctx
 import dash_bootstrap_components as dbc
 import pandas as pd
 from datetime import datetime, timedelta
+from GUI.gui_elements import default_date_range, create_export_controls, create_refresh_button
+from GUI.export_routes import export_link
+from UTILS.cache import figure_cache
+from DB.typed_ingest import typed_frame
 
 # Analysis options
 TASK_ANALYSIS_OPTIONS = [
@@ -30,6 +34,7 @@ def task_layout(mongo_handler):
     state_options = [{"label": s, "value": s} for s in states]
     error_options = [{"label": e, "value": e} for e in errors]
     tasks_options = [{"label": t, "value": t} for t in tasks]
+    default_start, default_end = default_date_range()
 
     return dbc.Container([
         html.H4("Task Data Analysis", className="my-3"),
@@ -62,11 +67,11 @@ def task_layout(mongo_handler):
             ], width=2),
             dbc.Col([
                 dbc.Label("Start Date"),
-                dcc.DatePickerSingle(id="tasks-filter-start-date", date=(datetime.now() - timedelta(days=7)).date())
+                dcc.DatePickerSingle(id="tasks-filter-start-date", date=default_start)
             ], width=2),
             dbc.Col([
                 dbc.Label("End Date"),
-                dcc.DatePickerSingle(id="tasks-filter-end-date", date=(datetime.now() + timedelta(days=1)).date())
+                dcc.DatePickerSingle(id="tasks-filter-end-date", date=default_end)
             ], width=2)
         ], className="mb-3"),
         dbc.Row([
@@ -98,9 +103,11 @@ def task_layout(mongo_handler):
                 )
             ], width=2),
             dbc.Col([
-                dbc.Button("Plot", id="task-plot-button", color="primary", className="me-2")
+                dbc.Button("Plot", id="task-plot-button", color="primary", className="me-2"),
+                create_refresh_button("task")
             ])
         ], className="mb-3"),
+        create_export_controls("tasks"),
         dbc.Row([
             dbc.Col([
                 html.H6("Recent Tasks:"),
@@ -116,6 +123,110 @@ def task_layout(mongo_handler):
     ], fluid=True)
 
 
+def build_tasks_query(worker_filter, process_filter, state_filter, error_filter, taskid_filter, start_date,
+                      end_date):
+    query = {}
+    if worker_filter:
+        query["worker"] = {"$in": worker_filter}
+    if process_filter:
+        query["process"] = {"$in": process_filter}
+    if state_filter:
+        query["state"] = {"$in": state_filter}
+    if error_filter:
+        query["error"] = {"$in": error_filter}
+    if taskid_filter:
+        query["task_id"] = {"$in": taskid_filter}
+    if start_date and end_date:
+        query["start_time"] = {"$gte": pd.to_datetime(start_date), "$lte": pd.to_datetime(end_date)}
+    return query
+
+
+def cached_task_plot(mongo_handler, analysis_type, worker_filter, process_filter, state_filter, error_filter,
+                     start_date, end_date, refresh=False, ttl=None):
+    key = figure_cache.make_key("task_plot", analysis_type, worker_filter, process_filter, state_filter,
+                                error_filter, start_date, end_date)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: build_task_plot(mongo_handler, analysis_type, worker_filter, process_filter, state_filter,
+                                error_filter, start_date, end_date),
+        refresh=refresh, ttl=ttl
+    )
+
+
+def build_task_plot(mongo_handler, analysis_type, worker_filter, process_filter, state_filter, error_filter,
+                    start_date, end_date):
+    query = build_tasks_query(worker_filter, process_filter, state_filter, error_filter, None, start_date, end_date)
+
+    docs = list(mongo_handler.db["Tasks_collection"].find(query).sort("start_time", -1))
+    if not docs:
+        return html.Div("No data found for plotting.")
+
+    df = typed_frame(docs, "Tasks_collection")
+
+    if analysis_type == "success_rate":
+        summary = df.groupby(["worker", "process", "state"], observed=True).size().unstack(fill_value=0)
+        success_df = summary.reset_index()
+        bar_fig = {
+            "data": [
+                dict(
+                    x=success_df["process"],
+                    y=success_df.get("completed", success_df.get("completed_successfully", 0)),
+                    type="bar",
+                    name="Completed"
+                )
+            ],
+            "layout": dict(
+                title="Success Rate by Process",
+                xaxis={"title": "Process"},
+                yaxis={"title": "Count"},
+                barmode="group"
+            )
+        }
+        return dcc.Graph(figure=bar_fig)
+    elif analysis_type == "task_steps_table":
+        task_table = dash_table.DataTable(
+            columns=[{"name": i.replace("_", " ").title(), "id": i} for i in df.columns],
+            data=df.to_dict("records"),
+            page_size=10,
+            style_table={"overflowX": "auto"}
+        )
+        all_rows = []
+        for doc in docs:
+            task_id = doc["task_id"]
+            state = doc.get("state", "unknown")
+
+            for step in doc.get("task_steps", []):
+                try:
+                    all_rows.append({
+                        "task_id": task_id,
+                        "task_state": state,
+                        "step_name": step["step_name"],
+                        "step_status": step["step_status"],
+                        "start": step["start"],
+                        "end": step["end"]
+                    })
+                except Exception as err:
+                    print(err, step)
+        # Step times are parsed in bulk; unparseable ones become NaT
+        df_steps = typed_frame(all_rows, "Task_Steps").rename(columns={"duration_sec": "duration"})
+        steps_table = dash_table.DataTable(
+            columns=[{"name": col.replace("_", " ").title(), "id": col} for col in df_steps.columns],
+            data=df_steps.to_dict("records"),
+            page_size=20,
+            style_data_conditional=[
+                {
+                    'if': {'filter_query': '{step_status} != "completed_successfully"'},
+                    'backgroundColor': '#FFCCCC',
+                    'color': 'red'
+                }
+        ],
+            style_table={"overflowX": "auto"}
+        )
+        return  steps_table
+
+    return html.Div("Analysis type not implemented.")
+
+
 def register_callbacks(app, mongo_handler):
     @app.callback(
         Output("task-recent-table", "children"),
@@ -130,30 +241,14 @@ def register_callbacks(app, mongo_handler):
         prevent_initial_call=True
     )
     def update_task_table(worker_filter, process_filter, state_filter, error_filter,taskid_filter, start_date, end_date):
-        query = {}
-        if worker_filter:
-            query["worker"] = {"$in": worker_filter}
-        if process_filter:
-            query["process"] = {"$in": process_filter}
-        if state_filter:
-            query["state"] = {"$in": state_filter}
-        if error_filter:
-            query["error"] = {"$in": error_filter}
-        if taskid_filter:
-            query["task_id"] = {"$in": taskid_filter}
-        if start_date and end_date:
-            query["start_time"] = {"$gte": pd.to_datetime(start_date), "$lte": pd.to_datetime(end_date)}
+        query = build_tasks_query(worker_filter, process_filter, state_filter, error_filter, taskid_filter,
+                                  start_date, end_date)
 
         docs = list(mongo_handler.db["Tasks_collection"].find(query).sort("start_time", -1).limit(100))
         if not docs:
             return html.Div("No data found.")
 
-        for doc in docs:
-            doc["_id"] = str(doc["_id"])
-            doc["start_time"] = pd.to_datetime(doc["start_time"])
-            doc["end_time"] = pd.to_datetime(doc["end_time"])
-
-        df = pd.DataFrame(docs)
+        df = typed_frame(docs, "Tasks_collection")
         recent_df = df[["task_id", "worker", "process", "state", "error", "start_time", "end_time"]].sort_values(
             "start_time", ascending=False)
 
@@ -166,6 +261,7 @@ def register_callbacks(app, mongo_handler):
     @app.callback(
         Output("task-plot-container", "children"),
         Input("task-plot-button", "n_clicks"),
+        Input("task-refresh-button", "n_clicks"),
         State("task-analysis-type", "value"),
         State("tasks-filter-worker", "value"),
         State("tasks-filter-process", "value"),
@@ -175,91 +271,27 @@ def register_callbacks(app, mongo_handler):
         State("tasks-filter-end-date", "date"),
         prevent_initial_call=True
     )
-    def generate_task_plot(n_clicks, analysis_type, worker_filter, process_filter, state_filter, error_filter, start_date, end_date):
-        query = {}
-        if worker_filter:
-            query["worker"] = {"$in": worker_filter}
-        if process_filter:
-            query["process"] = {"$in": process_filter}
-        if state_filter:
-            query["state"] = {"$in": state_filter}
-        if error_filter:
-            query["error"] = {"$in": error_filter}
-        if start_date and end_date:
-            query["start_time"] = {"$gte": pd.to_datetime(start_date), "$lte": pd.to_datetime(end_date)}
-
-        docs = list(mongo_handler.db["Tasks_collection"].find(query).sort("start_time", -1))
-        if not docs:
-            return html.Div("No data found for plotting.")
-
-        for doc in docs:
-            doc["start_time"] = pd.to_datetime(doc["start_time"])
-            doc["end_time"] = pd.to_datetime(doc["end_time"])
-
-        df = pd.DataFrame(docs)
+    def generate_task_plot(n_clicks, refresh_clicks, analysis_type, worker_filter, process_filter, state_filter,
+                           error_filter, start_date, end_date):
+        return cached_task_plot(mongo_handler, analysis_type, worker_filter, process_filter, state_filter,
+                                error_filter, start_date, end_date,
+                                refresh=ctx.triggered_id == "task-refresh-button")
 
-        if analysis_type == "success_rate":
-            summary = df.groupby(["worker", "process", "state"]).size().unstack(fill_value=0)
-            success_df = summary.reset_index()
-            bar_fig = {
-                "data": [
-                    dict(
-                        x=success_df["process"],
-                        y=success_df.get("completed", success_df.get("completed_successfully", 0)),
-                        type="bar",
-                        name="Completed"
-                    )
-                ],
-                "layout": dict(
-                    title="Success Rate by Process",
-                    xaxis={"title": "Process"},
-                    yaxis={"title": "Count"},
-                    barmode="group"
-                )
-            }
-            return dcc.Graph(figure=bar_fig)
-        elif analysis_type == "task_steps_table":
-            task_table = dash_table.DataTable(
-                columns=[{"name": i.replace("_", " ").title(), "id": i} for i in df.columns],
-                data=df.to_dict("records"),
-                page_size=10,
-                style_table={"overflowX": "auto"}
-            )
-            all_rows = []
-            for doc in docs:
-                task_id = doc["task_id"]
-                state = doc.get("state", "unknown")
-
-                for step in doc.get("task_steps", []):
-                    try:
-                        start = pd.to_datetime(step["start"])
-                        end = pd.to_datetime(step["end"])
-                        duration = (end - start).total_seconds() if end else None
-                        all_rows.append({
-                            "task_id": task_id,
-                            "task_state": state,
-                            "step_name": step["step_name"],
-                            "step_status": step["step_status"],
-                            "start": start,
-                            "end": end,
-                            "duration": duration
-                        })
-                    except Exception as err:
-                        print(err, step)
-            df_steps = pd.DataFrame(all_rows)
-            steps_table = dash_table.DataTable(
-                columns=[{"name": col.replace("_", " ").title(), "id": col} for col in df_steps.columns],
-                data=df_steps.to_dict("records"),
-                page_size=20,
-                style_data_conditional=[
-                    {
-                        'if': {'filter_query': '{step_status} != "completed_successfully"'},
-                        'backgroundColor': '#FFCCCC',
-                        'color': 'red'
-                    }
-            ],
-                style_table={"overflowX": "auto"}
-            )
-            return  steps_table
-
-        return html.Div("Analysis type not implemented.")
+    @app.callback(
+        Output("tasks-export-link", "children"),
+        Input("tasks-export-button", "n_clicks"),
+        State("tasks-filter-worker", "value"),
+        State("tasks-filter-process", "value"),
+        State("tasks-filter-state", "value"),
+        State("tasks-filter-error", "value"),
+        State("tasks-filter-task_id", "value"),
+        State("tasks-filter-start-date", "date"),
+        State("tasks-filter-end-date", "date"),
+        State("tasks-export-format", "value"),
+        prevent_initial_call=True
+    )
+    def export_tasks_data(n_clicks, worker_filter, process_filter, state_filter, error_filter, taskid_filter,
+                          start_date, end_date, fmt):
+        query = build_tasks_query(worker_filter, process_filter, state_filter, error_filter, taskid_filter,
+                                  start_date, end_date)
+        return export_link([(None, mongo_handler)], "Tasks_collection", query, fmt, "tasks")
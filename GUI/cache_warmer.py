@@ -0,0 +1,68 @@
+# cache_warmer.py
+import threading
+import time
+
+from config_py import CACHE_WARM_INTERVAL_SEC, CACHE_WARM_TTL_SEC
+from GUI.gui_elements import default_date_range
+from GUI.Dash_Gui_Tabs.mounting_tab import ANALYSIS_OPTIONS, cached_mounting_analysis
+from GUI.Dash_Gui_Tabs.milking_tab import cached_milking_task_table
+from GUI.Dash_Gui_Tabs.tasks_analysis_tab import cached_task_plot
+
+
+class CacheWarmer:
+    """
+    Background scheduler that precomputes the tabs' default "last 7 days" views
+    (every mounting analysis, task success rate and the recent milking tasks table)
+    on startup and then every ``interval_sec`` seconds, so the first request of
+    the day is served from the figure cache instead of a cold fetch. Warmed entries are kept for
+    ``CACHE_WARM_TTL_SEC``; ad-hoc queries only for the short default ``CACHE_TTL_SEC``.
+    """
+
+    def __init__(self, mongo_handler, farm_manager, interval_sec=CACHE_WARM_INTERVAL_SEC):
+        self.mongo_handler = mongo_handler
+        self.farm_manager = farm_manager
+        self.interval_sec = interval_sec
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.warm_once()
+            self._stop_event.wait(self.interval_sec)
+
+    def warm_once(self):
+        # Dates are passed as ISO strings, the same form the date pickers send back
+        start_date, end_date = (d.isoformat() for d in default_date_range())
+        jobs = [
+            (f"mounting/{option['value']}",
+             lambda value=option["value"]: cached_mounting_analysis(
+                 self.farm_manager, value, None, None, start_date, end_date,
+                 self.farm_manager.default_farms(), refresh=True, ttl=CACHE_WARM_TTL_SEC))
+            for option in ANALYSIS_OPTIONS
+        ]
+        jobs.append(("tasks/success_rate",
+                     lambda: cached_task_plot(self.mongo_handler, "success_rate", None, None, None, None,
+                                              start_date, end_date, refresh=True, ttl=CACHE_WARM_TTL_SEC)))
+        jobs.append(("milking/task_table",
+                     lambda: cached_milking_task_table(self.mongo_handler, None, None, start_date, end_date,
+                                                       refresh=True, ttl=CACHE_WARM_TTL_SEC)))
+
+        started = time.perf_counter()
+        for name, job in jobs:
+            if self._stop_event.is_set():
+                return
+            try:
+                job()
+            except Exception as e:
+                print(f"❌ Cache warming failed for {name}: {e}")
+        print(f"✅ Warmed {len(jobs)} default views in {time.perf_counter() - started:.1f}s")
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State, MATCH, ALL, ctx
@@ -12,33 +13,55 @@ from GUI.Dash_Gui_Tabs.milking_tab import milking_layout , register_callbacks as
 from GUI.Dash_Gui_Tabs.mounting_tab import mounting_layout , register_callbacks as mounting_callbacks
 from GUI.Dash_Gui_Tabs.tasks_analysis_tab import task_layout , register_callbacks as task_callbacks
 from GUI.graphing import GraphingManager
+from GUI.cache_warmer import CacheWarmer
+from GUI.export_routes import register_export_routes
 from DB.connection import MongoDBManager
-from config_py import farm_connection_str, COWS_DB
+from DB.multi_farm import MultiFarmManager
+from DB.schema_catalog import SchemaCatalog
+from config_py import farm_connection_str, COWS_DB, FARM_CONNECTIONS
 graph_mgr = GraphingManager()
 
 # Initialize app with Bootstrap theme
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Tabs render most of their controls and graphs dynamically
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 app.title = "MongoDB Interactive Dashboard"
 
-mongo_handler = MongoDBManager(farm_connection_str, COWS_DB)
-mongo_handler.connect()
+farm_manager = MultiFarmManager(FARM_CONNECTIONS, COWS_DB)
+farm_manager.connect()
+# Single-farm tabs keep working against the primary farm
+mongo_handler = farm_manager.primary
 collections = mongo_handler.get_collections()
+schema_catalog = SchemaCatalog(mongo_handler)
 
-tabs = dbc.Tabs(
-    [
-        dbc.Tab(global_layout(mongo_handler ,app), label="Farm Data", tab_id="global-tab"),
-        dbc.Tab(mounting_layout(mongo_handler ), label="Mounting Data", tab_id="mounting-tab"),
-        dbc.Tab(milking_layout(mongo_handler), label="Milking Data", tab_id="milking-tab"),
-        dbc.Tab(task_layout(mongo_handler), label="Tasks Data", tab_id="task-tab")
-    ],
-    id="data-tabs", active_tab="global-tab"  # set the first tab as active by default
-)
-app.layout = dbc.Container([html.H2("Farm Data Dashboard"), tabs], fluid=True)
 
+def serve_layout():
+    # Built per page load so the date pickers default to the same "last N days" the cache warmer warms
+    tabs = dbc.Tabs(
+        [
+            dbc.Tab(global_layout(mongo_handler ,app), label="Farm Data", tab_id="global-tab"),
+            dbc.Tab(mounting_layout(farm_manager), label="Mounting Data", tab_id="mounting-tab"),
+            dbc.Tab(milking_layout(mongo_handler), label="Milking Data", tab_id="milking-tab"),
+            dbc.Tab(task_layout(mongo_handler), label="Tasks Data", tab_id="task-tab")
+        ],
+        id="data-tabs", active_tab="global-tab"  # set the first tab as active by default
+    )
+    return dbc.Container([html.H2("Farm Data Dashboard"), tabs], fluid=True)
 
-mounting_callbacks(app, mongo_handler)
+
+app.layout = serve_layout
+
+
+mounting_callbacks(app, farm_manager)
 milking_callbacks(app, mongo_handler)
-global_callbacks(app , mongo_handler)
+global_callbacks(app , mongo_handler, schema_catalog)
 task_callbacks(app , mongo_handler)
-def main():
-    app.run(debug=True)
+register_export_routes(app)
+cache_warmer = CacheWarmer(mongo_handler, farm_manager)
+
+
+def main(debug=True):
+    # With the debug reloader the module runs in a watcher and a worker process; warm only in the worker
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        cache_warmer.start()
+        schema_catalog.start(collections)
+    app.run(debug=debug)
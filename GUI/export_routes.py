@@ -0,0 +1,103 @@
+# export_routes.py
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from dash import html
+from flask import Response, abort, send_file, stream_with_context
+
+from DB.export import EXPORT_FORMATS, iter_csv, write_parquet, parquet_available
+from config_py import EXPORT_BATCH_SIZE, EXPORT_LINK_TTL_SEC
+
+
+class ExportRegistry:
+    """
+    Server-side store of pending exports.
+
+    A tab callback registers the filtered query it is showing and gets back a token; the
+    ``/export/<token>`` route then streams that query from the cursor. Queries stay on the
+    server, so they may hold datetimes and other BSON values.
+    """
+
+    def __init__(self, ttl_sec=EXPORT_LINK_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self._exports = {}
+        self._lock = threading.Lock()
+
+    def register(self, sources, collection_name, query, fmt, name):
+        """
+        Args:
+            sources (list): ``(farm_label, mongo_handler)`` pairs to read from in order; a label adds a ``farm`` column.
+            collection_name (str): Collection to export.
+            query (dict): The tab's current filter.
+            fmt (str): ``csv`` or ``parquet``.
+            name (str): File name prefix.
+        """
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._exports[token] = {
+                "sources": sources, "collection": collection_name, "query": query, "format": fmt,
+                "filename": f"{name}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}", "created": time.monotonic()
+            }
+        return token
+
+    def get(self, token):
+        with self._lock:
+            self._expire()
+            return self._exports.get(token)
+
+    def _expire(self):
+        now = time.monotonic()
+        for token in [t for t, e in self._exports.items() if now - e["created"] > self.ttl_sec]:
+            del self._exports[token]
+
+
+export_registry = ExportRegistry()
+
+
+def export_link(sources, collection_name, query, fmt, name):
+    """Registers an export and returns the download link shown under the tab's Export button."""
+    if fmt not in EXPORT_FORMATS:
+        return html.Div("Unknown export format.")
+    if fmt == "parquet" and not parquet_available():
+        return html.Div("Parquet export requires pyarrow to be installed.")
+    token = export_registry.register(sources, collection_name, query, fmt, name)
+    return html.A(f"⬇ Download {fmt.upper()}", href=f"/export/{token}", target="_blank")
+
+
+def _iter_documents(export):
+    for label, mongo_handler in export["sources"]:
+        cursor = mongo_handler.db[export["collection"]].find(export["query"]).batch_size(EXPORT_BATCH_SIZE)
+        for doc in cursor:
+            if label:
+                doc["farm"] = label
+            yield doc
+
+
+def register_export_routes(app):
+    @app.server.route("/export/<token>")
+    def download_export(token):
+        export = export_registry.get(token)
+        if export is None:
+            abort(404)
+
+        disposition = {"Content-Disposition": f'attachment; filename="{export["filename"]}"'}
+        if export["format"] == "csv":
+            return Response(stream_with_context(iter_csv(_iter_documents(export))),
+                            mimetype="text/csv", headers=disposition)
+
+        # Parquet needs a seekable file: write row groups to a temp file, then stream it from disk
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        try:
+            write_parquet(_iter_documents(export), path)
+        except Exception:
+            os.remove(path)
+            raise
+        response = send_file(path, as_attachment=True, download_name=export["filename"])
+        response.call_on_close(lambda: os.remove(path))
+        return response
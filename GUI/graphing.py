@@ -1,55 +1,121 @@
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
+from config_py import WEBGL_POINT_THRESHOLD
+
+DEFAULT_COLORS = px.colors.qualitative.Plotly
+
+
+def group_indices(values):
+    """
+    Row positions of every group in one pass: ``pd.factorize`` plus a stable argsort,
+    instead of slicing a DataFrame per group. Returns ``[(group_value, positions), ...]`` in sorted group order.
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    # Rows with a missing group value get code -1 and sort first; bounds start after them
+    return [(uniques[i], order[bounds[i]:bounds[i + 1]]) for i in range(len(uniques))]
+
+
 class GraphingManager:
-    def __init__(self):
-        pass
+    """
+    Builds Plotly figures straight from NumPy column arrays.
 
-    def create_bar_chart(self, df, x_column, y_column, title="", categorical_x=False, group_column=None):
-        if categorical_x:
-            df[x_column] = df[x_column].astype(str)
+    Caller DataFrames are never modified: categorical X axes are rendered with ``xaxis.type="category"``
+    rather than converting values to strings, and groups are split with a single factorize/argsort.
+    """
 
-        if group_column and group_column in df.columns:
-            df[group_column] = df[group_column].astype(str)
-            fig = px.bar(df, x=x_column, y=y_column, color=group_column, title=title)
-            fig.update_layout(barmode="group")
-        else:
-            fig = px.bar(df, x=x_column, y=y_column, title=title)
+    def __init__(self, webgl_threshold=WEBGL_POINT_THRESHOLD):
+        self.webgl_threshold = webgl_threshold
+
+    def use_webgl(self, n_points):
+        return n_points > self.webgl_threshold
+
+    def render_mode(self, n_points):
+        return "webgl" if self.use_webgl(n_points) else "svg"
 
+    def mark_render_mode(self, fig, n_points):
+        """Records the render mode and point count in ``layout.meta``."""
+        meta = dict(fig.layout.meta or {}) if isinstance(fig.layout.meta, dict) else {}
+        meta.update({"render_mode": self.render_mode(n_points), "points": int(n_points)})
+        fig.update_layout(meta=meta)
         return fig
 
-    def create_line_chart(self, df: pd.DataFrame, x_column: str, y_column: str, title: str = "",
-                          categorical_x: bool = False, group_column: str = None):
+    def scatter_trace(self, x, y, n_points, mode="lines+markers", **kwargs):
+        """
+        ``go.Scatter`` for small figures, ``go.Scattergl`` once the whole figure holds more than
+        ``webgl_threshold`` points; markers are dropped from WebGL line traces.
+        """
+        if self.use_webgl(n_points):
+            if mode == "lines+markers":
+                mode = "lines"
+                kwargs.pop("marker", None)
+            return go.Scattergl(x=x, y=y, mode=mode, **kwargs)
+        return go.Scatter(x=x, y=y, mode=mode, **kwargs)
 
-        if categorical_x:
-            df[x_column] = df[x_column].astype(str)
+    def build_figure(self, df, kind, x_column, y_column, title="", categorical_x=False, group_column=None,
+                     error_column=None):
+        """
+        Lean figure construction for ``kind`` in ``bar``, ``line`` and ``scatter``.
+
+        Reads each column once as a NumPy array and emits one trace per group.
+        ``error_column`` holds symmetric error-bar half widths (e.g. preview confidence intervals).
+        """
+        n_points = len(df)
+        x = df[x_column].to_numpy()
+        y = df[y_column].to_numpy()
+        errors = df[error_column].to_numpy() if error_column and error_column in df.columns else None
+        hovertemplate = f"{x_column}=%{{x}}<br>{y_column}=%{{y}}<extra>%{{fullData.name}}</extra>"
 
         if group_column and group_column in df.columns:
-            fig = px.line(df, x=x_column, y=y_column, color=group_column, markers=True, title=title)
+            groups = [(str(value), positions) for value, positions in group_indices(df[group_column].to_numpy())]
         else:
-            fig = px.line(df, x=x_column, y=y_column, markers=True, title=title)
-        fig.update_traces(connectgaps=False)
+            groups = [(None, slice(None))]
 
-        return fig
+        fig = go.Figure()
+        for i, (name, positions) in enumerate(groups):
+            color = DEFAULT_COLORS[i % len(DEFAULT_COLORS)]
+            trace_args = dict(name=name or y_column, showlegend=name is not None, hovertemplate=hovertemplate)
+            if errors is not None:
+                trace_args["error_y"] = dict(type="data", array=errors[positions], visible=True)
+            if kind == "bar":
+                fig.add_trace(go.Bar(x=x[positions], y=y[positions], marker_color=color, **trace_args))
+            elif kind == "line":
+                fig.add_trace(self.scatter_trace(x[positions], y[positions], n_points, mode="lines+markers",
+                                                 line=dict(color=color), marker=dict(color=color),
+                                                 connectgaps=False, **trace_args))
+            else:
+                fig.add_trace(self.scatter_trace(x[positions], y[positions], n_points, mode="markers",
+                                                 marker=dict(color=color), **trace_args))
+
+        fig.update_layout(title=title, xaxis_title=x_column, yaxis_title=y_column, template="plotly",
+                          legend_title=group_column if groups[0][0] is not None else None)
+        if categorical_x:
+            fig.update_xaxes(type="category")
+        if kind == "bar":
+            fig.update_layout(barmode="group")
+            return fig
+        return self.mark_render_mode(fig, n_points)
+
+    def create_bar_chart(self, df, x_column, y_column, title="", categorical_x=False, group_column=None,
+                         error_column=None):
+        return self.build_figure(df, "bar", x_column, y_column, title, categorical_x, group_column, error_column)
+
+    def create_line_chart(self, df: pd.DataFrame, x_column: str, y_column: str, title: str = "",
+                          categorical_x: bool = False, group_column: str = None, error_column: str = None):
+        return self.build_figure(df, "line", x_column, y_column, title, categorical_x, group_column, error_column)
 
     def create_pie_chart(self, df: pd.DataFrame, names_column: str, values_column: str, title: str = ""):
         fig = px.pie(df, names=names_column, values=values_column, title=title)
         return fig
 
     def create_scatter_plot(self, df, x_column: str, y_column: str, title: str = "",
-                            categorical_x: bool = False, group_column: str = None):
-        if categorical_x:
-            df[x_column] = df[x_column].astype(str)
-
-        if group_column and group_column in df.columns:
-            df[group_column] = df[group_column].astype(str)
-            fig = px.scatter(df, x=x_column, y=y_column, color=group_column, title=title)
-        else:
-            fig = px.scatter(df, x=x_column, y=y_column, title=title)
-
-        return fig
+                            categorical_x: bool = False, group_column: str = None, error_column: str = None):
+        return self.build_figure(df, "scatter", x_column, y_column, title, categorical_x, group_column,
+                                 error_column)
 
     def plot_grouped_lines(self, df, x_column, y_column, group_column, title=""):
-        fig = px.line(df, x=x_column, y=y_column, color=group_column, title=title)
-        return fig
+        return self.build_figure(df, "line", x_column, y_column, title, group_column=group_column)
@@ -1,4 +1,10 @@
+from datetime import datetime, timedelta
+
 from dash import html, dcc
+import dash_bootstrap_components as dbc
+
+from DB.export import parquet_available
+from config_py import DEFAULT_LOOKBACK_DAYS
 
 def create_label(text: str):
     return html.Label(text)
@@ -30,3 +36,36 @@ def create_checkbox(id: str, text: str, default_checked: bool = False):
         labelStyle={"display": "inline-block"},
         style={"margin": "5px"}
     )
+
+
+def default_date_range(lookback_days: int = DEFAULT_LOOKBACK_DAYS, end_offset_days: int = 1):
+    """Default (start, end) dates shown by the tab date pickers: the last week up to tomorrow."""
+    today = datetime.now().date()
+    return today - timedelta(days=lookback_days), today + timedelta(days=end_offset_days)
+
+
+def create_refresh_button(prefix: str):
+    """Button that recomputes the current view, bypassing the result/figure caches; id ``<prefix>-refresh-button``."""
+    return dbc.Button("↻ Refresh", id=f"{prefix}-refresh-button", color="secondary", outline=True,
+                      className="me-2")
+
+
+def create_export_controls(prefix: str):
+    """Export format selector, button and link placeholder; ids are ``<prefix>-export-*``."""
+    formats = [{"label": "CSV", "value": "csv"}]
+    if parquet_available():
+        formats.append({"label": "Parquet", "value": "parquet"})
+    return dbc.Row([
+        dbc.Col([
+            dcc.Dropdown(
+                id=f"{prefix}-export-format",
+                options=formats,
+                value="csv",
+                clearable=False
+            )
+        ], width=2),
+        dbc.Col([
+            dbc.Button("Export filtered data", id=f"{prefix}-export-button", color="secondary", className="me-2"),
+            html.Span(id=f"{prefix}-export-link", className="ms-2")
+        ], width=4)
+    ], className="mb-3")
@@ -0,0 +1,66 @@
+# background_jobs.py
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config_py import BACKGROUND_JOB_TTL_SEC
+
+
+class BackgroundJobs:
+    """
+    Runs slow computations off the callback thread and hands results back by token,
+    so a callback can return a preview immediately and a polling callback swaps in the result.
+
+    Jobs that are not polled for ``ttl_sec`` are cancelled and forgotten, so superseded refinements
+    do not keep their results in memory.
+    """
+
+    def __init__(self, max_workers=4, ttl_sec=BACKGROUND_JOB_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-job")
+        self._futures = {}  # token -> (future, last polled)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._futures[token] = (self._executor.submit(fn, *args, **kwargs), time.monotonic())
+        return token
+
+    def discard(self, token):
+        """Cancels and forgets a job whose result is no longer wanted (e.g. the plot was redrawn)."""
+        with self._lock:
+            entry = self._futures.pop(token, None)
+        if entry is not None:
+            entry[0].cancel()
+
+    def poll(self, token):
+        """
+        Returns ``(done, result)``; a finished job is forgotten once collected.
+        Unknown tokens (e.g. after a server restart) report ``(True, None)``.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._futures.get(token)
+            if entry is None:
+                return True, None
+            future = entry[0]
+            if not future.done():
+                self._futures[token] = (future, time.monotonic())
+                return False, None
+            del self._futures[token]
+        try:
+            return True, future.result()
+        except Exception as e:
+            print(f"❌ Background job failed: {e}")
+            return True, None
+
+    def _expire(self):
+        now = time.monotonic()
+        for token in [t for t, (_, polled) in self._futures.items() if now - polled > self.ttl_sec]:
+            self._futures.pop(token)[0].cancel()
+
+
+background_jobs = BackgroundJobs()
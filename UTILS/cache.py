@@ -0,0 +1,90 @@
+# cache.py
+import threading
+import time
+from datetime import date, datetime
+
+from config_py import CACHE_TTL_SEC
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache whose entries expire after ``ttl`` seconds
+    (or their own ``ttl``, e.g. the longer-lived warmed default views).
+    """
+
+    def __init__(self, ttl=CACHE_TTL_SEC, max_entries=256, lock_stripes=64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        # Fixed set of compute locks shared by key hash: a key always maps to the same lock,
+        # and the set never grows with the number of keys
+        self._key_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        """Builds a hashable key from callback arguments (lists, dicts and dates included)."""
+        def freeze(value):
+            if isinstance(value, (list, tuple, set)):
+                return tuple(freeze(v) for v in value)
+            if isinstance(value, dict):
+                return tuple(sorted((str(k), freeze(v)) for k, v in value.items()))
+            if isinstance(value, (date, datetime)):
+                return value.isoformat()
+            return value
+
+        return tuple(freeze(p) for p in parts)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            stored_at, ttl, value = entry
+            if time.monotonic() - stored_at > ttl:
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), ttl or self.ttl, value)
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+
+    def get_or_compute(self, key, compute, refresh=False, cacheable=None, ttl=None):
+        """
+        Returns the cached value for ``key`` or computes and stores it.
+
+        Concurrent callers asking for the same key wait for a single computation
+        instead of hitting the database in parallel. ``refresh=True`` always recomputes.
+        A computed value is only stored when ``cacheable`` (if given) returns True for it,
+        for ``ttl`` seconds (the cache's default when None).
+        """
+        if not refresh:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        key_lock = self._key_locks[hash(key) % len(self._key_locks)]
+        with key_lock:
+            if not refresh:
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+            value = compute()
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared caches: raw query results (DataFrames / documents) and rendered figures
+result_cache = TTLCache()
+figure_cache = TTLCache()
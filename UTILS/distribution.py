@@ -0,0 +1,43 @@
+# distribution.py
+import numpy as np
+import pandas as pd
+
+
+def histogram_frame(df, y_col, bins, group_column=None):
+    """NumPy histogram of ``y_col`` (per group) in the same shape the $bucket pipelines return."""
+    values = pd.to_numeric(df[y_col], errors="coerce")
+    valid = values.notna().to_numpy()
+    y = values.to_numpy(dtype=np.float64)[valid]
+    if y.size == 0:
+        return pd.DataFrame(columns=["bin_start", "count"])
+    edges = np.histogram_bin_edges(y, bins=bins)
+
+    if not group_column:
+        counts, _ = np.histogram(y, bins=edges)
+        return pd.DataFrame({"bin_start": edges[:-1], "count": counts})
+
+    codes, groups = pd.factorize(df[group_column].to_numpy()[valid])
+    bin_index = np.clip(np.searchsorted(edges, y, side="right") - 1, 0, len(edges) - 2)
+    # One 2-D bincount instead of a histogram per group
+    counts = np.bincount(codes * (len(edges) - 1) + bin_index,
+                         minlength=len(groups) * (len(edges) - 1)).reshape(len(groups), -1)
+    return pd.DataFrame({
+        group_column: np.repeat(groups, len(edges) - 1),
+        "bin_start": np.tile(edges[:-1], len(groups)),
+        "count": counts.ravel()
+    })
+
+
+def percentile_frame(df, x_col, y_col, q, group_column=None):
+    """Per-X (and group) quantile of ``y_col``, the NumPy counterpart of $percentile."""
+    keys = [x_col] + ([group_column] if group_column else [])
+    values = df.assign(**{y_col: pd.to_numeric(df[y_col], errors="coerce")}).dropna(subset=[y_col])
+    return values.groupby(keys, sort=True)[y_col].quantile(q).reset_index()
+
+
+def truncate_times(values, granularity):
+    """Pandas counterpart of $dateTrunc for the Time Granularity options (weeks start on Monday)."""
+    times = pd.to_datetime(values)
+    if granularity == "week":
+        return times.dt.to_period("W-SUN").dt.start_time
+    return times.dt.floor({"minute": "min", "hour": "h", "day": "D"}[granularity])
@@ -0,0 +1,38 @@
+# estimation.py
+import numpy as np
+
+Z_95 = 1.96
+
+
+def wilson_interval(successes, trials, z=Z_95):
+    """Wilson score interval for success rates; returns ``(low, high)`` arrays in [0, 1]."""
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = successes / trials
+        denom = 1 + z ** 2 / trials
+        center = (p + z ** 2 / (2 * trials)) / denom
+        half = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denom
+    return np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+
+def mean_half_width(std, n, z=Z_95):
+    """Half width of the normal-approximation confidence interval of a mean."""
+    std = np.asarray(std, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nan_to_num(z * std / np.sqrt(n))
+
+
+def scaled_count(sample_counts, sample_size, total, z=Z_95):
+    """
+    Estimates population counts from counts in a uniform sample of ``sample_size`` out of ``total``
+    documents. Returns ``(estimate, half_width)``.
+    """
+    counts = np.asarray(sample_counts, dtype=np.float64)
+    if sample_size <= 0:
+        return counts, np.zeros_like(counts)
+    p = counts / sample_size
+    # Finite population correction: the interval collapses as the sample approaches the full set
+    fpc = np.sqrt(max(total - sample_size, 0) / max(total - 1, 1))
+    return p * total, z * np.sqrt(p * (1 - p) / sample_size) * fpc * total
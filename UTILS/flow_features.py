@@ -0,0 +1,106 @@
+# flow_features.py
+# Per-session features of milking curves, computed for a whole batch of sessions at once
+# from the stacked (sessions x samples) flow and milk-quantity matrices.
+import numpy as np
+import pandas as pd
+
+from UTILS.flow_timeline import stack_rows, unwrap_date
+from UTILS.smoothing import moving_average, row_window_samples
+
+# Flow at or above this fraction of the peak counts as plateau
+PLATEAU_FRACTION = 0.8
+# Light smoothing before peak detection so single-sample spikes are not taken as the peak
+FEATURE_SMOOTHING_SEC = 2
+# Let-down ends when flow first reaches this fraction of the peak
+LETDOWN_FRACTION = 0.5
+# Flow drops are measured over this span; the end-of-session flow over the last END_WINDOW_SEC
+DROP_WINDOW_SEC = 3
+END_WINDOW_SEC = 5
+
+KPI_FIELDS = ["peak_flow", "time_to_peak_sec", "plateau_sec", "total_yield", "duration_sec"]
+# Curve-shape features used by the anomaly detection (DB/milking_anomalies.py)
+ANOMALY_FEATURES = ["letdown_sec", "max_drop_ratio", "end_flow_ratio"]
+
+
+def session_features(docs):
+    """
+    KPIs of every session in ``docs`` (curves as arrays, see ``DB.flow_codec.decode_document``).
+
+    Returns a DataFrame with one row per document: ``peak_flow``, ``time_to_peak_sec``, ``plateau_sec``
+    (time at >= PLATEAU_FRACTION of the peak), ``total_yield`` (end of the cumulative milk-quantity
+    curve, else the document's ``milk_quantity``) and ``duration_sec``, plus the ``ANOMALY_FEATURES``:
+    ``letdown_sec`` (time to LETDOWN_FRACTION of the peak), ``max_drop_ratio`` (largest fall within
+    DROP_WINDOW_SEC before the final decline, relative to the peak) and ``end_flow_ratio`` (mean flow over
+    the last END_WINDOW_SEC relative to the peak; high when the unit came off while milk still flowed).
+    """
+    if not docs:
+        return pd.DataFrame(columns=KPI_FIELDS + ANOMALY_FEATURES)
+    starts = pd.to_datetime([unwrap_date(doc["start"]) for doc in docs]).to_numpy()
+    ends = pd.to_datetime([unwrap_date(doc["end"]) for doc in docs]).to_numpy()
+    durations = (ends - starts) / np.timedelta64(1, "s")
+
+    flow, lengths = stack_rows([[] if doc.get("flow_rate_data") is None else doc["flow_rate_data"]
+                                for doc in docs])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        steps = np.where(lengths > 1, durations / (lengths - 1), np.nan)
+        rates = np.where(steps > 0, 1 / steps, np.nan)
+    # Windows follow each session's own sample rate, so a session's features never depend on its batch
+    window = row_window_samples(FEATURE_SMOOTHING_SEC, rates)
+    smoothed = moving_average(flow, window)
+    rows = np.arange(len(docs))
+    columns = np.arange(flow.shape[1])
+    # The trailing average runs on into the NaN padding; past the session's end is not part of it
+    smoothed[columns[None, :] >= lengths[:, None]] = np.nan
+
+    peak_index = np.zeros(len(docs), dtype=np.int64)
+    peak = np.full(len(docs), np.nan)
+    if flow.shape[1]:
+        filled = np.where(np.isnan(smoothed), -np.inf, smoothed)
+        peak_index = np.argmax(filled, axis=1)
+        peak = filled[rows, peak_index]
+        peak[~np.isfinite(peak)] = np.nan
+        # The trailing average lags by half a window
+        peak_index = np.maximum(peak_index - (window - 1) // 2, 0)
+    has_flow = ~np.isnan(peak)
+    with np.errstate(invalid="ignore"):
+        on_plateau = smoothed >= PLATEAU_FRACTION * peak[:, None]
+        reached_letdown = smoothed >= LETDOWN_FRACTION * peak[:, None]
+    plateau_samples = np.sum(on_plateau, axis=1)
+    letdown_index = np.maximum(np.argmax(reached_letdown, axis=1) - (window - 1) // 2, 0) \
+        if flow.shape[1] else peak_index
+    max_drop_ratio = np.full(len(docs), np.nan)
+    end_flow_ratio = np.full(len(docs), np.nan)
+    if flow.shape[1]:
+        # Drops after the last plateau sample are the normal end of milking, not anomalies
+        last_plateau = flow.shape[1] - 1 - np.argmax(on_plateau[:, ::-1], axis=1)
+        span = np.minimum(row_window_samples(DROP_WINDOW_SEC, rates), np.maximum(lengths - 1, 1))
+        later = columns[None, :] + span[:, None]
+        drops = smoothed - np.take_along_axis(smoothed, np.minimum(later, flow.shape[1] - 1), axis=1)
+        drops[(later >= lengths[:, None]) | (later > last_plateau[:, None])] = np.nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            valid_drops = np.where(np.isnan(drops), -np.inf, drops).max(axis=1)
+            max_drop_ratio = np.where(np.isfinite(valid_drops), np.maximum(valid_drops, 0) / peak, 0.0)
+
+        tail = row_window_samples(END_WINDOW_SEC, rates)
+        sums = np.concatenate([np.zeros((len(docs), 1)), np.cumsum(np.nan_to_num(flow), axis=1)], axis=1)
+        tail_start = np.maximum(lengths - tail, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            end_flow_ratio = (sums[rows, lengths] - sums[rows, tail_start]) / (lengths - tail_start) / peak
+
+    milk, milk_lengths = stack_rows([[] if doc.get("milk_quantity_data") is None else doc["milk_quantity_data"]
+                                     for doc in docs])
+    last_milk = np.full(len(docs), np.nan)
+    has_milk = milk_lengths > 0
+    last_milk[has_milk] = milk[has_milk, milk_lengths[has_milk] - 1]
+    scalar_yield = pd.to_numeric(pd.Series([doc.get("milk_quantity") for doc in docs]), errors="coerce")
+
+    return pd.DataFrame({
+        "peak_flow": peak,
+        "time_to_peak_sec": np.where(has_flow, peak_index * steps, np.nan),
+        "plateau_sec": np.where(has_flow, plateau_samples * steps, np.nan),
+        "total_yield": np.where(has_milk, last_milk, scalar_yield.to_numpy(dtype=np.float64)),
+        "duration_sec": durations,
+        "letdown_sec": np.where(has_flow, letdown_index * steps, np.nan),
+        "max_drop_ratio": np.where(has_flow, max_drop_ratio, np.nan),
+        "end_flow_ratio": np.where(has_flow, end_flow_ratio, np.nan),
+    })
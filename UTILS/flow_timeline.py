@@ -0,0 +1,225 @@
+# flow_timeline.py
+import numpy as np
+import pandas as pd
+
+from UTILS.smoothing import smooth, window_samples
+
+
+def unwrap_date(value):
+    """Extended-JSON exports store dates as ``{"$date": ...}``; live documents hold datetimes."""
+    return value["$date"] if isinstance(value, dict) else value
+
+
+def stack_rows(rows):
+    """
+    Stacks ragged per-teat sample lists into one NaN-padded ``(teats, samples)`` float matrix.
+    Returns ``(matrix, lengths)``.
+    """
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    matrix = np.full((len(rows), lengths.max(initial=0)), np.nan)
+    for i, row in enumerate(rows):
+        matrix[i, :lengths[i]] = np.asarray(row, dtype=np.float64)
+    return matrix, lengths
+
+
+def relative_times(offsets, durations, lengths, width, totals=None, firsts=None, factor=1):
+    """
+    Per-row ``linspace(offset, offset + duration, length)`` laid out in a ``(rows, width)`` matrix,
+    NaN past each row's length.
+
+    For a slice of a longer curve (``totals`` samples, starting at sample ``firsts``) reduced by
+    ``factor``, each value sits at the centre of its bucket on the full curve's time axis.
+    """
+    totals = lengths if totals is None else totals
+    firsts = np.zeros_like(lengths) if firsts is None else firsts
+    steps = durations / np.maximum(totals - 1, 1)
+    positions = np.arange(width)
+    samples = firsts[:, None] + positions[None, :] * factor + (factor - 1) / 2
+    x = offsets[:, None] + np.minimum(samples, np.maximum(totals - 1, 0)[:, None]) * steps[:, None]
+    x[positions[None, :] >= lengths[:, None]] = np.nan
+    return x
+
+
+def interp_rows(x, values, lengths, grid):
+    """
+    ``np.interp`` of every row of ``values`` (at the row's increasing times ``x``) on one shared ``grid``.
+
+    All rows are interpolated in a single ``searchsorted`` over the rows laid end to end on a shifted
+    time axis. Grid times outside a row's first and last sample are NaN.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    out = np.full((len(lengths), len(grid)), np.nan)
+    valid = np.arange(x.shape[1])[None, :] < lengths[:, None]
+    if not len(grid) or not (lengths > 1).any():
+        return out
+
+    # Separate the rows on one axis: row i lives in [i * stride, (i + 1) * stride)
+    low = min(np.nanmin(x[valid]), grid[0])
+    stride = max(np.nanmax(x[valid]), grid[-1]) - low + 1
+    shift = (np.arange(len(lengths)) * stride - low)[:, None]
+    flat_x = (x + shift)[valid]
+    flat_y = values[valid]
+    first = np.cumsum(lengths) - lengths
+    last = first + lengths - 1
+
+    query = grid[None, :] + shift
+    index = np.searchsorted(flat_x, query, side="right") - 1
+    index = np.clip(index, first[:, None], np.maximum(last - 1, first)[:, None])
+    x0, x1 = flat_x[index], flat_x[np.minimum(index + 1, last[:, None])]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(x1 > x0, (query - x0) / (x1 - x0), 0.0)
+    out[:] = flat_y[index] * (1 - weight) + flat_y[np.minimum(index + 1, last[:, None])] * weight
+
+    inside = (query >= flat_x[first][:, None]) & (query <= flat_x[last][:, None]) & (lengths > 1)[:, None]
+    out[~inside] = np.nan
+    return out
+
+
+def align_teats(timeline, resample_hz):
+    """
+    Puts every teat of a ``build_flow_timeline`` result on one fixed-rate time base (seconds since the task
+    start, ``resample_hz`` per second divided by the level's reduction factor).
+
+    Returns ``{"time", "flow", "milk", "total_flow"}``: per-teat ``(teats, time)`` matrices, NaN where a teat
+    was not attached, and the summed udder flow (NaN where no teat was attached).
+    """
+    step = timeline["factor"] / resample_hz
+    end = np.nanmax(timeline["flow_x"]) if timeline["flow_x"].size else 0.0
+    grid = np.arange(0.0, end + step / 2, step)
+    aligned = {"time": grid}
+    for name in ("flow", "milk"):
+        aligned[name] = interp_rows(timeline[f"{name}_x"], timeline[name], timeline[f"{name}_lengths"], grid)
+
+    attached = ~np.isnan(aligned["flow"])
+    aligned["total_flow"] = np.where(attached.any(axis=0), np.where(attached, aligned["flow"], 0.0).sum(axis=0),
+                                     np.nan)
+    return aligned
+
+
+def build_flow_timeline(docs, kernel="sma", window_sec=0, resample_hz=None):
+    """
+    Vectorized flow/milk curves for the teat documents of one milking task.
+
+    Every teat's samples are stacked into matrices, timestamps are seconds since the earliest teat
+    start spread evenly over each teat's [start, end], and each matrix is smoothed in one call with
+    ``kernel`` (see ``UTILS.smoothing``) over ``window_sec`` seconds at the curves' sample rate.
+    Curves may be lists or arrays (see ``DB.flow_codec.decode_document``), or pyramid levels from
+    ``DB.flow_pyramid.load_flow_levels`` (``factor``/``first_sample``/``n_samples``/``bands`` keys),
+    in which case the window shrinks with the level and the flow min/max band is kept.
+    Rows follow ``docs``; use ``teat_curves`` to get trimmed, ready-to-plot arrays. With ``resample_hz``
+    the teats are also put on a common time base under ``"aligned"`` (see ``align_teats``).
+    """
+    if not docs:
+        return None
+    # Teats without flow samples still count for the task's start
+    task_start = pd.to_datetime([unwrap_date(doc["start"]) for doc in docs]).min().to_datetime64()
+    docs = [doc for doc in docs if doc.get("flow_rate_data") is not None and len(doc["flow_rate_data"])]
+    if not docs:
+        return None
+
+    starts = pd.to_datetime([unwrap_date(doc["start"]) for doc in docs]).to_numpy()
+    ends = pd.to_datetime([unwrap_date(doc["end"]) for doc in docs]).to_numpy()
+    offsets = (starts - task_start) / np.timedelta64(1, "s")
+    durations = (ends - starts) / np.timedelta64(1, "s")
+    factor = docs[0].get("factor", 1)
+
+    timeline = {
+        "teat_id": [doc["teat_id"] for doc in docs],
+        "cow_id": docs[0].get("cow_id"),
+        "factor": factor,
+        "total_points": 0,
+    }
+    window = None
+    for field, name in (("flow_rate_data", "flow"), ("milk_quantity_data", "milk")):
+        values, lengths = stack_rows([[] if doc.get(field) is None else doc[field] for doc in docs])
+        totals = np.array([doc["n_samples"][field] if "n_samples" in doc else len(doc.get(field) or [])
+                           for doc in docs], dtype=np.int64)
+        firsts = np.array([doc.get("first_sample", {}).get(field, 0) for doc in docs], dtype=np.int64)
+        if window is None:
+            # One window for all teats, from the typical flow sample rate of this level
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rates = (totals - 1) / durations / factor
+            rates = rates[np.isfinite(rates) & (rates > 0)]
+            window = window_samples(window_sec, np.median(rates) if len(rates) else None)
+            timeline["window_samples"] = window
+        timeline[f"{name}_x"] = relative_times(offsets, durations, lengths, values.shape[1], totals, firsts, factor)
+        timeline[name] = smooth(values, kernel, window)
+        timeline[f"{name}_lengths"] = lengths
+        timeline["total_points"] += int(lengths.sum())
+
+    if all("flow_rate_data" in doc.get("bands", {}) for doc in docs):
+        timeline["flow_min"], _ = stack_rows([doc["bands"]["flow_rate_data"][0] for doc in docs])
+        timeline["flow_max"], _ = stack_rows([doc["bands"]["flow_rate_data"][1] for doc in docs])
+    if resample_hz:
+        timeline["aligned"] = align_teats(timeline, resample_hz)
+    return timeline
+
+
+def teat_curves(timeline):
+    """Yields ``(teat_id, flow_x, flow, milk_x, milk)`` per teat with the padding trimmed off."""
+    for i, teat in enumerate(timeline["teat_id"]):
+        n_flow = timeline["flow_lengths"][i]
+        n_milk = timeline["milk_lengths"][i]
+        yield (teat,
+               timeline["flow_x"][i, :n_flow], timeline["flow"][i, :n_flow],
+               timeline["milk_x"][i, :n_milk], timeline["milk"][i, :n_milk])
+
+
+def flow_bands(timeline):
+    """Yields ``(x, low, high)`` flow bands per teat for pyramid levels; nothing at full resolution."""
+    if "flow_min" not in timeline:
+        return
+    for i in range(len(timeline["teat_id"])):
+        n_flow = timeline["flow_lengths"][i]
+        yield timeline["flow_x"][i, :n_flow], timeline["flow_min"][i, :n_flow], timeline["flow_max"][i, :n_flow]
+
+
+def resample_to_grid(values, lengths, durations, grid):
+    """
+    Resamples every row of a stacked curve matrix onto a shared time grid (seconds since each row's start).
+
+    Row ``i`` is taken as ``lengths[i]`` evenly spaced samples over ``durations[i]`` seconds; the result is
+    ``np.interp`` of each row at ``grid``, done for all rows at once with one fractional-index gather.
+    Grid times past a row's end are NaN.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    durations = np.asarray(durations, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positions = grid[None, :] * ((lengths - 1) / durations)[:, None]
+    positions = np.where(np.isfinite(positions), positions, 0.0)
+    outside = positions > (lengths - 1)[:, None]
+
+    lower = np.clip(np.floor(positions).astype(np.int64), 0, np.maximum(lengths - 1, 0)[:, None])
+    upper = np.minimum(lower + 1, np.maximum(lengths - 1, 0)[:, None])
+    weight = positions - lower
+    if values.shape[1] == 0:
+        return np.full((len(lengths), len(grid)), np.nan)
+    rows = np.arange(len(lengths))[:, None]
+    resampled = values[rows, lower] * (1 - weight) + values[rows, upper] * weight
+    resampled[outside | (lengths == 0)[:, None]] = np.nan
+    return resampled
+
+
+def session_curves_on_grid(docs, grid_points, kernel="sma", window_sec=0, field="flow_rate_data"):
+    """
+    Smoothed ``field`` curves of many sessions on one common grid.
+
+    Returns ``(grid, matrix)`` with one row per document (NaN where a session has already ended),
+    or ``(None, None)`` when no document has samples.
+    """
+    docs = [doc for doc in docs if doc.get(field) is not None and len(doc[field]) > 1]
+    if not docs:
+        return None, None
+    starts = pd.to_datetime([unwrap_date(doc["start"]) for doc in docs]).to_numpy()
+    ends = pd.to_datetime([unwrap_date(doc["end"]) for doc in docs]).to_numpy()
+    durations = (ends - starts) / np.timedelta64(1, "s")
+
+    values, lengths = stack_rows([doc[field] for doc in docs])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = (lengths - 1) / durations
+    rates = rates[np.isfinite(rates) & (rates > 0)]
+    values = smooth(values, kernel, window_samples(window_sec, np.median(rates) if len(rates) else None))
+
+    valid = durations > 0
+    grid = np.linspace(0, durations[valid].max() if valid.any() else 0, grid_points)
+    return grid, resample_to_grid(values, lengths, durations, grid)
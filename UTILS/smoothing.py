@@ -0,0 +1,159 @@
+# smoothing.py
+# Smoothing kernels for stacked curves: every function takes a (rows, samples) float matrix,
+# NaN-padded at the end of shorter rows, and smooths all rows in one vectorized call.
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SMOOTHING_KERNELS = {
+    "sma": "Moving average",
+    "ewma": "Exponential moving average",
+    "median": "Moving median",
+    "savgol": "Savitzky–Golay",
+}
+
+# Columns per sliding-window block for the median (bounds the temporary window copies)
+MEDIAN_BLOCK = 4096
+
+
+def window_samples(window_sec, sample_rate_hz):
+    """A window in seconds as a sample count (at least 1)."""
+    if not window_sec or not sample_rate_hz or not np.isfinite(sample_rate_hz):
+        return 1
+    return max(1, int(round(window_sec * sample_rate_hz)))
+
+
+def row_window_samples(window_sec, sample_rates_hz):
+    """``window_samples`` for every row's own sample rate (1 where the rate is unknown)."""
+    rates = np.asarray(sample_rates_hz, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        windows = np.rint(window_sec * np.where(np.isfinite(rates), rates, 0.0))
+    return np.maximum(windows, 1).astype(np.int64)
+
+
+def fill_trailing(matrix):
+    """Copy of ``matrix`` with NaNs carried forward from the last valid value of each row."""
+    valid = ~np.isnan(matrix)
+    index = np.where(valid, np.arange(matrix.shape[1])[None, :], 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return np.take_along_axis(matrix, index, axis=1)
+
+
+def moving_average(matrix, window):
+    """
+    Trailing moving average in one cumulative-sum pass.
+
+    Matches ``Series.rolling(window, min_periods=1).mean()`` per row: NaNs (including the
+    padding of shorter rows) are skipped, and a window with no values yields NaN. ``window`` may
+    also be an array with one window per row.
+    """
+    window = np.maximum(np.asarray(window, dtype=np.int64), 1)
+    valid = ~np.isnan(matrix)
+    sums = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+    counts = np.zeros_like(sums)
+    np.cumsum(np.where(valid, matrix, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+
+    ends = np.arange(1, matrix.shape[1] + 1)
+    if window.ndim == 0:
+        starts = np.maximum(ends - window, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (sums[:, ends] - sums[:, starts]) / (counts[:, ends] - counts[:, starts])
+
+    starts = np.maximum(ends[None, :] - window[:, None], 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((sums[:, 1:] - np.take_along_axis(sums, starts, axis=1))
+                / (counts[:, 1:] - np.take_along_axis(counts, starts, axis=1)))
+
+
+def ewma(matrix, window):
+    """
+    Exponential moving average with span ``window`` (``ewm(span=window, adjust=False).mean()``).
+
+    The recursion is solved in closed form with a scaled cumulative sum, block by block so the
+    scale factors stay within float range; only the blocks are looped over, never the samples.
+    Like pandas, each row starts at its first valid value; positions before it stay NaN.
+    """
+    alpha = 2 / (max(1, int(window)) + 1)
+    decay = 1 - alpha
+    values = fill_trailing(matrix)
+    out = np.empty_like(values)
+    if values.shape[1] == 0:
+        return out
+    # Only leading NaNs are left after fill_trailing: hold them at the row's first valid value
+    first_valid = np.argmax(~np.isnan(values), axis=1)
+    seed = values[np.arange(values.shape[0]), first_valid]
+    values = np.where(np.isnan(values), seed[:, None], values)
+    if decay == 0:
+        out[:] = values
+        return out
+
+    # decay ** -block stays below 1e12
+    block = max(1, int(12 * np.log(10) / -np.log(decay)))
+    state = values[:, 0].copy()
+    for start in range(0, values.shape[1], block):
+        chunk = values[:, start:start + block]
+        powers = decay ** np.arange(1, chunk.shape[1] + 1)
+        weighted = np.cumsum(chunk / powers[None, :], axis=1) * alpha
+        out[:, start:start + chunk.shape[1]] = powers[None, :] * (state[:, None] + weighted)
+        state = out[:, start + chunk.shape[1] - 1]
+    out[np.isnan(matrix)] = np.nan
+    return out
+
+
+def moving_median(matrix, window):
+    """
+    Centered moving median over sliding-window views, selected with ``partition`` in column blocks.
+
+    The window is made odd; ends are extended with the edge values.
+    """
+    window = max(1, int(window))
+    window += 1 - window % 2
+    half = window // 2
+    padded = np.pad(fill_trailing(matrix), ((0, 0), (half, half)), mode="edge")
+    out = np.empty_like(matrix)
+    for start in range(0, matrix.shape[1], MEDIAN_BLOCK):
+        stop = min(start + MEDIAN_BLOCK, matrix.shape[1])
+        views = sliding_window_view(padded[:, start:stop + window - 1], window, axis=1)
+        out[:, start:stop] = np.partition(views, half, axis=2)[:, :, half]
+    out[np.isnan(matrix)] = np.nan
+    return out
+
+
+def savgol_coefficients(window, polyorder):
+    """Least-squares Savitzky–Golay smoothing weights for an odd, centered window."""
+    half = window // 2
+    positions = np.arange(-half, half + 1, dtype=np.float64)
+    design = np.vander(positions, polyorder + 1, increasing=True)
+    return np.linalg.pinv(design)[0]
+
+
+def savgol(matrix, window, polyorder=2):
+    """
+    Centered Savitzky–Golay filter (local polynomial fit of ``polyorder``).
+
+    Ends are extended with the edge values; the window is made odd and at least ``polyorder + 2``.
+    """
+    window = max(int(window), polyorder + 2)
+    window += 1 - window % 2
+    half = window // 2
+    values = fill_trailing(matrix)
+    padded = np.pad(values, ((0, 0), (half, half)), mode="edge")
+    out = np.zeros_like(values)
+    n = values.shape[1]
+    for k, weight in enumerate(savgol_coefficients(window, polyorder)):
+        out += weight * padded[:, k:k + n]
+    out[np.isnan(matrix)] = np.nan
+    return out
+
+
+def smooth(matrix, kernel="sma", window=1):
+    """Applies one of ``SMOOTHING_KERNELS`` with a window in samples."""
+    if matrix.size == 0 or window <= 1:
+        return matrix
+    if kernel == "ewma":
+        return ewma(matrix, window)
+    if kernel == "median":
+        return moving_median(matrix, window)
+    if kernel == "savgol":
+        return savgol(matrix, window)
+    return moving_average(matrix, window)
@@ -0,0 +1,53 @@
+# bench_flow_features.py
+# Times the batched per-session feature extraction and checks that a session's features do not depend
+# on the batch it is computed in (other sessions' lengths and sample rates).
+# Run from the repository root: python -m benchmarks.bench_flow_features
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from UTILS.flow_features import session_features
+
+
+def make_sessions(n_sessions):
+    rng = np.random.default_rng(0)
+    start = datetime(2025, 5, 1, 6, 0)
+    docs = []
+    for i in range(n_sessions):
+        rate = rng.choice([5, 10, 20])
+        duration = rng.uniform(120, 480)
+        n = int(duration * rate) + 1
+        t = np.linspace(0, 1, n)
+        # Ramp up, plateau, tail off
+        flow = np.clip(np.minimum(t * 8, 1) * np.minimum((1 - t) * 5, 1), 0, None) * rng.uniform(1, 3)
+        flow += rng.normal(0, 0.05, n)
+        docs.append({
+            "start": start + timedelta(hours=i),
+            "end": start + timedelta(hours=i, seconds=duration),
+            "flow_rate_data": flow.tolist(),
+            "milk_quantity_data": np.cumsum(np.clip(flow, 0, None) / rate).tolist(),
+        })
+    return docs
+
+
+def main():
+    docs = make_sessions(400)
+
+    # Same features alone or batched
+    batched = session_features(docs)
+    single = pd.concat([session_features([doc]) for doc in docs], ignore_index=True)
+    pd.testing.assert_frame_equal(batched, single)
+
+    print(f"{'batch':>6} {'sessions/s':>11}")
+    for batch_size in [1, 50, 400]:
+        started = time.perf_counter()
+        for i in range(0, len(docs), batch_size):
+            session_features(docs[i:i + batch_size])
+        elapsed = time.perf_counter() - started
+        print(f"{batch_size:>6} {len(docs) / elapsed:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench_flow_timeline.py
+# Compares the vectorized flow timeline engine with the previous per-sample list comprehension
+# and per-teat pandas rolling means of plot_flow_for_task.
+# Run from the repository root: python -m benchmarks.bench_flow_timeline
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from UTILS.flow_timeline import build_flow_timeline, teat_curves
+
+
+def make_task(n_samples, n_teats=4):
+    rng = np.random.default_rng(0)
+    start = datetime(2025, 5, 1, 6, 0)
+    docs = []
+    for teat in range(1, n_teats + 1):
+        teat_start = start + timedelta(seconds=int(rng.integers(0, 30)))
+        docs.append({
+            "teat_id": teat,
+            "cow_id": 7,
+            "start": teat_start,
+            "end": teat_start + timedelta(seconds=n_samples / 10),
+            "flow_rate_data": rng.random(n_samples).tolist(),
+            "milk_quantity_data": np.cumsum(rng.random(n_samples)).tolist(),
+        })
+    return docs
+
+
+def previous_curves(docs, rolling_window):
+    # The previous implementation, minus the figure
+    all_starts = [pd.to_datetime(doc["start"]["$date"] if isinstance(doc["start"], dict) else doc["start"])
+                  for doc in docs]
+    global_start = min(all_starts)
+    curves = []
+    for doc in docs:
+        flow_data = pd.Series(doc.get("flow_rate_data", []))
+        milk_data = pd.Series(doc.get("milk_quantity_data", []))
+        start = pd.to_datetime(doc["start"]["$date"] if isinstance(doc["start"], dict) else doc["start"])
+        end = pd.to_datetime(doc["end"]["$date"] if isinstance(doc["end"], dict) else doc["end"])
+        duration_sec = (end - start).total_seconds()
+        x_values = [
+            (start - global_start).total_seconds() + i * duration_sec / (len(flow_data) - 1)
+            for i in range(len(flow_data))
+        ]
+        smoothed_flow = flow_data.rolling(window=rolling_window, min_periods=1).mean()
+        smoothed_milk = milk_data.rolling(window=rolling_window, min_periods=1).mean()
+        curves.append((doc["teat_id"], x_values, smoothed_flow, smoothed_milk))
+    return curves
+
+
+def vectorized_curves(docs, rolling_window):
+    # make_task samples at 10 Hz, so the same window in seconds
+    return list(teat_curves(build_flow_timeline(docs, "sma", rolling_window / 10)))
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    window = 120
+    print(f"{'samples/teat':>13} {'previous (s)':>13} {'vectorized (s)':>15} {'speedup':>8}")
+    for n_samples in [10_000, 50_000, 200_000]:
+        docs = make_task(n_samples)
+
+        # Same curves either way
+        for old, new in zip(previous_curves(docs, window), vectorized_curves(docs, window)):
+            np.testing.assert_allclose(old[1], new[1])
+            np.testing.assert_allclose(old[2].to_numpy(), new[2])
+            np.testing.assert_allclose(old[3].to_numpy(), new[4])
+
+        previous_time = best_of(lambda: previous_curves(docs, window))
+        vectorized_time = best_of(lambda: vectorized_curves(docs, window))
+        print(f"{n_samples:>13} {previous_time:>13.3f} {vectorized_time:>15.3f} "
+              f"{previous_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# bench_graphing.py
+# Compares GraphingManager's lean go-trace builder with the previous Plotly Express path.
+# Run from the repository root: python -m benchmarks.bench_graphing
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from GUI.graphing import GraphingManager
+
+
+def make_frame(n_rows, n_groups):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "start": pd.date_range("2025-01-01", periods=n_rows, freq="s"),
+        "flow_rate": rng.random(n_rows),
+        "cow_id": rng.integers(0, n_groups, n_rows),
+    })
+
+
+def px_line(df, x_column, y_column, group_column):
+    # The previous implementation: string-convert X and the group on a copy, then px.line
+    df = df.copy()
+    df[x_column] = df[x_column].astype(str)
+    df[group_column] = df[group_column].astype(str)
+    return px.line(df, x=x_column, y=y_column, color=group_column, markers=True)
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    graph_mgr = GraphingManager()
+    print(f"{'rows':>10} {'groups':>7} {'px (s)':>9} {'lean (s)':>9} {'speedup':>8}")
+    for n_rows, n_groups in [(10_000, 5), (100_000, 20), (500_000, 50)]:
+        df = make_frame(n_rows, n_groups)
+        px_time = best_of(lambda: px_line(df, "start", "flow_rate", "cow_id"))
+        lean_time = best_of(lambda: graph_mgr.create_line_chart(df, "start", "flow_rate", categorical_x=True,
+                                                                group_column="cow_id"))
+        print(f"{n_rows:>10} {n_groups:>7} {px_time:>9.3f} {lean_time:>9.3f} {px_time / lean_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# bench_milking_anomalies.py
+# Times the anomaly scoring of a night's sessions against a month of per-cow/teat history, and checks
+# that the anomaly documents can be stored (BSON-encodable ids, dates and features).
+# Run from the repository root: python -m benchmarks.bench_milking_anomalies
+import time
+from datetime import datetime, timedelta
+
+import bson
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from DB.milking_anomalies import score_sessions
+
+
+def make_history(n_cows, days=30, milkings_per_day=2):
+    rng = np.random.default_rng(0)
+    rows = []
+    start = datetime(2025, 5, 1)
+    for cow in range(1, n_cows + 1):
+        for teat in range(1, 5):
+            for k in range(days * milkings_per_day):
+                rows.append({
+                    "source_id": ObjectId(),
+                    "task_id": cow * 10_000 + k,
+                    "cow_id": cow,
+                    "teat_id": teat,
+                    "start": start + timedelta(hours=24 / milkings_per_day * k),
+                    "peak_flow": 1 + rng.normal(0, 0.05),
+                    "total_yield": 3 + rng.normal(0, 0.1),
+                    "letdown_sec": 50 + rng.normal(0, 3),
+                    "max_drop_ratio": 0.1 + rng.normal(0, 0.02),
+                    "end_flow_ratio": 0.1 + rng.normal(0, 0.02),
+                })
+    history = pd.DataFrame(rows)
+    # A few kick-offs to be flagged
+    history.loc[history.sample(frac=0.001, random_state=0).index, "end_flow_ratio"] = 0.9
+    return history
+
+
+def main():
+    print(f"{'cows':>6} {'sessions':>9} {'new':>6} {'flagged':>8} {'scoring (s)':>12}")
+    for n_cows in [50, 200, 800]:
+        history = make_history(n_cows)
+        last_day = history["start"] >= history["start"].max() - timedelta(days=1)
+        new_ids = set(history.loc[last_day, "source_id"])
+
+        started = time.perf_counter()
+        anomalies = score_sessions(history, new_ids)
+        elapsed = time.perf_counter() - started
+
+        # Every document must survive the bulk_write encoding
+        for anomaly in anomalies:
+            bson.encode(anomaly)
+        print(f"{n_cows:>6} {len(history):>9} {len(new_ids):>6} {len(anomalies):>8} {elapsed:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()